@@ -1,28 +1,50 @@
 # backend/app/api/routes.py
 import os
-import uuid
-import shutil
+import json
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, File, UploadFile, Form, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 from app.core import config
+from app.core.cache import get_cache_stats
 from app.core.database import (
-    save_document, 
     get_document, 
     get_all_documents,
-    get_documents_by_ids
+    get_documents_by_ids,
+    get_job,
+    get_jobs,
+    JOB_STATUSES
 )
-from app.services.document_processing import process_document
-from app.services.query_engine import process_user_query
+from app.services.job_queue import submit_document, PRIORITY_BACKFILL, PRIORITY_UPLOAD, PRIORITY_INTERACTIVE
+from app.services.uploads import ALLOWED_TYPES, ingest_file, ingest_uploads
+from app.services.embedding_service import RETRIEVAL_MODES, RETRIEVAL_SCOPES
+from app.services.query_engine import process_user_query, iter_query_events
 
 router = APIRouter()
 
+# Blocking work (SQLite, vector stores, LLM calls, file copies) runs on this pool
+# so the event loop keeps serving other requests
+_request_executor = ThreadPoolExecutor(
+    max_workers=config.API_WORKER_THREADS,
+    thread_name_prefix="api-request"
+)
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking function on the request pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_request_executor, functools.partial(func, *args, **kwargs))
+
 # Request/Response Models
 class QueryRequest(BaseModel):
     question: str
     document_ids: Optional[List[int]] = None
+    mode: Optional[str] = None  # "vector", "lexical" or "hybrid"
+    scope: Optional[str] = None  # "per_document" or "global"
+    stream_tokens: bool = False  # /query/stream only: also send answer tokens
 
 class DocumentResponse(BaseModel):
     id: int
@@ -39,55 +61,67 @@ class DocumentResponse(BaseModel):
 # Routes
 @router.post("/documents/upload")
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
 ):
-    """Upload a document and start processing it"""
+    """Upload a document and start processing it (a file uploaded before returns the existing document)"""
     # Validate file type
-    allowed_types = [".pdf"]
     file_extension = os.path.splitext(file.filename)[1].lower()
     
-    if file_extension not in allowed_types:
+    if file_extension not in ALLOWED_TYPES:
         raise HTTPException(
             status_code=400,
-            detail=f"File type not supported. Allowed types: {', '.join(allowed_types)}"
+            detail=f"File type not supported. Allowed types: {', '.join(ALLOWED_TYPES)}"
         )
     
-    # Create unique filename
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(config.UPLOAD_DIR, unique_filename)
+    # Save the file while hashing it, and queue it for the processing workers if it is new
+    result = await run_blocking(ingest_file, file.file, file.filename, PRIORITY_UPLOAD)
+    if result["status"] == "error":
+        raise HTTPException(status_code=400, detail=result["detail"])
     
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Get file size
-    file_size = os.path.getsize(file_path)
-    
-    # Save document to database
-    doc_id = save_document(
-        filename=unique_filename,
-        original_filename=file.filename,
-        file_path=file_path,
-        file_type=file_extension,
-        file_size=file_size
-    )
+    return {
+        "id": result["id"],
+        "filename": file.filename,
+        "status": "processed" if result["is_processed"] else "processing",
+        "job_id": result.get("job_id"),
+        "duplicate": result["status"] == "duplicate"
+    }
+
+@router.post("/documents/upload/bulk")
+async def upload_documents_bulk(
+    files: List[UploadFile] = File(...),
+):
+    """
+    Upload several PDFs and/or ZIP archives of PDFs at once. Files whose
+    content was uploaded before are not processed again. Returns the outcome
+    of every file ("queued", "duplicate" or "error") and their counts, or
+    a 413 error without saving anything if there are more than
+    BULK_UPLOAD_MAX_FILES files.
+    """
+    try:
+        results = await run_blocking(
+            ingest_uploads,
+            [(file.filename, file.file) for file in files],
+            PRIORITY_BACKFILL
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    # Process document in background
-    background_tasks.add_task(process_document, doc_id)
+    summary = {status: 0 for status in ("queued", "duplicate", "error")}
+    for result in results:
+        summary[result["status"]] += 1
     
-    return {"id": doc_id, "filename": file.filename, "status": "processing"}
+    return {"results": results, "summary": summary}
 
 @router.get("/documents")
 async def get_documents():
     """Get all documents"""
-    documents = get_all_documents()
+    documents = await run_blocking(get_all_documents)
     return {"documents": documents}
 
 @router.get("/documents/{doc_id}")
 async def get_document_by_id(doc_id: int):
     """Get a document by ID"""
-    document = get_document(doc_id)
+    document = await run_blocking(get_document, doc_id)
     
     if not document:
         raise HTTPException(
@@ -97,30 +131,85 @@ async def get_document_by_id(doc_id: int):
     
     return document
 
-@router.post("/query")
-async def query_documents(query_request: QueryRequest):
-    """Query documents with a question"""
+def _validate_query_request(query_request: QueryRequest):
+    """Raise a 400 error for an empty question or unknown retrieval options"""
     if not query_request.question:
         raise HTTPException(
             status_code=400,
             detail="Question cannot be empty"
         )
     
+    if query_request.mode and query_request.mode not in RETRIEVAL_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown retrieval mode. Allowed modes: {', '.join(RETRIEVAL_MODES)}"
+        )
+    
+    if query_request.scope and query_request.scope not in RETRIEVAL_SCOPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown retrieval scope. Allowed scopes: {', '.join(RETRIEVAL_SCOPES)}"
+        )
+
+def _format_sse(event: str, data: Dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/query")
+async def query_documents(query_request: QueryRequest):
+    """Query documents with a question"""
+    _validate_query_request(query_request)
+    
     # Process the query
-    result = process_user_query(
+    result = await run_blocking(
+        process_user_query,
         question=query_request.question,
-        doc_ids=query_request.document_ids
+        doc_ids=query_request.document_ids,
+        mode=query_request.mode,
+        scope=query_request.scope
     )
     
     return result
 
+@router.post("/query/stream")
+async def query_documents_stream(query_request: QueryRequest):
+    """
+    Query documents with a question, streaming server-sent events:
+    retrieval, answer (one per document, as soon as it is ready), token
+    (if stream_tokens is set), themes and finally done
+    """
+    _validate_query_request(query_request)
+    
+    async def event_stream():
+        events = iter_query_events(
+            question=query_request.question,
+            doc_ids=query_request.document_ids,
+            mode=query_request.mode,
+            scope=query_request.scope,
+            stream_tokens=query_request.stream_tokens
+        )
+        try:
+            # Each step of the generator blocks, so advance it on the request pool
+            while True:
+                item = await run_blocking(next, events, None)
+                if item is None:
+                    break
+                event, data = item
+                yield _format_sse(event, data)
+        except Exception as e:
+            yield _format_sse("error", {"detail": str(e)})
+        yield _format_sse("done", {})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/documents/{doc_id}/process")
-async def reprocess_document(
-    doc_id: int,
-    background_tasks: BackgroundTasks
-):
+async def reprocess_document(doc_id: int):
     """Reprocess a document if needed"""
-    document = get_document(doc_id)
+    document = await run_blocking(get_document, doc_id)
     
     if not document:
         raise HTTPException(
@@ -128,10 +217,35 @@ async def reprocess_document(
             detail=f"Document with ID {doc_id} not found"
         )
     
-    # Start processing in background
-    background_tasks.add_task(process_document, doc_id)
+    # Queue ahead of uploads and backfills, someone is waiting for it
+    job_id = await run_blocking(submit_document, doc_id, PRIORITY_INTERACTIVE)
     
-    return {"id": doc_id, "status": "processing"}
+    return {"id": doc_id, "status": "processing", "job_id": job_id}
+
+@router.get("/jobs")
+async def list_jobs(doc_id: Optional[int] = None, status: Optional[str] = None, limit: int = 100):
+    """Most recent processing jobs, optionally of one document or in one status"""
+    if status and status not in JOB_STATUSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown job status. Allowed statuses: {', '.join(JOB_STATUSES)}"
+        )
+    
+    jobs = await run_blocking(get_jobs, doc_id=doc_id, status=status, limit=max(1, min(limit, 1000)))
+    return {"jobs": jobs}
+
+@router.get("/jobs/{job_id}")
+async def get_job_by_id(job_id: int):
+    """Get a processing job's status and progress (pages_done of pages_total)"""
+    job = await run_blocking(get_job, job_id)
+    
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job with ID {job_id} not found"
+        )
+    
+    return job
 
 @router.delete("/documents/{doc_id}")
 async def delete_document(doc_id: int):
@@ -149,4 +263,9 @@ async def delete_document(doc_id: int):
 @router.get("/status")
 async def check_status():
     """API status check"""
-    return {"status": "ok", "version": "1.0.0"}
\ No newline at end of file
+    return {"status": "ok", "version": "1.0.0"}
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss/eviction counters of the in-process caches"""
+    return {"caches": get_cache_stats()}
\ No newline at end of file
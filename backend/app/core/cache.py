@@ -0,0 +1,144 @@
+# backend/app/core/cache.py
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+# Every cache registers itself here so its counters can be exposed by the API
+_registry: List["LRUCache"] = []
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache bounded by entry count and, optionally,
+    by a total weight (e.g. number of chunks or bytes held by the entries).
+    Keeps hit/miss/eviction counters for sizing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        max_weight: Optional[int] = None,
+        weigher: Optional[Callable[[Any], int]] = None
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._weights: Dict[Hashable, int] = {}
+        self._total_weight = 0
+        self._lock = threading.RLock()
+        # Keys whose value is being built by get_or_create, set once the build is done
+        self._building: Dict[Hashable, threading.Event] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _registry.append(self)
+
+    def get(self, key: Hashable, default: Any = None, is_valid: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Get a cached value and mark it as recently used. An entry for which
+        is_valid(value) is false (e.g. expired) is dropped and counts as a miss.
+        """
+        with self._lock:
+            if key in self._entries and (is_valid is None or is_valid(self._entries[key])):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self._remove(key)
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        """Insert or replace a value, evicting least recently used entries if needed"""
+        weight = self.weigher(value) if self.weigher else 1
+        with self._lock:
+            self._insert(key, value, weight)
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Get a cached value, building and caching it with factory() on a miss.
+        factory() runs outside the cache lock, so other keys stay available
+        while it is slow; concurrent misses on the same key wait for one build.
+        A value built while its key was invalidated is returned but not cached.
+        """
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+                building = self._building.get(key)
+                if building is None:
+                    building = self._building[key] = threading.Event()
+                    self.misses += 1
+                    break
+            building.wait()
+
+        value = None
+        try:
+            value = factory()
+            return value
+        finally:
+            weight = self.weigher(value) if value is not None and self.weigher else 1
+            with self._lock:
+                if self._building.get(key) is building:
+                    del self._building[key]
+                    if value is not None:
+                        self._insert(key, value, weight)
+            building.set()
+
+    def invalidate(self, key: Hashable):
+        """Drop a single entry (and keep a build in progress from caching its value)"""
+        with self._lock:
+            self._remove(key)
+            self._building.pop(key, None)
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._building.clear()
+            self._entries.clear()
+            self._weights.clear()
+            self._total_weight = 0
+
+    def stats(self) -> Dict:
+        """Return size and hit/miss/eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "weight": self._total_weight,
+                "max_weight": self.max_weight,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def _insert(self, key: Hashable, value: Any, weight: int):
+        self._remove(key)
+        self._entries[key] = value
+        self._weights[key] = weight
+        self._total_weight += weight
+        self._evict()
+
+    def _remove(self, key: Hashable):
+        if key in self._entries:
+            del self._entries[key]
+            self._total_weight -= self._weights.pop(key)
+
+    def _evict(self):
+        # Always keep the most recent entry, even if it alone exceeds max_weight
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries
+            or (self.max_weight is not None and self._total_weight > self.max_weight)
+        ):
+            key, _ = self._entries.popitem(last=False)
+            self._total_weight -= self._weights.pop(key)
+            self.evictions += 1
+
+def get_cache_stats() -> Dict[str, Dict]:
+    """Return the counters of every registered cache, keyed by cache name"""
+    return {cache.name: cache.stats() for cache in _registry}
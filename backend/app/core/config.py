@@ -10,25 +10,194 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./docresearch.db")
 
 # Document storage
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./data/uploads")
+# Largest accepted file (also applies to each file inside a ZIP) and most files per bulk upload
+UPLOAD_MAX_FILE_MB = int(os.getenv("UPLOAD_MAX_FILE_MB", "200"))
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", "1000"))
 EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", "./data/embeddings")
 
+# Shared vector index holding the chunks of every document
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", os.path.join(EMBEDDING_DIR, "shared"))
+VECTOR_COLLECTION_NAME = "document_chunks"
+
+# Vector search backend: "chroma" (shared HNSW collection) or "numpy"
+# (exact search over memory-mapped per-document matrices next to page_data.json)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+NUMPY_INDEX_CACHE_SIZE = int(os.getenv("NUMPY_INDEX_CACHE_SIZE", "4096"))
+NUMPY_INDEX_CACHE_MAX_BYTES = int(os.getenv("NUMPY_INDEX_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# Compressed vectors for the numpy backend: "none", "int8" (scalar, 4x smaller)
+# or "pq" (product quantization, PQ_SUBVECTORS bytes per vector). The best
+# RERANK_FACTOR * k candidates are re-scored against the float32 vectors on disk
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "48"))
+PQ_TRAINING_SAMPLE = int(os.getenv("PQ_TRAINING_SAMPLE", "50000"))
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))
+
+# Cache of opened vector stores, the shared collection and legacy per-document
+# stores (bounded by store count and total chunk count)
+VECTOR_STORE_CACHE_SIZE = int(os.getenv("VECTOR_STORE_CACHE_SIZE", "32"))
+VECTOR_STORE_CACHE_MAX_CHUNKS = int(os.getenv("VECTOR_STORE_CACHE_MAX_CHUNKS", "500000"))
+
 # Google Generative AI settings
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 
 # OCR and text extraction settings
 OCR_DPI = 300
+OCR_RENDER_THREADS = int(os.getenv("OCR_RENDER_THREADS", str(min(4, os.cpu_count() or 1))))
+
+# Parallel extraction: PDFs with at least EXTRACTION_PARALLEL_MIN_PAGES pages are
+# split into ranges of EXTRACTION_PAGES_PER_TASK pages and extracted on
+# EXTRACTION_WORKERS processes (1 = serial, 0 = the CPU cores divided by the
+# number of documents processed at once by the job workers). Each worker may
+# grow by at most EXTRACTION_WORKER_MEMORY_MB (0 = no cap) and is replaced after
+# EXTRACTION_MAX_TASKS_PER_CHILD ranges
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "0"))
+EXTRACTION_PARALLEL_MIN_PAGES = int(os.getenv("EXTRACTION_PARALLEL_MIN_PAGES", "8"))
+EXTRACTION_PAGES_PER_TASK = int(os.getenv("EXTRACTION_PAGES_PER_TASK", "4"))
+EXTRACTION_WORKER_MEMORY_MB = int(os.getenv("EXTRACTION_WORKER_MEMORY_MB", "2048"))
+EXTRACTION_MAX_TASKS_PER_CHILD = int(os.getenv("EXTRACTION_MAX_TASKS_PER_CHILD", "25"))
+# Scanned pages are rendered in runs of up to OCR_RENDER_BATCH_PAGES consecutive
+# pages per poppler call, on OCR_RENDER_THREADS poppler processes when
+# extracting in the API process. A run never crosses an extraction range, so by
+# default each range's consecutive scanned pages are rendered in one call
+OCR_RENDER_BATCH_PAGES = int(os.getenv("OCR_RENDER_BATCH_PAGES", str(EXTRACTION_PAGES_PER_TASK)))
 
 # Vector DB settings
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 TOP_K_RESULTS = 5
 
+# Retrieval mode: "vector", "lexical" (SQLite FTS5/BM25, no embedding call)
+# or "hybrid" (both, merged with reciprocal rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+RRF_K = 60
+
+# Retrieval scope: "per_document" (TOP_K_RESULTS chunks from every document) or
+# "global" (best chunks across all documents, at most TOP_K_RESULTS per document).
+# per_document makes one lookup per index (vector and/or lexical) for all
+# documents, returning the best TOP_K_RESULTS of each. Chroma cannot group by
+# document, so it over-fetches at least PER_DOCUMENT_CANDIDATES chunks and splits them
+RETRIEVAL_SCOPE = os.getenv("RETRIEVAL_SCOPE", "per_document")
+PER_DOCUMENT_CANDIDATES = int(os.getenv("PER_DOCUMENT_CANDIDATES", "200"))
+GLOBAL_TOP_K = int(os.getenv("GLOBAL_TOP_K", "20"))
+GLOBAL_CANDIDATES = int(os.getenv("GLOBAL_CANDIDATES", "100"))
+MIN_RELEVANCE_SCORE = float(os.getenv("MIN_RELEVANCE_SCORE", "0.5"))  # cosine similarity
+MAX_DOCUMENTS = int(os.getenv("MAX_DOCUMENTS", "5"))
+
+# MMR reranking (per_document scope, vector and hybrid modes): fetch MMR_FETCH_K
+# candidates per document and keep TOP_K_RESULTS that balance relevance against
+# redundancy (MMR_LAMBDA = 1 is pure relevance, 0 pure diversity)
+MMR_ENABLED = os.getenv("MMR_ENABLED", "false").lower() == "true"
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "20"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+# Document routing: the vector search of a query without document IDs only covers
+# the ROUTING_TOP_DOCUMENTS documents closest to it (0 = off, search every document;
+# the lexical search of hybrid mode always covers every document).
+# Each document is represented by its chunk centroid plus ROUTING_CLUSTERS_PER_DOCUMENT
+# k-means centroids
+ROUTING_TOP_DOCUMENTS = int(os.getenv("ROUTING_TOP_DOCUMENTS", "0"))
+ROUTING_CLUSTERS_PER_DOCUMENT = int(os.getenv("ROUTING_CLUSTERS_PER_DOCUMENT", "4"))
+
+# Embedding pipeline settings
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MIN_BATCH_SIZE = int(os.getenv("EMBEDDING_MIN_BATCH_SIZE", "8"))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "256"))
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", "4"))
+EMBEDDING_TARGET_BATCH_SECONDS = float(os.getenv("EMBEDDING_TARGET_BATCH_SECONDS", "2.0"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+EMBEDDING_RETRY_BACKOFF = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "1.0"))  # seconds, doubled per retry
+
+# Streaming ingestion: pages flow extract -> chunk -> embed -> index through
+# bounded queues. INGEST_PAGE_QUEUE_SIZE pages wait between extraction and
+# chunking, chunks move on in batches of INGEST_CHUNK_BATCH_SIZE with at most
+# INGEST_BATCH_QUEUE_SIZE batches waiting in front of each later stage
+INGEST_PAGE_QUEUE_SIZE = int(os.getenv("INGEST_PAGE_QUEUE_SIZE", "16"))
+INGEST_CHUNK_BATCH_SIZE = int(os.getenv("INGEST_CHUNK_BATCH_SIZE", "256"))
+INGEST_BATCH_QUEUE_SIZE = int(os.getenv("INGEST_BATCH_QUEUE_SIZE", "2"))
+
+# Processing job queue: JOB_WORKERS documents are processed at a time by the API
+# process (0 = only queue jobs, run `python -m app.services.job_queue` instead).
+# Failed jobs are retried up to JOB_MAX_ATTEMPTS times, waiting JOB_RETRY_BACKOFF
+# seconds doubled per attempt. Running jobs send a heartbeat every
+# JOB_HEARTBEAT_SECONDS and are queued again once it is JOB_STALE_SECONDS old
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "30"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+
+# Model provider: "live" (Gemini, embeddings per EMBEDDING_BACKEND), "stub"
+# (deterministic local stand-in), "record" (live, saving every response to
+# RECORDINGS_DIR) or "replay" (recorded responses only, no network calls)
+MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "live")
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", "./data/recordings")
+REPLAY_WITH_LATENCY = os.getenv("REPLAY_WITH_LATENCY", "false").lower() == "true"
+STUB_LLM_LATENCY = float(os.getenv("STUB_LLM_LATENCY", "0"))  # seconds per call
+STUB_EMBEDDING_LATENCY = float(os.getenv("STUB_EMBEDDING_LATENCY", "0"))  # seconds per call
+STUB_EMBEDDING_DIM = int(os.getenv("STUB_EMBEDDING_DIM", "768"))
+
 # Model settings
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")  # "gemini" or "onnx"
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+GOOGLE_EMBEDDING_MODEL = "models/embedding-001"
+
+# Local ONNX embedding settings (EMBEDDING_BACKEND=onnx)
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", f"./data/models/{EMBEDDING_MODEL}")
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+# Intra-op threads of the ONNX session per run. Up to EMBEDDING_MAX_IN_FLIGHT batches
+# run on the session at once, so by default they share the cores instead of each
+# starting a thread per core
+ONNX_NUM_THREADS = int(os.getenv(
+    "ONNX_NUM_THREADS",
+    str(max(1, (os.cpu_count() or 1) // max(1, EMBEDDING_MAX_IN_FLIGHT)))
+))
+ONNX_MAX_SEQ_LENGTH = int(os.getenv("ONNX_MAX_SEQ_LENGTH", "256"))
 LLM_MODEL = "gemini-1.5-flash"
 LLM_TEMPERATURE = 0.3
 
+# Threads for the blocking part of API requests (database, retrieval, LLM calls)
+API_WORKER_THREADS = int(os.getenv("API_WORKER_THREADS", "16"))
+
+# Per-document answers run concurrently on a shared pool of LLM_MAX_CONCURRENCY
+# threads; a document whose answer takes longer than LLM_ANSWER_TIMEOUT seconds
+# gets an error response instead of holding up the others
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_ANSWER_TIMEOUT = float(os.getenv("LLM_ANSWER_TIMEOUT", "60"))
+
+# Answer mode: "per_document" (one LLM call per document) or "packed" (several
+# documents per call, up to ANSWER_PACKING_TOKEN_BUDGET tokens of context)
+ANSWER_MODE = os.getenv("ANSWER_MODE", "per_document")
+ANSWER_PACKING_TOKEN_BUDGET = int(os.getenv("ANSWER_PACKING_TOKEN_BUDGET", "8000"))
+
+# Answer context: overlapping chunks are merged, passages whose word sets have a
+# Jaccard similarity >= CONTEXT_DUPLICATE_THRESHOLD with a better one are dropped,
+# and the best passages are kept up to ANSWER_CONTEXT_TOKEN_BUDGET tokens per document
+ANSWER_CONTEXT_TOKEN_BUDGET = int(os.getenv("ANSWER_CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+
+# Query embedding cache (in-memory LRU in front of a table in the SQLite database)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ROWS", "50000"))
+QUERY_EMBEDDING_CACHE_TTL = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL", str(30 * 24 * 3600)))  # seconds
+
+# Themes: "llm" (one LLM call reading every answer) or "cluster" (k-means over the
+# stored vectors of the retrieved chunks, built while the answers are generated).
+# Clusters are named by keywords, or by one short LLM call with THEME_CLUSTER_LABELS=llm
+THEME_MODE = os.getenv("THEME_MODE", "llm")
+THEME_CLUSTER_LABELS = os.getenv("THEME_CLUSTER_LABELS", "keywords")
+THEME_MAX_CLUSTERS = int(os.getenv("THEME_MAX_CLUSTERS", "5"))
+THEME_MIN_SILHOUETTE = float(os.getenv("THEME_MIN_SILHOUETTE", "0.08"))
+
+# Cache of per-document answers and theme results in the SQLite database, keyed
+# by question, retrieved chunks, model settings and prompt version
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ROWS = int(os.getenv("ANSWER_CACHE_MAX_ROWS", "20000"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+
 # Ensure directories exist
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(EMBEDDING_DIR, exist_ok=True)
+os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
 os.makedirs(os.path.dirname(DATABASE_URL.replace("sqlite:///", "")), exist_ok=True)
\ No newline at end of file
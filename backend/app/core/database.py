@@ -1,8 +1,9 @@
 # backend/app/core/database.py
 import sqlite3
 import json
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Set, Tuple
 import os
+import time
 from app.core import config
 
 def dict_factory(cursor, row):
@@ -40,6 +41,28 @@ def init_db():
     )
     ''')
     
+    # SHA-256 of the file, added to databases created before uploads were deduplicated
+    columns = {row["name"] for row in cursor.execute("PRAGMA table_info(documents)").fetchall()}
+    if "content_hash" not in columns:
+        cursor.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT")
+    # One document per file content, also across processes. Documents uploaded
+    # twice before that keep their hash with ":<id>" appended, see update_document_hash
+    unique_index = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_documents_content_hash_unique'"
+    ).fetchone()
+    if not unique_index:
+        cursor.execute("DROP INDEX IF EXISTS idx_documents_content_hash")
+        cursor.execute('''
+        UPDATE documents SET content_hash = content_hash || ':' || id
+        WHERE content_hash IS NOT NULL AND id != (
+            SELECT d.id FROM documents d WHERE d.content_hash = documents.content_hash
+            ORDER BY d.is_processed DESC, d.id LIMIT 1
+        )
+        ''')
+        cursor.execute('''
+        CREATE UNIQUE INDEX idx_documents_content_hash_unique ON documents (content_hash)
+        ''')
+    
     # Create a trigger to update the updated_at timestamp
     cursor.execute('''
     CREATE TRIGGER IF NOT EXISTS update_documents_timestamp
@@ -50,6 +73,123 @@ def init_db():
     END;
     ''')
     
+    # Create query embedding cache table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS query_embedding_cache (
+        cache_key TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        embedding BLOB NOT NULL,
+        created_at REAL NOT NULL,
+        last_used_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_query_embedding_cache_last_used
+    ON query_embedding_cache (last_used_at)
+    ''')
+    
+    # Create LLM answer cache tables; answer_cache_documents links every entry to
+    # the documents it was generated from, so reprocessing a document drops them
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS answer_cache (
+        cache_key TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        value TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        last_used_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_answer_cache_last_used ON answer_cache (last_used_at)
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS answer_cache_documents (
+        cache_key TEXT NOT NULL,
+        doc_id INTEGER NOT NULL,
+        PRIMARY KEY (cache_key, doc_id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_answer_cache_documents_doc_id ON answer_cache_documents (doc_id)
+    ''')
+    
+    # Deleting a document row also drops its cached answers
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS documents_ad_answer_cache AFTER DELETE ON documents
+    BEGIN
+        DELETE FROM answer_cache WHERE cache_key IN (
+            SELECT cache_key FROM answer_cache_documents WHERE doc_id = old.id
+        );
+        DELETE FROM answer_cache_documents WHERE doc_id = old.id;
+    END;
+    ''')
+    
+    # Create chunk table with an external-content FTS5 index for lexical search
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS document_chunks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chunk_id TEXT NOT NULL UNIQUE,
+        doc_id INTEGER NOT NULL,
+        page INTEGER NOT NULL,
+        paragraph INTEGER NOT NULL,
+        content_hash TEXT NOT NULL,
+        text TEXT NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_document_chunks_doc_id ON document_chunks (doc_id)
+    ''')
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS document_chunks_fts USING fts5(
+        text,
+        content='document_chunks',
+        content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    ''')
+    
+    # Keep the FTS index in step with the chunk table
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS document_chunks_ai AFTER INSERT ON document_chunks
+    BEGIN
+        INSERT INTO document_chunks_fts (rowid, text) VALUES (new.id, new.text);
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS document_chunks_ad AFTER DELETE ON document_chunks
+    BEGIN
+        INSERT INTO document_chunks_fts (document_chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END;
+    ''')
+    
+    # Create document processing job queue; higher priority runs first, retries
+    # wait until run_after and running jobs keep heartbeat_at fresh
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS processing_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doc_id INTEGER NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        run_after REAL NOT NULL,
+        pages_done INTEGER NOT NULL DEFAULT 0,
+        pages_total INTEGER,
+        error TEXT,
+        worker TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        heartbeat_at REAL,
+        finished_at REAL
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_processing_jobs_queue ON processing_jobs (status, priority, run_after)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_processing_jobs_doc_id ON processing_jobs (doc_id)
+    ''')
+    
     conn.commit()
     conn.close()
 
@@ -59,16 +199,20 @@ def save_document(
     original_filename: str, 
     file_path: str, 
     file_type: str, 
-    file_size: int
+    file_size: int,
+    content_hash: Optional[str] = None
 ) -> int:
-    """Save document metadata to database and return the document ID"""
+    """
+    Save document metadata to database and return the document ID.
+    Raises sqlite3.IntegrityError if a document with content_hash exists.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
-    INSERT INTO documents (filename, original_filename, file_path, file_type, file_size)
-    VALUES (?, ?, ?, ?, ?)
-    ''', (filename, original_filename, file_path, file_type, file_size))
+    INSERT INTO documents (filename, original_filename, file_path, file_type, file_size, content_hash)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', (filename, original_filename, file_path, file_type, file_size, content_hash))
     
     doc_id = cursor.lastrowid
     conn.commit()
@@ -77,15 +221,13 @@ def save_document(
     return doc_id
 
 def update_document_status(doc_id: int, is_processed: bool, page_count: Optional[int] = None, error: Optional[str] = None):
-    """Update document processing status"""
+    """Update document processing status; a previous error is cleared unless error is given"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    update_values = {"is_processed": is_processed}
+    update_values = {"is_processed": is_processed, "processing_error": error}
     if page_count is not None:
         update_values["page_count"] = page_count
-    if error is not None:
-        update_values["processing_error"] = error
     
     set_clause = ", ".join([f"{k} = ?" for k in update_values.keys()])
     values = list(update_values.values())
@@ -109,6 +251,24 @@ def update_document_embedding(doc_id: int, embedding_path: str):
     conn.commit()
     conn.close()
 
+def update_document_metadata(doc_id: int, updates: Dict[str, Any]):
+    """Merge keys into the document's JSON metadata"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT metadata FROM documents WHERE id = ?", (doc_id,))
+    row = cursor.fetchone()
+    metadata = json.loads(row["metadata"]) if row and row["metadata"] else {}
+    metadata.update(updates)
+    
+    cursor.execute(
+        "UPDATE documents SET metadata = ? WHERE id = ?",
+        (json.dumps(metadata), doc_id)
+    )
+    
+    conn.commit()
+    conn.close()
+
 def get_document(doc_id: int) -> Optional[Dict]:
     """Get document by ID"""
     conn = get_db_connection()
@@ -131,6 +291,45 @@ def get_all_documents() -> List[Dict]:
     conn.close()
     return documents
 
+def get_document_by_hash(content_hash: str) -> Optional[Dict]:
+    """Get the document with this file hash"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT * FROM documents WHERE content_hash = ?", (content_hash,))
+    document = cursor.fetchone()
+    
+    conn.close()
+    return document
+
+def get_documents_without_hash() -> List[Dict]:
+    """Documents saved before file hashes were recorded"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT id, file_path FROM documents WHERE content_hash IS NULL ORDER BY id")
+    documents = cursor.fetchall()
+    
+    conn.close()
+    return documents
+
+def update_document_hash(doc_id: int, content_hash: str):
+    """
+    Record a document's file hash. If another document has the same content
+    (uploaded twice before uploads were deduplicated), the hash is stored with
+    ":<id>" appended, so it stays unique and is not hashed again.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("UPDATE documents SET content_hash = ? WHERE id = ?", (content_hash, doc_id))
+    except sqlite3.IntegrityError:
+        cursor.execute("UPDATE documents SET content_hash = ? WHERE id = ?", (f"{content_hash}:{doc_id}", doc_id))
+    
+    conn.commit()
+    conn.close()
+
 def get_documents_by_ids(doc_ids: List[int]) -> List[Dict]:
     """Get documents by IDs"""
     if not doc_ids:
@@ -146,5 +345,476 @@ def get_documents_by_ids(doc_ids: List[int]) -> List[Dict]:
     conn.close()
     return documents
 
+# Query embedding cache functions
+def get_cached_query_embedding(cache_key: str, min_created_at: float) -> Optional[Dict]:
+    """Get a cached query embedding that is newer than min_created_at: {"embedding", "created_at"}"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "SELECT embedding, created_at FROM query_embedding_cache WHERE cache_key = ? AND created_at >= ?",
+        (cache_key, min_created_at)
+    )
+    row = cursor.fetchone()
+    
+    if row:
+        cursor.execute(
+            "UPDATE query_embedding_cache SET last_used_at = ? WHERE cache_key = ?",
+            (time.time(), cache_key)
+        )
+        conn.commit()
+    
+    conn.close()
+    return row
+
+def save_query_embedding(cache_key: str, model: str, embedding: bytes, min_created_at: float, max_rows: int):
+    """Save a query embedding, then drop expired rows and the least recently used rows over max_rows"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = time.time()
+    
+    cursor.execute('''
+    INSERT OR REPLACE INTO query_embedding_cache (cache_key, model, embedding, created_at, last_used_at)
+    VALUES (?, ?, ?, ?, ?)
+    ''', (cache_key, model, embedding, now, now))
+    
+    cursor.execute("DELETE FROM query_embedding_cache WHERE created_at < ?", (min_created_at,))
+    cursor.execute('''
+    DELETE FROM query_embedding_cache WHERE cache_key IN (
+        SELECT cache_key FROM query_embedding_cache
+        ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+    )
+    ''', (max_rows,))
+    
+    conn.commit()
+    conn.close()
+
+# Answer cache functions
+def get_cached_answer(cache_key: str, min_created_at: float) -> Optional[str]:
+    """Get a cached LLM result (JSON text) that is newer than min_created_at"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "SELECT value FROM answer_cache WHERE cache_key = ? AND created_at >= ?",
+        (cache_key, min_created_at)
+    )
+    row = cursor.fetchone()
+    
+    if row:
+        cursor.execute(
+            "UPDATE answer_cache SET last_used_at = ? WHERE cache_key = ?",
+            (time.time(), cache_key)
+        )
+        conn.commit()
+    
+    conn.close()
+    return row["value"] if row else None
+
+def save_cached_answer(
+    cache_key: str,
+    kind: str,
+    value: str,
+    doc_ids: List[int],
+    min_created_at: float,
+    max_rows: int
+):
+    """
+    Save an LLM result linked to the documents it was generated from, then drop
+    expired rows and the least recently used rows over max_rows
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = time.time()
+    
+    cursor.execute('''
+    INSERT OR REPLACE INTO answer_cache (cache_key, kind, value, created_at, last_used_at)
+    VALUES (?, ?, ?, ?, ?)
+    ''', (cache_key, kind, value, now, now))
+    cursor.executemany(
+        "INSERT OR IGNORE INTO answer_cache_documents (cache_key, doc_id) VALUES (?, ?)",
+        [(cache_key, doc_id) for doc_id in set(doc_ids)]
+    )
+    
+    cursor.execute("DELETE FROM answer_cache WHERE created_at < ?", (min_created_at,))
+    pruned = cursor.rowcount
+    cursor.execute('''
+    DELETE FROM answer_cache WHERE cache_key IN (
+        SELECT cache_key FROM answer_cache
+        ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+    )
+    ''', (max_rows,))
+    pruned += cursor.rowcount
+    if pruned:
+        cursor.execute('''
+        DELETE FROM answer_cache_documents
+        WHERE cache_key NOT IN (SELECT cache_key FROM answer_cache)
+        ''')
+    
+    conn.commit()
+    conn.close()
+
+def invalidate_cached_answers(doc_id: int) -> int:
+    """Drop every cached answer and theme result involving a document, returns the number dropped"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    DELETE FROM answer_cache WHERE cache_key IN (
+        SELECT cache_key FROM answer_cache_documents WHERE doc_id = ?
+    )
+    ''', (doc_id,))
+    removed = cursor.rowcount
+    cursor.execute("DELETE FROM answer_cache_documents WHERE doc_id = ?", (doc_id,))
+    
+    conn.commit()
+    conn.close()
+    return removed
+
+# Lexical chunk index functions
+def sync_document_chunks(doc_id: int, chunks: List[Dict]) -> Tuple[int, int]:
+    """
+    Incrementally sync a document's chunks into the lexical index.
+    Each chunk dict needs chunk_id, page, paragraph, content_hash and text.
+    
+    Returns (added, removed) counts
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT chunk_id FROM document_chunks WHERE doc_id = ?", (doc_id,))
+    existing_ids = {row["chunk_id"] for row in cursor.fetchall()}
+    new_ids = {chunk["chunk_id"] for chunk in chunks}
+    
+    stale_ids = [(chunk_id,) for chunk_id in existing_ids - new_ids]
+    added = [
+        (chunk["chunk_id"], doc_id, chunk["page"], chunk["paragraph"], chunk["content_hash"], chunk["text"])
+        for chunk in chunks if chunk["chunk_id"] not in existing_ids
+    ]
+    
+    cursor.executemany("DELETE FROM document_chunks WHERE chunk_id = ?", stale_ids)
+    cursor.executemany('''
+    INSERT OR IGNORE INTO document_chunks (chunk_id, doc_id, page, paragraph, content_hash, text)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', added)
+    
+    conn.commit()
+    conn.close()
+    
+    return len(added), len(stale_ids)
+
+def add_document_chunks(doc_id: int, chunks: List[Dict]) -> int:
+    """
+    Add a batch of a document's chunks to the lexical index, skipping chunk IDs
+    that are already indexed. Chunk dicts are as in sync_document_chunks.
+    
+    Returns the number of chunks added
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.executemany('''
+    INSERT OR IGNORE INTO document_chunks (chunk_id, doc_id, page, paragraph, content_hash, text)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', [
+        (chunk["chunk_id"], doc_id, chunk["page"], chunk["paragraph"], chunk["content_hash"], chunk["text"])
+        for chunk in chunks
+    ])
+    # rowcount sums the rows inserted by each statement (not the FTS trigger rows)
+    added = max(cursor.rowcount, 0)
+    
+    conn.commit()
+    conn.close()
+    
+    return added
+
+def remove_stale_document_chunks(doc_id: int, keep_ids: Set[str]) -> int:
+    """
+    Remove a document's chunks whose IDs are not in keep_ids from the lexical index.
+    
+    Returns the number of chunks removed
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT chunk_id FROM document_chunks WHERE doc_id = ?", (doc_id,))
+    stale_ids = [(row["chunk_id"],) for row in cursor.fetchall() if row["chunk_id"] not in keep_ids]
+    cursor.executemany("DELETE FROM document_chunks WHERE chunk_id = ?", stale_ids)
+    
+    conn.commit()
+    conn.close()
+    
+    return len(stale_ids)
+
+def search_document_chunks(
+    match_query: str,
+    doc_ids: Optional[List[int]],
+    limit: int,
+    per_doc: Optional[int] = None
+) -> List[Dict]:
+    """
+    Full-text search over chunk text, best BM25 match first.
+    match_query is an FTS5 MATCH expression; doc_ids restricts the search if
+    given and per_doc keeps only the best per_doc matches of each document.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    doc_clause = ""
+    params: List[Any] = [match_query]
+    if doc_ids:
+        doc_clause = f"AND c.doc_id IN ({','.join(['?'] * len(doc_ids))})"
+        params.extend(doc_ids)
+    per_doc_clause = ""
+    if per_doc is not None:
+        per_doc_clause = "WHERE doc_rank <= ?"
+        params.append(per_doc)
+    params.append(limit)
+    
+    cursor.execute(f'''
+    WITH matches AS (
+        SELECT c.chunk_id, c.doc_id, c.page, c.paragraph, c.content_hash, c.text,
+               bm25(document_chunks_fts) AS rank
+        FROM document_chunks_fts
+        JOIN document_chunks c ON c.id = document_chunks_fts.rowid
+        WHERE document_chunks_fts MATCH ? {doc_clause}
+    )
+    SELECT * FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY doc_id ORDER BY rank) AS doc_rank FROM matches
+    )
+    {per_doc_clause}
+    ORDER BY rank
+    LIMIT ?
+    ''', params)
+    rows = cursor.fetchall()
+    
+    conn.close()
+    return rows
+
+# Processing job functions
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+def enqueue_job(doc_id: int, priority: int, max_attempts: int) -> int:
+    """
+    Queue a processing job for a document and return its ID. If the document
+    already has a queued job, that job is reused and its priority raised.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = time.time()
+    
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute(
+        "SELECT id FROM processing_jobs WHERE doc_id = ? AND status = 'queued' ORDER BY id LIMIT 1",
+        (doc_id,)
+    )
+    row = cursor.fetchone()
+    if row:
+        job_id = row["id"]
+        cursor.execute(
+            "UPDATE processing_jobs SET priority = MAX(priority, ?), run_after = MIN(run_after, ?) WHERE id = ?",
+            (priority, now, job_id)
+        )
+    else:
+        cursor.execute('''
+        INSERT INTO processing_jobs (doc_id, priority, max_attempts, run_after, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (doc_id, priority, max_attempts, now, now))
+        job_id = cursor.lastrowid
+    
+    conn.commit()
+    conn.close()
+    
+    return job_id
+
+def claim_next_job(worker: str) -> Optional[Dict]:
+    """
+    Atomically mark the next due job as running and return it (None if no job
+    is due). Highest priority first, then oldest; documents that already have a
+    running job are skipped.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = time.time()
+    
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute('''
+    SELECT * FROM processing_jobs
+    WHERE status = 'queued' AND run_after <= ?
+      AND doc_id NOT IN (SELECT doc_id FROM processing_jobs WHERE status = 'running')
+    ORDER BY priority DESC, id
+    LIMIT 1
+    ''', (now,))
+    job = cursor.fetchone()
+    if job:
+        cursor.execute('''
+        UPDATE processing_jobs
+        SET status = 'running', attempts = attempts + 1, worker = ?, started_at = ?, heartbeat_at = ?,
+            pages_done = 0, error = NULL
+        WHERE id = ?
+        ''', (worker, now, now, job["id"]))
+        job = {**job, "status": "running", "attempts": job["attempts"] + 1, "worker": worker,
+               "started_at": now, "heartbeat_at": now, "pages_done": 0, "error": None}
+        # The document is being processed again, its last error no longer applies
+        cursor.execute("UPDATE documents SET processing_error = NULL WHERE id = ?", (job["doc_id"],))
+    
+    conn.commit()
+    conn.close()
+    
+    return job
+
+def update_job_progress(job_id: int, pages_done: int, pages_total: Optional[int]):
+    """Record the pages processed so far (also refreshes the heartbeat)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "UPDATE processing_jobs SET pages_done = ?, pages_total = ?, heartbeat_at = ? WHERE id = ?",
+        (pages_done, pages_total, time.time(), job_id)
+    )
+    
+    conn.commit()
+    conn.close()
+
+def touch_jobs(job_ids: List[int]):
+    """Refresh the heartbeat of running jobs"""
+    if not job_ids:
+        return
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    placeholders = ",".join(["?"] * len(job_ids))
+    cursor.execute(
+        f"UPDATE processing_jobs SET heartbeat_at = ? WHERE status = 'running' AND id IN ({placeholders})",
+        [time.time(), *job_ids]
+    )
+    
+    conn.commit()
+    conn.close()
+
+def finish_job(job_id: int, error: Optional[str] = None, retry_delay: Optional[float] = None):
+    """
+    Mark a running job as done, or as failed with error. A failed job with
+    attempts left is queued again after retry_delay seconds.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = time.time()
+    
+    if error is None:
+        cursor.execute(
+            "UPDATE processing_jobs SET status = 'done', error = NULL, finished_at = ? WHERE id = ?",
+            (now, job_id)
+        )
+    elif retry_delay is not None:
+        cursor.execute('''
+        UPDATE processing_jobs
+        SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+            run_after = ?, error = ?,
+            finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END
+        WHERE id = ?
+        ''', (now + retry_delay, error, now, job_id))
+        # While a retry is pending the error is kept on the job only, so the
+        # document shows as processing rather than failed
+        cursor.execute('''
+        UPDATE documents SET processing_error = NULL
+        WHERE id = (SELECT doc_id FROM processing_jobs WHERE id = ? AND status = 'queued')
+        ''', (job_id,))
+    else:
+        cursor.execute(
+            "UPDATE processing_jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+            (error, now, job_id)
+        )
+    
+    conn.commit()
+    conn.close()
+
+STALE_JOB_ERROR = "The worker processing this document stopped (killed, out of memory or restarted)"
+
+def requeue_stale_jobs(stale_before: float) -> int:
+    """
+    Queue running jobs again whose worker stopped sending heartbeats before
+    stale_before (the process was killed or restarted). Jobs that used up their
+    attempts fail instead, with the error recorded on the document, so a
+    document that keeps killing its worker is not claimed forever.
+    Returns the number of jobs queued again.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = time.time()
+    stale = "status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)"
+    
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute(f'''
+    UPDATE documents SET processing_error = ?
+    WHERE id IN (SELECT doc_id FROM processing_jobs WHERE {stale} AND attempts >= max_attempts)
+    ''', (STALE_JOB_ERROR, stale_before))
+    cursor.execute(f'''
+    UPDATE processing_jobs
+    SET status = 'failed', worker = NULL, error = ?, finished_at = ?
+    WHERE {stale} AND attempts >= max_attempts
+    ''', (STALE_JOB_ERROR, now, stale_before))
+    failed = cursor.rowcount
+    cursor.execute(f'''
+    UPDATE processing_jobs
+    SET status = 'queued', worker = NULL, run_after = ?
+    WHERE {stale}
+    ''', (now, stale_before))
+    count = cursor.rowcount
+    if failed:
+        print(f"{failed} processing jobs failed: their worker stopped on the last attempt")
+    
+    conn.commit()
+    conn.close()
+    
+    return count
+
+def get_unqueued_documents() -> List[int]:
+    """IDs of documents that are neither processed, failed nor waiting in the job queue"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    SELECT id FROM documents
+    WHERE NOT is_processed AND processing_error IS NULL
+      AND id NOT IN (SELECT doc_id FROM processing_jobs WHERE status IN ('queued', 'running'))
+    ORDER BY id
+    ''')
+    doc_ids = [row["id"] for row in cursor.fetchall()]
+    
+    conn.close()
+    return doc_ids
+
+def get_job(job_id: int) -> Optional[Dict]:
+    """Get a processing job by ID"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT * FROM processing_jobs WHERE id = ?", (job_id,))
+    job = cursor.fetchone()
+    
+    conn.close()
+    return job
+
+def get_jobs(doc_id: Optional[int] = None, status: Optional[str] = None, limit: int = 100) -> List[Dict]:
+    """Most recent processing jobs, optionally of one document or in one status"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    clauses, params = [], []
+    if doc_id is not None:
+        clauses.append("doc_id = ?")
+        params.append(doc_id)
+    if status is not None:
+        clauses.append("status = ?")
+        params.append(status)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    
+    cursor.execute(f"SELECT * FROM processing_jobs {where} ORDER BY id DESC LIMIT ?", [*params, limit])
+    jobs = cursor.fetchall()
+    
+    conn.close()
+    return jobs
+
 # Initialize the database on module import
 init_db()
\ No newline at end of file
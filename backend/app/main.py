@@ -1,7 +1,10 @@
+import threading
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router as api_router
 from app.core import config
+from app.services.job_queue import start_workers, stop_workers
+from app.services.uploads import backfill_content_hashes
 from dotenv import load_dotenv
 load_dotenv()
 app = FastAPI(title=config.PROJECT_NAME)
@@ -18,6 +21,18 @@ app.add_middleware(
 # Include API routes
 app.include_router(api_router, prefix=config.API_V1_STR)
 
+@app.on_event("startup")
+def start_job_workers():
+    """Resume interrupted processing jobs and start the worker pool"""
+    start_workers()
+    # Hash files uploaded before duplicates were detected, without delaying startup
+    threading.Thread(target=backfill_content_hashes, name="hash-backfill", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    # Jobs still running are queued again by the next process
+    stop_workers(timeout=5)
+
 @app.get("/")
 async def root():
     """Root endpoint for healthcheck"""
@@ -0,0 +1,137 @@
+# backend/app/services/context_builder.py
+import re
+from typing import List, Dict, Set
+
+from app.core import config
+
+# Shortest shared prefix/suffix treated as chunk overlap rather than coincidence
+MIN_MERGE_OVERLAP = 20
+
+_WORD_RE = re.compile(r"\w+")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of first that is a prefix of second (0 if shorter than MIN_MERGE_OVERLAP)"""
+    if len(first) < MIN_MERGE_OVERLAP or len(second) < MIN_MERGE_OVERLAP:
+        return 0
+    prefix = second[:MIN_MERGE_OVERLAP]
+    start = first.find(prefix, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(prefix, start + 1)
+    return 0
+
+def _merge(first: str, second: str):
+    """Merge two overlapping texts into one, None if they do not overlap"""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    overlap = _overlap(first, second)
+    if overlap:
+        return first + second[overlap:]
+    overlap = _overlap(second, first)
+    if overlap:
+        return second + first[overlap:]
+    return None
+
+def _words(text: str) -> Set[str]:
+    return set(_WORD_RE.findall(text.casefold()))
+
+def _jaccard(first: Set[str], second: Set[str]) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+def merge_chunks(chunk_list: List[Dict]) -> List[Dict]:
+    """
+    Merge chunks of the same page and paragraph whose text overlaps (the
+    CHUNK_OVERLAP characters shared by neighbouring chunks) or is contained in
+    another chunk. A merged segment keeps the best rank of its chunks.
+
+    Args:
+        chunk_list: Chunks with "content", "page" and "paragraph", best first
+
+    Returns:
+        Segments with "content", "page", "paragraph" and "rank" (0 = best)
+    """
+    segments = []
+    for rank, chunk in enumerate(chunk_list):
+        segment = {
+            "content": chunk["content"].strip(),
+            "page": chunk["page"],
+            "paragraph": chunk["paragraph"],
+            "rank": rank
+        }
+
+        # Merging can make a segment overlap another one, so repeat until stable
+        merged = True
+        while merged:
+            merged = False
+            for other in segments:
+                if (other["page"], other["paragraph"]) != (segment["page"], segment["paragraph"]):
+                    continue
+                text = _merge(other["content"], segment["content"])
+                if text is not None:
+                    segments.remove(other)
+                    segment = {**segment, "content": text, "rank": min(other["rank"], segment["rank"])}
+                    merged = True
+                    break
+        segments.append(segment)
+
+    return sorted(segments, key=lambda s: s["rank"])
+
+def drop_near_duplicates(segments: List[Dict], threshold: float) -> List[Dict]:
+    """Drop segments whose word sets have a Jaccard similarity >= threshold with a better ranked segment"""
+    kept = []
+    kept_words = []
+    for segment in segments:
+        words = _words(segment["content"])
+        if any(_jaccard(words, other) >= threshold for other in kept_words):
+            continue
+        kept.append(segment)
+        kept_words.append(words)
+    return kept
+
+def build_context(
+    chunk_list: List[Dict],
+    token_budget: int = config.ANSWER_CONTEXT_TOKEN_BUDGET,
+    duplicate_threshold: float = config.CONTEXT_DUPLICATE_THRESHOLD
+) -> List[Dict]:
+    """
+    Build the context passages for an answer prompt from retrieved chunks:
+    overlapping chunks are merged, near-duplicates dropped and the best ranked
+    passages kept within token_budget (the best one is truncated if it alone
+    is over budget).
+
+    Args:
+        chunk_list: Chunks with "content", "page" and "paragraph", best first
+        token_budget: Maximum estimated tokens of context
+        duplicate_threshold: Jaccard similarity above which a passage is a duplicate
+
+    Returns:
+        Passages in page/paragraph order, each with "text" (content prefixed
+        with its citation), "content", "page", "paragraph" and "rank"
+    """
+    segments = drop_near_duplicates(merge_chunks(chunk_list), duplicate_threshold)
+
+    selected = []
+    used_tokens = 0
+    for segment in segments:
+        citation = f"[Page {segment['page']}, Paragraph {segment['paragraph']}]"
+        text = f"{citation} {segment['content']}"
+        tokens = estimate_tokens(text)
+        if used_tokens + tokens > token_budget:
+            if selected:
+                continue
+            # estimate_tokens counts len // 4 + 1, so 4 * budget - 1 characters fit
+            text = text[:max(0, token_budget * 4 - 1)]
+            tokens = estimate_tokens(text)
+        selected.append({**segment, "text": text})
+        used_tokens += tokens
+
+    return sorted(selected, key=lambda s: (s["page"], s["paragraph"], s["rank"]))
@@ -1,34 +1,62 @@
 # backend/app/services/document_processing.py
 import os
-from typing import List, Dict
+import time
+import hashlib
+from collections import defaultdict
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Set
 import json
 
+import numpy as np
+
 from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-#from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.vectorstores import Chroma
 
 from app.core import config
-from app.services.text_extraction import extract_text_from_pdf
-from app.core.database import update_document_status, update_document_embedding, get_document
-#from sentence_transformers import SentenceTransformer
-from langchain.embeddings.base import Embeddings
+from app.services.text_extraction import get_page_count, iter_text_from_pdf
+from app.core.database import (
+    update_document_status,
+    update_document_embedding,
+    update_document_metadata,
+    invalidate_cached_answers,
+    add_document_chunks,
+    remove_stale_document_chunks,
+    get_document
+)
+from app.services import numpy_index
+from app.services.document_routing import update_document_routing, remove_document_routing
+from app.services.embedding_pipeline import AdaptiveBatchSizer, embed_texts
+from app.services.ingestion_pipeline import PipelineStage, StageStats, batched
+from app.services.embedding_service import (
+    get_shared_vector_store,
+    get_embedding_model,
+    get_embedding_model_name,
+    invalidate_vector_store
+)
 
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-import onnxruntime
-def chunk_pages(
-    pages: List[Dict],
+def chunk_content_hash(text: str, chunk_size: int, chunk_overlap: int, model_name: str) -> str:
+    """
+    Content address of a chunk: identical text chunked with the same params and
+    embedded with the same model always maps to the same vector.
+    """
+    key = f"{model_name}|{chunk_size}|{chunk_overlap}|{text}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def iter_chunks(
+    pages: Iterable[Dict],
     chunk_size: int = config.CHUNK_SIZE,
-    chunk_overlap: int = config.CHUNK_OVERLAP
-) -> List[Document]:
+    chunk_overlap: int = config.CHUNK_OVERLAP,
+    doc_id: Optional[int] = None
+) -> Iterator[Document]:
     """
-    Splits each page's text into overlapping character chunks.
+    Splits each page's text into overlapping character chunks, one page at a time.
+    If doc_id is given it replaces the per-page doc_id in the metadata.
 
-    Returns LangChain Documents with metadata:
+    Yields LangChain Documents with metadata:
       page_content = chunk text
-      metadata = { "doc_id", "page", "paragraph" }
+      metadata = { "doc_id", "page", "paragraph", "content_hash", "chunk_id" }
     """
-    docs: List[Document] = []
+    model_name = get_embedding_model_name()
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
@@ -36,112 +64,348 @@ def chunk_pages(
     )
 
     for page in pages:
+        # Positions include the page, so occurrences only need counting within it
+        seen_ids = defaultdict(int)
         # Break into paragraphs on blank lines
         paras = [p.strip() for p in page["text"].split("\n\n") if p.strip()]
         for para_idx, para in enumerate(paras, start=1):
             # Each para may be long, so split into smaller chunks
             for chunk in splitter.split_text(para):
-                docs.append(Document(
+                chunk_doc_id = page["doc_id"] if doc_id is None else doc_id
+                content_hash = chunk_content_hash(chunk, chunk_size, chunk_overlap, model_name)
+                
+                # Stable ID: same text at the same position keeps its ID across reprocessing
+                position = f"{chunk_doc_id}|{page['page']}|{para_idx}|{content_hash}"
+                occurrence = seen_ids[position]
+                seen_ids[position] += 1
+                chunk_id = hashlib.sha256(f"{position}|{occurrence}".encode("utf-8")).hexdigest()
+                
+                yield Document(
                     page_content=chunk,
                     metadata={
-                        "doc_id": page["doc_id"],
+                        "doc_id": chunk_doc_id,
                         "page": page["page"],
-                        "paragraph": para_idx
+                        "paragraph": para_idx,
+                        "content_hash": content_hash,
+                        "chunk_id": chunk_id
                     }
-                ))
-    return docs
-'''
-class SentenceTransformerEmbedding(Embeddings):
-    def __init__(self, model_name: str):
-        self.model = SentenceTransformer(model_name)
-
-    def embed_documents(self, texts):
-        # Returns list of embedding vectors for documents
-        return [self.model.encode(t, normalize_embeddings=True).tolist() for t in texts]
-
-    def embed_query(self, text):
-        # Embeds a single query string
-        return self.model.encode(text, normalize_embeddings=True).tolist()
-'''
-def create_vector_store(
-    docs: List[Document],
-    persist_dir: str
-) -> Chroma:
+                )
+
+def chunk_pages(
+    pages: List[Dict],
+    chunk_size: int = config.CHUNK_SIZE,
+    chunk_overlap: int = config.CHUNK_OVERLAP,
+    doc_id: Optional[int] = None
+) -> List[Document]:
+    """Chunks all pages at once (see iter_chunks)"""
+    return list(iter_chunks(pages, chunk_size, chunk_overlap, doc_id))
+
+class VectorStoreWriter:
     """
-    Embeds the list of Documents and writes to a ChromaDB directory.
+    Syncs a document's chunks into the configured vector backend (the shared
+    ChromaDB collection or the document's NumPy index) and the lexical index,
+    batch by batch as they come out of the ingestion pipeline.
+
+    Chunks are addressed by content hash, so reprocessing only embeds text that
+    is not stored yet: unchanged chunks are left alone, moved or duplicated
+    chunks reuse their stored vector and chunks that disappeared are deleted
+    in finish(). New text goes through the batched embedding pipeline.
+
+    Only chunk IDs are kept for the whole document. The Chroma backend also
+    keeps one float32 vector per chunk for the routing index; the NumPy backend
+    appends each batch to a new version of the document's index on disk (see
+    numpy_index.IndexWriter) and reads the vectors back from there.
     """
 
-    #model_name = config.EMBEDDING_MODEL
-    #if not model_name.startswith("sentence-transformers/"):
-    #    model_name = f"sentence-transformers/{model_name}"
-    #embedding_model = SentenceTransformerEmbedding(model_name)
-    embedding_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001",google_api_key=config.GOOGLE_API_KEY)
-
-    if os.path.exists(persist_dir) and os.listdir(persist_dir):
-        # If the directory exists and is not empty, load the existing DB
-        print(f"Loading existing ChromaDB from: {persist_dir}")
-        vectordb = Chroma(
-            persist_directory=persist_dir,
-            embedding_function=embedding_model
+    def __init__(self, doc_id: int):
+        self.doc_id = doc_id
+        self.model_name = get_embedding_model_name()
+        self.use_numpy = config.VECTOR_BACKEND == "numpy"
+        if self.use_numpy:
+            existing_ids, self._stored_vectors = numpy_index.get_stored_vectors(doc_id)
+            self._index_writer = numpy_index.IndexWriter(doc_id, self.model_name)
+        else:
+            self._vectordb = get_shared_vector_store()
+            self._collection = self._vectordb._collection
+            existing_ids = self._collection.get(where={"doc_id": doc_id}, include=[])["ids"]
+        self._existing_ids = set(existing_ids)
+
+        self._sizer = AdaptiveBatchSizer()
+        self._chunk_ids: Set[str] = set()
+        self._vectors: List[np.ndarray] = []
+        self._lexical_added = 0
+        self.stats = {"chunks": 0, "unchanged": 0, "added": 0, "embedded": 0, "removed": 0}
+        self._embedding = {"chunks": 0, "batches": 0, "retries": 0, "seconds": 0.0}
+
+    def _stored_vectors_by_hash(self, hashes: List[str]) -> Dict:
+        """Vectors already stored for any of the content hashes, in this or another document"""
+        if self.use_numpy:
+            return {h: self._stored_vectors[h] for h in hashes if h in self._stored_vectors}
+        stored = self._collection.get(
+            where={"content_hash": {"$in": hashes}},
+            include=["embeddings", "metadatas"]
         )
-        # Add new documents to the existing DB
-        print(f"Adding {len(docs)} new documents to the existing ChromaDB.")
-        vectordb.add_documents(docs)
-    else:
-        vectordb = Chroma.from_documents(
-            documents=docs,
-            embedding=embedding_model,
-            persist_directory=persist_dir
+        return {
+            metadata["content_hash"]: embedding
+            for metadata, embedding in zip(stored["metadatas"], stored["embeddings"])
+        }
+
+    def embed(self, docs: List[Document]) -> List:
+        """Vectors of a batch of chunks, reusing stored vectors and embedding the rest"""
+        hashes = list({doc.metadata["content_hash"] for doc in docs})
+        vectors_by_hash = self._stored_vectors_by_hash(hashes)
+
+        to_embed = {}
+        for doc in docs:
+            if doc.metadata["content_hash"] not in vectors_by_hash:
+                to_embed[doc.metadata["content_hash"]] = doc.page_content
+
+        if to_embed:
+            vectors, embedding_stats = embed_texts(list(to_embed.values()), get_embedding_model(), sizer=self._sizer)
+            vectors_by_hash.update(zip(to_embed.keys(), vectors))
+            for key in ("chunks", "batches", "retries", "seconds"):
+                self._embedding[key] += embedding_stats[key]
+            self.stats["embedded"] += len(to_embed)
+
+        return [vectors_by_hash[doc.metadata["content_hash"]] for doc in docs]
+
+    def write(self, docs: List[Document], vectors: List):
+        """Store a batch of chunks with their vectors"""
+        added = [
+            (doc, vector) for doc, vector in zip(docs, vectors)
+            if doc.metadata["chunk_id"] not in self._existing_ids
+        ]
+        # Add new chunks right away; stale ones are only deleted in finish(),
+        # so a failed embedding call never leaves the document empty
+        if added and not self.use_numpy:
+            self._collection.add(
+                ids=[doc.metadata["chunk_id"] for doc, _ in added],
+                embeddings=[vector for _, vector in added],
+                metadatas=[doc.metadata for doc, _ in added],
+                documents=[doc.page_content for doc, _ in added]
+            )
+        if self.use_numpy:
+            self._index_writer.add(docs, vectors)
+        else:
+            self._vectors.extend(np.asarray(vector, dtype=np.float32) for vector in vectors)
+
+        self._lexical_added += add_document_chunks(self.doc_id, [
+            {**doc.metadata, "text": doc.page_content} for doc in docs
+        ])
+        self._chunk_ids.update(doc.metadata["chunk_id"] for doc in docs)
+        self.stats["chunks"] += len(docs)
+        self.stats["added"] += len(added)
+        self.stats["unchanged"] += len(docs) - len(added)
+
+    def finish(self) -> Dict:
+        """
+        Delete chunks that are gone, write the NumPy index and refresh the
+        routing index once every batch was written.
+
+        Returns a dict of sync, embedding and lexical index stats.
+        """
+        stale_ids = [chunk_id for chunk_id in self._existing_ids if chunk_id not in self._chunk_ids]
+        if self.use_numpy:
+            # Refresh the document's rows in the routing index
+            update_document_routing(self.doc_id, self._index_writer.vectors(), self.model_name)
+            if self.stats["added"] or stale_ids:
+                self._index_writer.publish()
+            else:
+                self._index_writer.discard()
+        else:
+            if stale_ids:
+                self._collection.delete(ids=stale_ids)
+            self._vectordb.persist()
+            update_document_routing(self.doc_id, self._vectors, self.model_name)
+
+        lexical_removed = remove_stale_document_chunks(self.doc_id, self._chunk_ids)
+
+        self.stats["removed"] = len(stale_ids)
+        self.stats["embedding"] = None
+        if self._embedding["chunks"]:
+            seconds = self._embedding["seconds"]
+            self.stats["embedding"] = {
+                **self._embedding,
+                "seconds": round(seconds, 3),
+                "chunks_per_second": round(self._embedding["chunks"] / seconds, 2) if seconds > 0 else None,
+                "final_batch_size": self._sizer.next_size()
+            }
+        self.stats["lexical"] = {"added": self._lexical_added, "removed": lexical_removed}
+
+        print(
+            f"Document {self.doc_id}: {self.stats['unchanged']} chunks unchanged, "
+            f"{self.stats['added']} added ({self.stats['embedded']} embedded), {self.stats['removed']} removed"
         )
-    
-    vectordb.persist()
-    return vectordb
+        if self.stats["embedding"]:
+            print(f"Document {self.doc_id}: embedded at {self.stats['embedding']['chunks_per_second']} chunks/sec")
+
+        return self.stats
 
-def process_document(doc_id: int) -> bool:
+    def discard(self):
+        """Drop what was written to an unpublished NumPy index version after a failure"""
+        if self.use_numpy:
+            self._index_writer.discard()
+
+def create_vector_store(docs: List[Document], doc_id: int) -> Dict:
+    """
+    Syncs all of a document's chunks at once into the vector backend and the
+    lexical index (see VectorStoreWriter).
+
+    Returns a dict of sync and embedding throughput stats.
     """
-    Process a document by:
-    1. Extracting text
+    writer = VectorStoreWriter(doc_id)
+    try:
+        for batch in batched(docs, config.INGEST_CHUNK_BATCH_SIZE):
+            writer.write(batch, writer.embed(batch))
+        return writer.finish()
+    except Exception:
+        writer.discard()
+        raise
+
+class _PageDataWriter:
+    """Writes page_data.json one page at a time, swapping the file in on success"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.page_count = 0
+        self._file = open(path + ".tmp", "w")
+        self._file.write("[")
+
+    def save(self, pages: Iterable[Dict]) -> Iterator[Dict]:
+        """Pass pages through, saving each one"""
+        for page in pages:
+            self._file.write(", " if self.page_count else "")
+            json.dump(page, self._file)
+            self.page_count += 1
+            yield page
+
+    def commit(self):
+        self._file.write("]")
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.path + ".tmp"):
+            os.remove(self.path + ".tmp")
+
+def process_document(doc_id: int, on_progress: Optional[Callable[[int, int], None]] = None) -> bool:
+    """
+    Process a document as a streaming pipeline:
+    1. Extracting text, page by page
     2. Chunking pages
-    3. Creating vector embeddings
+    3. Creating vector embeddings for batches of chunks
+    4. Writing the batches into the vector store and full-text index
+    
+    Each stage runs on its own thread and the stages are connected by bounded
+    queues, so extraction of the next pages overlaps embedding of earlier ones
+    and memory does not grow with the number of pages. Per-stage counters are
+    saved in the document's metadata under "indexing"/"pipeline".
+    
+    on_progress, if given, is called with (pages done, total pages) after
+    each batch is indexed.
     
     Returns True if successful, False otherwise
     """
+    stages = []
+    writer = None
+    page_data = None
     try:
         # Get document from database
         document = get_document(doc_id)
         if not document:
             raise ValueError(f"Document with ID {doc_id} not found")
         
-        # Create embedding directory for this document
+        # Create directory for this document's page data
         embedding_dir = os.path.join(config.EMBEDDING_DIR, f"doc_{doc_id}")
         os.makedirs(embedding_dir, exist_ok=True)
         
-        # Extract text from PDF
-        pages = extract_text_from_pdf(document['file_path'])
+        start = time.perf_counter()
+        page_count = get_page_count(document['file_path'])
+        if on_progress:
+            on_progress(0, page_count)
+        writer = VectorStoreWriter(doc_id)
+        # Page data is saved for future reference as pages go by
+        page_data = _PageDataWriter(os.path.join(embedding_dir, "page_data.json"))
         
-        # Chunk the pages
-        chunked_docs = chunk_pages(pages)
+        extract = PipelineStage("extract", iter_text_from_pdf(document['file_path']), config.INGEST_PAGE_QUEUE_SIZE)
+        chunk = PipelineStage(
+            "chunk",
+            batched(iter_chunks(page_data.save(extract), doc_id=doc_id), config.INGEST_CHUNK_BATCH_SIZE),
+            config.INGEST_BATCH_QUEUE_SIZE,
+            upstream=extract,
+            size=len
+        )
+        embed = PipelineStage(
+            "embed",
+            ((batch, writer.embed(batch)) for batch in chunk),
+            config.INGEST_BATCH_QUEUE_SIZE,
+            upstream=chunk,
+            size=lambda item: len(item[0])
+        )
+        stages = [extract, chunk, embed]
         
-        # Create vector store
-        create_vector_store(chunked_docs, embedding_dir)
+        # Sync batches into the vector store and full-text index (only new text is embedded)
+        index = StageStats("index")
+        batches = iter(embed)
+        while True:
+            wait_start = time.perf_counter()
+            item = next(batches, None)
+            index.input_wait_seconds += time.perf_counter() - wait_start
+            if item is None:
+                break
+            batch_start = time.perf_counter()
+            writer.write(*item)
+            index.busy_seconds += time.perf_counter() - batch_start
+            index.items += len(item[0])
+            if on_progress:
+                # Chunks arrive in page order, so every page before the batch's last one is complete
+                on_progress(item[0][-1].metadata["page"] - 1, page_count)
         
-        # Save page data for future reference
-        page_data_file = os.path.join(embedding_dir, "page_data.json")
-        with open(page_data_file, 'w') as f:
-            json.dump(pages, f)
+        index_stats = writer.finish()
+        page_data.commit()
+        invalidate_vector_store(doc_id)
+        invalidate_cached_answers(doc_id)
+        if on_progress:
+            on_progress(page_count, page_count)
+        
+        index_stats["pipeline"] = {
+            "seconds": round(time.perf_counter() - start, 3),
+            **{stage.name: stage.as_dict() for stage in [extract.stats, chunk.stats, embed.stats, index]}
+        }
+        print(f"Document {doc_id}: pipeline " + ", ".join(
+            f"{name} {stats['items']} in {stats['busy_seconds']}s" for name, stats in index_stats["pipeline"].items()
+            if name != "seconds"
+        ))
+        update_document_metadata(doc_id, {"indexing": index_stats})
         
         # Update document status in database
         update_document_embedding(doc_id, embedding_dir)
         update_document_status(
             doc_id, 
             is_processed=True, 
-            page_count=len(pages)
+            page_count=page_data.page_count
         )
         
         return True
     
     except Exception as e:
+        # Stop the stages before discarding the page data they may still be writing
+        for stage in stages:
+            stage.close()
+        for stage in stages:
+            stage.join()
+        if writer is not None:
+            writer.discard()
+        if page_data is not None:
+            page_data.discard()
         # Update document with error
         update_document_status(doc_id, is_processed=False, error=str(e))
+        # The document is no longer searchable, so drop its routing vectors
+        remove_document_routing(doc_id)
         print(f"Error processing document {doc_id}: {str(e)}")
-        return False
\ No newline at end of file
+        return False
+    
+    finally:
+        for stage in stages:
+            stage.close()
@@ -0,0 +1,185 @@
+# backend/app/services/document_routing.py
+"""
+Document-level routing index: a few normalized vectors per document (the
+centroid of its chunk vectors, plus optional k-means centroids) in one small
+matrix. Queries over the whole corpus first shortlist the documents whose
+vectors are closest to the question and only search chunks inside them.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Set
+
+import numpy as np
+
+from app.core import config
+from app.services.vector_ops import kmeans
+
+ROUTING_FILE = "document_routing.npz"
+
+_lock = threading.Lock()
+# (path, file stamp, model name, vectors, doc_ids) of the last loaded matrix
+_loaded = None
+
+def get_routing_path(base_dir: Optional[str] = None) -> str:
+    return os.path.join(base_dir or config.EMBEDDING_DIR, ROUTING_FILE)
+
+def compute_document_vectors(vectors, clusters: int = config.ROUTING_CLUSTERS_PER_DOCUMENT) -> np.ndarray:
+    """
+    Routing vectors of one document: the normalized centroid of its chunk
+    vectors, followed by up to `clusters` normalized k-means centroids.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not vectors.size:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    rows = [vectors.mean(axis=0, keepdims=True)]
+    if clusters > 1 and vectors.shape[0] > clusters:
+        centroids, _ = kmeans(vectors, clusters, iterations=10)
+        rows.append(centroids)
+
+    routing = np.vstack(rows)
+    routing /= np.clip(np.linalg.norm(routing, axis=1, keepdims=True), 1e-12, None)
+    return routing
+
+def _file_stamp(path: str):
+    """Inode and mtime of the routing file, None if it is missing"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+def _load(path: str):
+    """Load the routing matrix, reusing the in-memory copy while the file is unchanged"""
+    global _loaded
+    stamp = _file_stamp(path)
+    if stamp is None:
+        return None, np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+    if _loaded is None or _loaded[0] != path or _loaded[1] != stamp:
+        with np.load(path) as data:
+            _loaded = (path, stamp, str(data["model"]), data["vectors"], data["doc_ids"])
+    return _loaded[2], _loaded[3], _loaded[4]
+
+def _save(path: str, model_name: str, vectors: np.ndarray, doc_ids: np.ndarray):
+    global _loaded
+    vectors, doc_ids = vectors.astype(np.float32), doc_ids.astype(np.int64)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, model=model_name, vectors=vectors, doc_ids=doc_ids)
+    os.replace(path + ".tmp", path)
+    _loaded = (path, _file_stamp(path), model_name, vectors, doc_ids)
+
+@contextmanager
+def _locked(path: str):
+    """
+    Serialize read-modify-write of the routing file across threads and
+    processes (the API and standalone job workers), so no update is lost
+    """
+    with _lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".lock", "a") as lock_file:
+            try:
+                import fcntl
+            except ImportError:  # Windows: only threads of this process are serialized
+                yield
+                return
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def update_document_routing(doc_id: int, chunk_vectors, model_name: str, base_dir: Optional[str] = None):
+    """Replace a document's rows in the routing matrix with ones computed from its chunk vectors"""
+    routing = compute_document_vectors(chunk_vectors)
+    path = get_routing_path(base_dir)
+
+    with _locked(path):
+        stored_model, vectors, doc_ids = _load(path)
+        # Vectors of another embedding model cannot be compared, start over
+        if stored_model != model_name or (routing.size and vectors.size and vectors.shape[1] != routing.shape[1]):
+            vectors = np.zeros((0, routing.shape[1] if routing.size else 0), dtype=np.float32)
+            doc_ids = np.zeros(0, dtype=np.int64)
+
+        keep = doc_ids != doc_id
+        vectors, doc_ids = vectors[keep], doc_ids[keep]
+        if routing.size:
+            vectors = np.vstack([vectors.reshape(-1, routing.shape[1]), routing])
+            doc_ids = np.concatenate([doc_ids, np.full(routing.shape[0], doc_id, dtype=np.int64)])
+        _save(path, model_name, vectors, doc_ids)
+
+def remove_document_routing(doc_id: int, base_dir: Optional[str] = None):
+    """Drop a document from the routing matrix"""
+    path = get_routing_path(base_dir)
+    with _locked(path):
+        model_name, vectors, doc_ids = _load(path)
+        if model_name is None or doc_id not in doc_ids:
+            return
+        keep = doc_ids != doc_id
+        _save(path, model_name, vectors[keep], doc_ids[keep])
+
+def shortlist_documents(
+    query_embedding: List[float],
+    doc_ids: List[int],
+    top_n: int,
+    model_name: str,
+    base_dir: Optional[str] = None
+) -> List[int]:
+    """
+    The top_n of doc_ids whose routing vectors are closest to the query.
+    Documents missing from the routing matrix (indexed before it existed)
+    are always kept, since they cannot be ranked.
+    """
+    stored_model, vectors, routed_ids = _load(get_routing_path(base_dir))
+    query = np.asarray(query_embedding, dtype=np.float32)
+    if stored_model != model_name or not vectors.size or vectors.shape[1] != query.shape[0]:
+        return list(doc_ids)
+
+    wanted: Set[int] = set(doc_ids)
+    mask = np.isin(routed_ids, list(wanted))
+    scores = vectors[mask] @ query
+    candidates = routed_ids[mask]
+
+    # A document scores as its best routing vector
+    best = {}
+    for doc_id, score in zip(candidates.tolist(), scores.tolist()):
+        if score > best.get(doc_id, -np.inf):
+            best[doc_id] = score
+
+    unrouted = [doc_id for doc_id in doc_ids if doc_id not in best]
+    ranked = sorted(best, key=best.get, reverse=True)[:top_n]
+    return ranked + unrouted
+
+def rebuild_routing_index(base_dir: Optional[str] = None) -> int:
+    """Recompute the routing matrix from the stored chunk vectors of every processed document"""
+    from app.core.database import get_all_documents
+    from app.services import numpy_index
+    from app.services.embedding_service import get_shared_vector_store, get_embedding_model_name
+
+    model_name = get_embedding_model_name()
+    path = get_routing_path(base_dir)
+    if os.path.exists(path):
+        os.remove(path)
+
+    count = 0
+    for document in get_all_documents():
+        if not document["is_processed"]:
+            continue
+        if config.VECTOR_BACKEND == "numpy":
+            index = numpy_index.load_document_index(document["id"])
+            vectors = np.array(index.vectors) if index is not None else []
+        else:
+            vectors = get_shared_vector_store()._collection.get(
+                where={"doc_id": document["id"]}, include=["embeddings"]
+            )["embeddings"]
+        if vectors is not None and len(vectors):
+            update_document_routing(document["id"], vectors, model_name, base_dir)
+            count += 1
+    return count
+
+if __name__ == "__main__":
+    from app.core.database import init_db
+
+    init_db()
+    print(f"Routing index rebuilt for {rebuild_routing_index()} documents")
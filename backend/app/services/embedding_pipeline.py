@@ -0,0 +1,122 @@
+# backend/app/services/embedding_pipeline.py
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Tuple
+
+from langchain.embeddings.base import Embeddings
+
+from app.core import config
+
+class AdaptiveBatchSizer:
+    """
+    AIMD controller for the embedding batch size: grows additively while
+    batches finish under the target latency, halves on slow batches or errors.
+    """
+
+    def __init__(
+        self,
+        initial_size: int = config.EMBEDDING_BATCH_SIZE,
+        min_size: int = config.EMBEDDING_MIN_BATCH_SIZE,
+        max_size: int = config.EMBEDDING_MAX_BATCH_SIZE,
+        target_latency: float = config.EMBEDDING_TARGET_BATCH_SECONDS
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.size = max(min_size, min(initial_size, max_size))
+        self._lock = threading.Lock()
+
+    def next_size(self) -> int:
+        with self._lock:
+            return self.size
+
+    def record_success(self, latency: float):
+        with self._lock:
+            if latency > 2 * self.target_latency:
+                self.size = max(self.min_size, self.size // 2)
+            elif latency < self.target_latency:
+                self.size = min(self.max_size, self.size + self.min_size)
+
+    def record_failure(self):
+        with self._lock:
+            self.size = max(self.min_size, self.size // 2)
+
+def _embed_batch(
+    embedding_model: Embeddings,
+    texts: List[str],
+    sizer: AdaptiveBatchSizer,
+    max_retries: int,
+    retry_backoff: float
+) -> Tuple[List[List[float]], int]:
+    """Embed one batch, retrying it on its own with exponential backoff. Returns (vectors, retries)"""
+    for attempt in range(max_retries + 1):
+        start = time.perf_counter()
+        try:
+            vectors = embedding_model.embed_documents(texts)
+            if len(vectors) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+            sizer.record_success(time.perf_counter() - start)
+            return vectors, attempt
+        except Exception as e:
+            sizer.record_failure()
+            if attempt == max_retries:
+                raise
+            delay = retry_backoff * (2 ** attempt)
+            print(f"Embedding batch of {len(texts)} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def embed_texts(
+    texts: List[str],
+    embedding_model: Embeddings,
+    max_in_flight: int = config.EMBEDDING_MAX_IN_FLIGHT,
+    max_retries: int = config.EMBEDDING_MAX_RETRIES,
+    retry_backoff: float = config.EMBEDDING_RETRY_BACKOFF,
+    sizer: AdaptiveBatchSizer = None
+) -> Tuple[List[List[float]], Dict]:
+    """
+    Embed texts in adaptively sized batches with at most max_in_flight
+    batches running in parallel (at least one, whatever the setting).
+
+    Returns:
+        (vectors in the same order as texts, stats dict with throughput)
+    """
+    sizer = sizer or AdaptiveBatchSizer()
+    # With 0 nothing would ever be submitted
+    max_in_flight = max(1, max_in_flight)
+    vectors: List[List[float]] = [None] * len(texts)
+    stats = {"chunks": len(texts), "batches": 0, "retries": 0}
+    start = time.perf_counter()
+
+    offset = 0
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        try:
+            while offset < len(texts) or in_flight:
+                # Batch size is read at submit time, so it follows the latest measurements
+                while offset < len(texts) and len(in_flight) < max_in_flight:
+                    end = min(offset + sizer.next_size(), len(texts))
+                    future = executor.submit(
+                        _embed_batch, embedding_model, texts[offset:end], sizer, max_retries, retry_backoff
+                    )
+                    in_flight[future] = (offset, end)
+                    offset = end
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_start, batch_end = in_flight.pop(future)
+                    batch_vectors, retries = future.result()
+                    vectors[batch_start:batch_end] = batch_vectors
+                    stats["batches"] += 1
+                    stats["retries"] += retries
+        except Exception:
+            for future in in_flight:
+                future.cancel()
+            raise
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["chunks_per_second"] = round(len(texts) / elapsed, 2) if elapsed > 0 else None
+    stats["final_batch_size"] = sizer.next_size()
+
+    return vectors, stats
@@ -1,70 +1,145 @@
 # backend/app/services/embedding_service.py
 import os
-from typing import List, Dict, Optional
+import re
+import time
+import shutil
+import hashlib
+from array import array
+from typing import List, Dict, Optional, Tuple
 import json
+from functools import lru_cache
 
-#from langchain.embeddings import HuggingFaceEmbeddings
+import numpy as np
 from langchain.vectorstores import Chroma
 from langchain.docstore.document import Document
 
 from langchain.embeddings.base import Embeddings
-#from sentence_transformers import SentenceTransformer
 
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-
-import onnxruntime
 from app.core import config
-from app.core.database import get_document, get_documents_by_ids, get_all_documents
-'''
-class SentenceTransformerEmbedding(Embeddings):
-    def __init__(self, model_name: str):
-        self.model = SentenceTransformer(model_name)
+from app.core.cache import LRUCache
+from app.services import numpy_index
+from app.services.vector_ops import mmr_select
+from app.services.document_routing import shortlist_documents
+from app.services.providers import get_provider
+from app.core.database import (
+    get_document,
+    get_documents_by_ids,
+    get_all_documents,
+    get_cached_query_embedding,
+    save_query_embedding,
+    search_document_chunks,
+    sync_document_chunks
+)
+
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+RETRIEVAL_SCOPES = ("per_document", "global")
+
+def _store_chunk_count(vector_store: Chroma) -> int:
+    """Weigh a cached store by the number of chunks it holds"""
+    try:
+        return vector_store._collection.count()
+    except Exception:
+        return 1
+
+# Opened vector stores: the shared collection of each embedding model (keyed by
+# collection name, used by every query) and legacy per-document stores (keyed by document ID)
+_vector_store_cache = LRUCache(
+    "vector_stores",
+    max_entries=config.VECTOR_STORE_CACHE_SIZE,
+    max_weight=config.VECTOR_STORE_CACHE_MAX_CHUNKS,
+    weigher=_store_chunk_count
+)
 
-    def embed_documents(self, texts):
-        # Returns list of embedding vectors for documents
-        return [self.model.encode(t, normalize_embeddings=True).tolist() for t in texts]
+# Query embeddings keyed by model + normalized question hash: (created_at, embedding)
+_query_embedding_cache = LRUCache("query_embeddings", max_entries=config.QUERY_EMBEDDING_CACHE_SIZE)
 
-    def embed_query(self, text):
-        # Embeds a single query string
-        return self.model.encode(text, normalize_embeddings=True).tolist()
+def get_embedding_model_name() -> str:
+    """Name of the active embedding model, used to key cached vectors"""
+    return get_provider().get_embedding_model_name()
 
-c
+def get_collection_name() -> str:
+    """
+    Name of the shared collection for the active embedding model.
+    Models differ in vector size, so each one gets its own collection.
+    """
+    model_name = get_embedding_model_name()
+    if model_name == config.GOOGLE_EMBEDDING_MODEL:
+        return config.VECTOR_COLLECTION_NAME
+    backend, _, model = model_name.rpartition(":")
+    model_slug = re.sub(r"[^A-Za-z0-9_-]", "-", model)
+    return f"{config.VECTOR_COLLECTION_NAME}_{backend or config.EMBEDDING_BACKEND}_{model_slug}"[:63]
 
+@lru_cache(maxsize=1)
+def get_embedding_model() -> Embeddings:
+    """Get the embedding model of the configured provider (one instance per process)"""
+    return get_provider().get_embedding_model()
 
-def get_embedding_model():
-    """Get the embedding model to use for queries"""
-    model_name = config.EMBEDDING_MODEL
+def normalize_question(question: str) -> str:
+    """Normalize a question for cache lookups (case and whitespace insensitive)"""
+    return " ".join(question.casefold().split())
+
+def embed_query_cached(question: str) -> List[float]:
+    """
+    Embed a question, checking the in-memory LRU and then the on-disk cache
+    before calling the embedding model.
+    """
+    model_name = get_embedding_model_name()
+    cache_key = hashlib.sha256(
+        f"{model_name}\n{normalize_question(question)}".encode("utf-8")
+    ).hexdigest()
+    min_created_at = time.time() - config.QUERY_EMBEDDING_CACHE_TTL
+    
+    cached = _query_embedding_cache.get(cache_key, is_valid=lambda entry: entry[0] >= min_created_at)
+    if cached is not None:
+        return cached[1]
     
-    # Add prefix if missing
-    if not model_name.startswith("sentence-transformers/"):
-        model_name = f"sentence-transformers/{model_name}"
+    stored = get_cached_query_embedding(cache_key, min_created_at)
+    if stored is not None:
+        embedding = array("f", stored["embedding"]).tolist()
+        # Keep the row's age, so the entry expires with it instead of restarting the TTL
+        _query_embedding_cache.put(cache_key, (stored["created_at"], embedding))
+        return embedding
     
-    return HuggingFaceEmbeddings(
-        model_name=model_name,
-        model_kwargs={"device": "cpu"},
-        encode_kwargs={"normalize_embeddings": True}
+    embedding = get_embedding_model().embed_query(question)
+    _query_embedding_cache.put(cache_key, (time.time(), embedding))
+    save_query_embedding(
+        cache_key,
+        model_name,
+        array("f", embedding).tobytes(),
+        min_created_at,
+        config.QUERY_EMBEDDING_CACHE_MAX_ROWS
     )
-'''
-def get_embedding_model():
-    embedding_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001",google_api_key=config.GOOGLE_API_KEY)
-    return embedding_model
+    
+    return embedding
 
+def get_shared_vector_store() -> Chroma:
+    """Get the shared vector store holding the chunks of every document (cached per process)"""
+    collection_name = get_collection_name()
+    return _vector_store_cache.get_or_create(
+        ("shared", collection_name),
+        lambda: Chroma(
+            collection_name=collection_name,
+            persist_directory=config.VECTOR_STORE_DIR,
+            embedding_function=get_embedding_model(),
+            collection_metadata={"hnsw:space": "cosine"}
+        )
+    )
 
-    
 def get_vector_store_for_document(doc_id: int) -> Optional[Chroma]:
-    """Get the vector store for a specific document"""
-    document = get_document(doc_id)
+    """Get the legacy per-document vector store (data/embeddings/doc_<id>), if any"""
+    legacy_dir = os.path.join(config.EMBEDDING_DIR, f"doc_{doc_id}")
     
-    if not document or not document['embedding_path'] or not document['is_processed']:
+    if not os.path.exists(os.path.join(legacy_dir, "chroma.sqlite3")):
         return None
     
-    embedding_model = get_embedding_model()
-    vector_store = Chroma(
-        persist_directory=document['embedding_path'],
-        embedding_function=embedding_model
+    return _vector_store_cache.get_or_create(
+        doc_id,
+        lambda: Chroma(persist_directory=legacy_dir, embedding_function=get_embedding_model())
     )
-    
-    return vector_store
+
+def invalidate_vector_store(doc_id: int):
+    """Drop the cached store of a document after its vectors were rewritten"""
+    _vector_store_cache.invalidate(doc_id)
 
 def get_document_page_data(doc_id: int) -> List[Dict]:
     """Get the page data for a document"""
@@ -81,10 +156,260 @@ def get_document_page_data(doc_id: int) -> List[Dict]:
     with open(page_data_file, 'r') as f:
         return json.load(f)
 
+def cap_per_document(chunks: List[Tuple[Document, float]], per_doc: Optional[int]) -> List[Tuple[Document, float]]:
+    """Keep the first per_doc (chunk, score) tuples of each document (all if per_doc is None)"""
+    if per_doc is None:
+        return chunks
+    counts: Dict[int, int] = {}
+    capped = []
+    for chunk, score in chunks:
+        doc_id = chunk.metadata.get("doc_id")
+        if counts.get(doc_id, 0) < per_doc:
+            counts[doc_id] = counts.get(doc_id, 0) + 1
+            capped.append((chunk, score))
+    return capped
+
+def search_chunks(
+    question_embedding: List[float],
+    doc_ids: List[int],
+    n_results: int,
+    filter_docs: bool = True,
+    per_doc: Optional[int] = None
+) -> List[Tuple[Document, float]]:
+    """
+    Run a single similarity search with the configured vector backend
+    
+    Args:
+        question_embedding: Embedded question
+        doc_ids: Document IDs to search
+        n_results: Number of chunks to return
+        filter_docs: Restrict the search to doc_ids. The Chroma backend can skip
+                     the filter when doc_ids already covers every processed document
+        per_doc: If given, at most this many chunks per document. The NumPy
+                 backend returns the best per_doc of every document; Chroma
+                 splits its n_results best chunks
+        
+    Returns:
+        List of (chunk, similarity) tuples, best match first
+    """
+    if config.VECTOR_BACKEND == "numpy":
+        return numpy_index.search_chunks(question_embedding, doc_ids, n_results, per_doc=per_doc)
+    
+    vector_store = get_shared_vector_store()
+    
+    search_filter = None
+    if filter_docs:
+        if len(doc_ids) == 1:
+            search_filter = {"doc_id": doc_ids[0]}
+        else:
+            search_filter = {"doc_id": {"$in": doc_ids}}
+    
+    # The collection uses cosine distance, so similarity = 1 - distance
+    results = vector_store.similarity_search_by_vector_with_relevance_scores(
+        question_embedding,
+        k=n_results,
+        filter=search_filter
+    )
+    
+    return cap_per_document([(chunk, 1.0 - distance) for chunk, distance in results], per_doc)
+
+def get_chunk_vectors(chunks: List[Document]) -> Dict[str, List[float]]:
+    """Stored vectors of retrieved chunks keyed by chunk ID (chunks without one are left out)"""
+    chunk_ids = [chunk.metadata["chunk_id"] for chunk in chunks if chunk.metadata.get("chunk_id")]
+    if not chunk_ids:
+        return {}
+    
+    if config.VECTOR_BACKEND == "numpy":
+        vectors = {}
+        by_doc: Dict[int, List[str]] = {}
+        for chunk in chunks:
+            if chunk.metadata.get("chunk_id"):
+                by_doc.setdefault(chunk.metadata["doc_id"], []).append(chunk.metadata["chunk_id"])
+        for doc_id, ids in by_doc.items():
+            vectors.update(numpy_index.get_chunk_vectors(doc_id, ids))
+        return vectors
+    
+    stored = get_shared_vector_store()._collection.get(ids=chunk_ids, include=["embeddings"])
+    return dict(zip(stored["ids"], stored["embeddings"]))
+
+def rerank_mmr(
+    question_embedding: List[float],
+    chunks: List[Document],
+    k: int,
+    lambda_mult: float = config.MMR_LAMBDA
+) -> List[Document]:
+    """
+    Pick k diverse chunks out of ranked candidates with Maximal Marginal Relevance,
+    using the stored chunk vectors (no embedding calls). Candidates without a
+    stored vector keep their rank after the picked ones.
+    """
+    if len(chunks) <= 1:
+        return chunks[:k]
+    
+    vectors = get_chunk_vectors(chunks)
+    with_vectors = [chunk for chunk in chunks if chunk.metadata.get("chunk_id") in vectors]
+    without_vectors = [chunk for chunk in chunks if chunk.metadata.get("chunk_id") not in vectors]
+    if not with_vectors:
+        return chunks[:k]
+    
+    picked = mmr_select(
+        np.asarray(question_embedding, dtype=np.float32),
+        np.asarray([vectors[chunk.metadata["chunk_id"]] for chunk in with_vectors], dtype=np.float32),
+        k,
+        lambda_mult
+    )
+    return ([with_vectors[i] for i in picked] + without_vectors)[:k]
+
+def build_fts_query(question: str) -> str:
+    """Turn a free-text question into an FTS5 query matching any of its terms"""
+    terms = dict.fromkeys(
+        term.lower() for term in re.findall(r"\w+", question)
+        if len(term) > 1 or term.isdigit()
+    )
+    return " OR ".join(f'"{term}"' for term in terms)
+
+def search_chunks_lexical(
+    question: str,
+    doc_ids: List[int],
+    n_results: int,
+    filter_docs: bool = True,
+    per_doc: Optional[int] = None
+) -> List[Tuple[Document, float]]:
+    """
+    BM25 search over the FTS5 chunk index (no embedding call), with at most
+    per_doc chunks of each document if given
+    
+    Returns:
+        List of (chunk, BM25 score) tuples, best match first
+    """
+    match_query = build_fts_query(question)
+    if not match_query:
+        return []
+    
+    rows = search_document_chunks(match_query, doc_ids if filter_docs else None, n_results, per_doc)
+    
+    # SQLite's bm25() is lower-is-better, so negate it into a score
+    return [
+        (
+            Document(
+                page_content=row["text"],
+                metadata={
+                    "doc_id": row["doc_id"],
+                    "page": row["page"],
+                    "paragraph": row["paragraph"],
+                    "content_hash": row["content_hash"],
+                    "chunk_id": row["chunk_id"]
+                }
+            ),
+            -row["rank"]
+        )
+        for row in rows
+    ]
+
+def fuse_rankings(
+    rankings: List[List[Tuple[Document, float]]],
+    rrf_k: int = config.RRF_K
+) -> List[Tuple[Document, float]]:
+    """
+    Merge ranked result lists with reciprocal rank fusion:
+    score(chunk) = sum over lists of 1 / (rrf_k + rank)
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (chunk, _) in enumerate(ranking, start=1):
+            key = chunk.metadata.get("chunk_id") or (chunk.metadata.get("doc_id"), chunk.page_content)
+            if key not in fused:
+                fused[key] = [chunk, 0.0]
+            fused[key][1] += 1.0 / (rrf_k + rank)
+    
+    return sorted(((chunk, score) for chunk, score in fused.values()), key=lambda item: item[1], reverse=True)
+
+def select_global_chunks(
+    chunks: List[Tuple[Document, float]],
+    allowed_ids: set,
+    top_k: int,
+    per_doc_cap: int,
+    min_score: float,
+    max_documents: int
+) -> Dict[int, List[Document]]:
+    """
+    Pick the best chunks across all documents from a ranked list
+    
+    Chunks below min_score cosine similarity are dropped (chunks found only by
+    lexical search have no similarity and are kept), each document contributes
+    at most per_doc_cap chunks and at most max_documents documents are returned,
+    preferring those with the best chunks.
+    
+    Returns:
+        Dict mapping document IDs to lists of chunks
+    """
+    results = {}
+    selected = 0
+    
+    for chunk, score in chunks:
+        doc_id = chunk.metadata.get("doc_id")
+        if doc_id not in allowed_ids:
+            continue
+        
+        similarity = chunk.metadata.get("similarity")
+        if similarity is not None and similarity < min_score:
+            continue
+        
+        if doc_id not in results and len(results) >= max_documents:
+            continue
+        
+        doc_chunks = results.setdefault(doc_id, [])
+        if len(doc_chunks) >= per_doc_cap:
+            continue
+        
+        chunk.metadata["score"] = score
+        doc_chunks.append(chunk)
+        selected += 1
+        if selected >= top_k:
+            break
+    
+    return results
+
+def _rank_chunks(
+    question: str,
+    question_embedding: Optional[List[float]],
+    doc_ids: List[int],
+    n_results: int,
+    filter_docs: bool,
+    mode: str,
+    vector_doc_ids: Optional[List[int]] = None,
+    per_doc: Optional[int] = None
+) -> List[Tuple[Document, float]]:
+    """
+    One lookup per index (vector and/or lexical), fused in hybrid mode.
+    vector_doc_ids, if given, restricts the vector lookup only (the routing
+    shortlist); the lexical lookup still searches doc_ids. per_doc caps the
+    chunks each lookup returns per document.
+    
+    Returns:
+        (chunk, score) tuples, best first
+    """
+    rankings = []
+    if question_embedding is not None:
+        if vector_doc_ids is None:
+            vector_chunks = search_chunks(question_embedding, doc_ids, n_results, filter_docs=filter_docs, per_doc=per_doc)
+        else:
+            vector_chunks = search_chunks(question_embedding, vector_doc_ids, n_results, filter_docs=True, per_doc=per_doc)
+        for chunk, similarity in vector_chunks:
+            chunk.metadata["similarity"] = similarity
+        rankings.append(vector_chunks)
+    if mode != "vector":
+        rankings.append(search_chunks_lexical(question, doc_ids, n_results, filter_docs=filter_docs, per_doc=per_doc))
+    
+    return rankings[0] if len(rankings) == 1 else fuse_rankings(rankings)
+
 def retrieve_relevant_chunks(
     question: str,
     doc_ids: List[int] = None,
-    k: int = config.TOP_K_RESULTS
+    k: int = config.TOP_K_RESULTS,
+    mode: Optional[str] = None,
+    scope: Optional[str] = None,
+    stats: Optional[Dict] = None
 ) -> Dict[int, List[Document]]:
     """
     Retrieve relevant chunks from documents based on a question
@@ -93,12 +418,28 @@ def retrieve_relevant_chunks(
         question: The question to search for
         doc_ids: List of document IDs to search (if None, search all processed documents)
         k: Number of chunks to retrieve per document
+        mode: "vector", "lexical" (BM25 only, no embedding call) or "hybrid"
+              (both fused with reciprocal rank fusion). Defaults to config.RETRIEVAL_MODE
+        scope: "per_document" (k chunks from every document, from one lookup
+               per index that returns the best k of each document) or "global" (the
+               config.GLOBAL_TOP_K best chunks above config.MIN_RELEVANCE_SCORE,
+               at most k per document). Defaults to config.RETRIEVAL_SCOPE
+        stats: If given, filled with retrieval stats: "mmr" holds the candidate
+               and chunk counts and latency of the MMR rerank, None if it did not run
         
     Returns:
-        Dict mapping document IDs to lists of retrieved chunks
+        Dict mapping document IDs to lists of retrieved chunks. Each chunk's
+        metadata["score"] holds the score it was ranked by.
     """
-    embedding_model = get_embedding_model()
-    question_embedding = embedding_model.embed_query(question)
+    mode = mode or config.RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    
+    scope = scope or config.RETRIEVAL_SCOPE
+    if scope not in RETRIEVAL_SCOPES:
+        raise ValueError(f"Unknown retrieval scope: {scope}")
+    if stats is not None:
+        stats["mmr"] = None
     
     # Get documents to search
     if doc_ids:
@@ -112,22 +453,180 @@ def retrieve_relevant_chunks(
         if doc['is_processed'] and doc['embedding_path']
     ]
     
+    if not documents:
+        return {}
+    
+    processed_ids = {doc['id'] for doc in documents}
+    search_ids = sorted(processed_ids)
+    question_embedding = embed_query_cached(question) if mode != "lexical" else None
+    
+    # The doc filter is only needed when the search is restricted to some documents
+    filter_docs = bool(doc_ids)
+    
+    # Over the whole corpus, the vector lookup only searches the documents the routing
+    # index shortlists. BM25 scores are exact and cheap, so the lexical lookup keeps
+    # searching every document
+    routed_ids = None
+    if question_embedding is not None and not doc_ids and 0 < config.ROUTING_TOP_DOCUMENTS < len(search_ids):
+        routed_ids = sorted(shortlist_documents(
+            question_embedding, search_ids, config.ROUTING_TOP_DOCUMENTS, get_embedding_model_name()
+        ))
+        if mode == "vector":
+            search_ids, filter_docs, routed_ids = routed_ids, True, None
+    
+    # MMR picks k chunks per document out of MMR_FETCH_K candidates
+    use_mmr = config.MMR_ENABLED and scope == "per_document" and question_embedding is not None
+    per_doc = max(k, config.MMR_FETCH_K) if use_mmr else k
+    
+    if scope == "global":
+        n_results = max(config.GLOBAL_CANDIDATES, config.GLOBAL_TOP_K)
+        chunks = _rank_chunks(question, question_embedding, search_ids, n_results, filter_docs, mode, routed_ids)
+    else:
+        # One lookup per index for every document at once, split per document.
+        # Chroma cannot group by document, so it over-fetches PER_DOCUMENT_CANDIDATES
+        n_results = max(per_doc * len(search_ids), config.PER_DOCUMENT_CANDIDATES)
+        chunks = _rank_chunks(
+            question, question_embedding, search_ids, n_results, filter_docs, mode, routed_ids, per_doc=per_doc
+        )
+    
+    if scope == "global":
+        return select_global_chunks(
+            chunks,
+            processed_ids,
+            top_k=config.GLOBAL_TOP_K,
+            per_doc_cap=k,
+            min_score=config.MIN_RELEVANCE_SCORE,
+            max_documents=config.MAX_DOCUMENTS
+        )
+    
     results = {}
     
-    for document in documents:
+    for chunk, score in chunks:
+        doc_id = chunk.metadata.get("doc_id")
+        if doc_id not in processed_ids:
+            continue
+        
+        doc_chunks = results.setdefault(doc_id, [])
+        if len(doc_chunks) < per_doc:
+            chunk.metadata["score"] = score
+            doc_chunks.append(chunk)
+    
+    if use_mmr:
+        start = time.perf_counter()
+        candidates = sum(len(doc_chunks) for doc_chunks in results.values())
+        results = {
+            doc_id: rerank_mmr(question_embedding, doc_chunks, k)
+            for doc_id, doc_chunks in results.items()
+        }
+        mmr_stats = {
+            "candidates": candidates,
+            "chunks": sum(len(doc_chunks) for doc_chunks in results.values()),
+            "ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+        print(f"MMR rerank: {mmr_stats['candidates']} candidates -> {mmr_stats['chunks']} chunks in {mmr_stats['ms']} ms")
+        if stats is not None:
+            stats["mmr"] = mmr_stats
+    
+    return results
+
+def rebuild_lexical_index() -> int:
+    """
+    Fill the FTS5 chunk index from the chunks already in the vector backend,
+    e.g. for documents migrated from legacy stores. Returns the number of chunks added.
+    """
+    added = 0
+    
+    for document in get_all_documents():
+        doc_id = document['id']
+        
+        if config.VECTOR_BACKEND == "numpy":
+            index = numpy_index.load_document_index(doc_id)
+            if index is None:
+                continue
+            chunks = [index.to_document(row).metadata | {"text": index.chunks["texts"][row]} for row in range(len(index))]
+        else:
+            data = get_shared_vector_store()._collection.get(where={"doc_id": doc_id}, include=["documents", "metadatas"])
+            chunks = [
+                {
+                    "chunk_id": metadata.get("chunk_id", chunk_id),
+                    "page": metadata["page"],
+                    "paragraph": metadata["paragraph"],
+                    "content_hash": metadata.get("content_hash", ""),
+                    "text": text
+                }
+                for chunk_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+            ]
+        
+        if chunks:
+            added += sync_document_chunks(doc_id, chunks)[0]
+    
+    return added
+
+def migrate_legacy_vector_stores(remove_legacy: bool = False) -> int:
+    """
+    Copy chunks from the legacy per-document Chroma directories into the
+    shared vector store. Stored embeddings are reused, so nothing is re-embedded.
+    
+    Args:
+        remove_legacy: Delete the legacy Chroma files once a document is migrated
+                       (page_data.json is kept)
+        
+    Returns:
+        Number of migrated documents
+    """
+    if config.EMBEDDING_BACKEND != "gemini":
+        raise ValueError("Legacy stores hold Gemini embeddings; run the migration with EMBEDDING_BACKEND=gemini")
+    
+    shared_store = get_shared_vector_store()
+    migrated = 0
+    
+    for document in get_all_documents():
         doc_id = document['id']
-        vector_store = get_vector_store_for_document(doc_id)
+        legacy_store = get_vector_store_for_document(doc_id)
         
-        if not vector_store:
+        if not legacy_store:
             continue
+        
+        already_migrated = shared_store._collection.get(where={"doc_id": doc_id}, limit=1)
+        if not already_migrated["ids"]:
+            data = legacy_store._collection.get(include=["embeddings", "documents", "metadatas"])
             
-        # Search for similar chunks
-        chunks = vector_store.similarity_search_by_vector(
-            question_embedding, 
-            k=k
-        )
+            if data["ids"]:
+                # Legacy chunks carry the PDF filename as doc_id; use the database ID
+                metadatas = [{**(metadata or {}), "doc_id": doc_id} for metadata in data["metadatas"]]
+                shared_store._collection.add(
+                    ids=data["ids"],
+                    embeddings=data["embeddings"],
+                    metadatas=metadatas,
+                    documents=data["documents"]
+                )
+                migrated += 1
+                print(f"Migrated {len(data['ids'])} chunks of document {doc_id} to the shared index")
         
-        if chunks:
-            results[doc_id] = chunks
+        if remove_legacy:
+            invalidate_vector_store(doc_id)
+            legacy_dir = os.path.join(config.EMBEDDING_DIR, f"doc_{doc_id}")
+            for entry in os.listdir(legacy_dir):
+                entry_path = os.path.join(legacy_dir, entry)
+                if os.path.isdir(entry_path):
+                    shutil.rmtree(entry_path)
+                elif entry.startswith("chroma.sqlite3"):
+                    os.remove(entry_path)
     
-    return results
\ No newline at end of file
+    shared_store.persist()
+    return migrated
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Migrate per-document vector stores to the shared index")
+    parser.add_argument("--remove-legacy", action="store_true", help="Delete legacy Chroma files after migrating")
+    parser.add_argument("--rebuild-lexical", action="store_true", help="Only fill the full-text index from stored chunks")
+    args = parser.parse_args()
+    
+    if args.rebuild_lexical:
+        count = rebuild_lexical_index()
+        print(f"Added {count} chunks to the full-text index")
+    else:
+        count = migrate_legacy_vector_stores(remove_legacy=args.remove_legacy)
+        print(f"Migrated {count} documents")
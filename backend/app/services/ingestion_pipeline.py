@@ -0,0 +1,142 @@
+# backend/app/services/ingestion_pipeline.py
+"""
+Building blocks of the streaming ingestion pipeline: each stage runs a
+generator on its own thread and hands its items to the next stage through a
+bounded queue, so a slow stage holds back the ones before it (backpressure)
+instead of letting their output pile up in memory.
+"""
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+_ITEM, _DONE, _ERROR = range(3)
+
+class StageStats:
+    """Throughput counters of one pipeline stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        # Time spent producing items, waiting for the previous stage and
+        # waiting for room in the output queue
+        self.busy_seconds = 0.0
+        self.input_wait_seconds = 0.0
+        self.output_wait_seconds = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "input_wait_seconds": round(self.input_wait_seconds, 3),
+            "output_wait_seconds": round(self.output_wait_seconds, 3),
+            "items_per_second": round(self.items / self.busy_seconds, 2) if self.busy_seconds > 0 else None
+        }
+
+class PipelineStage:
+    """
+    Runs a generator on a background thread and yields its items through a
+    queue of at most max_queued items.
+
+    Args:
+        name: Stage name used in the stats
+        items: The stage's generator, usually consuming the previous stage
+        max_queued: Items produced ahead of the consumer before the stage blocks
+        upstream: The stage `items` consumes, so time spent waiting on it is
+            not counted as busy time
+        size: Number of units an item counts as in the stats (default 1)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        items: Iterable,
+        max_queued: int,
+        upstream: Optional["PipelineStage"] = None,
+        size: Callable[[Any], int] = None
+    ):
+        self.stats = StageStats(name)
+        self.consumer_wait_seconds = 0.0
+        self._items = items
+        self._upstream = upstream
+        self._size = size or (lambda item: 1)
+        self._queue = queue.Queue(maxsize=max(1, max_queued))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"ingest-{name}", daemon=True)
+        self._thread.start()
+
+    def _put(self, entry) -> bool:
+        """Queue an entry, giving up if the pipeline is closed. Returns False if it was"""
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(entry, timeout=0.1)
+                self.stats.output_wait_seconds += time.perf_counter() - start
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            iterator = iter(self._items)
+            while True:
+                start = time.perf_counter()
+                upstream_wait = self._upstream.consumer_wait_seconds if self._upstream else 0.0
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    waited = (self._upstream.consumer_wait_seconds - upstream_wait) if self._upstream else 0.0
+                    self.stats.input_wait_seconds += waited
+                    self.stats.busy_seconds += time.perf_counter() - start - waited
+                self.stats.items += self._size(item)
+                if not self._put((_ITEM, item)):
+                    return
+        except BaseException as e:
+            self._put((_ERROR, e))
+            return
+        finally:
+            # Let the stage's generator release its resources (files, worker pools)
+            close = getattr(self._items, "close", None)
+            if close is not None and self._stop.is_set():
+                close()
+        self._put((_DONE, None))
+
+    def __iter__(self) -> Iterator:
+        while True:
+            start = time.perf_counter()
+            try:
+                kind, value = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                # A closed stage may never queue another entry
+                if self._stop.is_set():
+                    return
+                continue
+            finally:
+                self.consumer_wait_seconds += time.perf_counter() - start
+            if kind == _DONE:
+                return
+            if kind == _ERROR:
+                raise value
+            yield value
+
+    def close(self):
+        """Stop the stage after its current item, e.g. when a later stage failed"""
+        self._stop.set()
+
+    def join(self, timeout: Optional[float] = None):
+        """Wait for the stage's thread to finish, e.g. after close()"""
+        self._thread.join(timeout)
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Group items into lists of up to size items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
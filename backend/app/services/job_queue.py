@@ -0,0 +1,189 @@
+# backend/app/services/job_queue.py
+"""
+Durable document processing queue. Jobs live in the processing_jobs table, so
+they survive restarts; a pool of worker threads claims them by priority,
+retries failures with exponential backoff and records progress per page.
+
+Run a standalone worker (e.g. with JOB_WORKERS=0 in the API process):
+    python -m app.services.job_queue --workers 4
+"""
+import os
+import time
+import uuid
+import socket
+import argparse
+import threading
+from typing import Optional, Set
+
+from app.core import config
+from app.core.database import (
+    enqueue_job,
+    claim_next_job,
+    update_job_progress,
+    touch_jobs,
+    finish_job,
+    requeue_stale_jobs,
+    get_unqueued_documents,
+    get_document
+)
+from app.services.document_processing import process_document
+from app.services.text_extraction import set_concurrent_documents
+
+# Higher runs first
+PRIORITY_BACKFILL = 0
+PRIORITY_UPLOAD = 10
+PRIORITY_INTERACTIVE = 20
+
+_pool = None
+
+class JobWorkerPool:
+    """Worker threads processing queued jobs, plus a heartbeat thread for the jobs they run"""
+
+    def __init__(
+        self,
+        workers: int = config.JOB_WORKERS,
+        poll_seconds: float = config.JOB_POLL_SECONDS,
+        heartbeat_seconds: float = config.JOB_HEARTBEAT_SECONDS,
+        stale_seconds: float = config.JOB_STALE_SECONDS
+    ):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        # Unique per process, so a restarted process with the same PID is told apart
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running: Set[int] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(index,), name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        print(f"Job worker pool {self.name} started with {self.workers} workers")
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stop claiming jobs and wait up to timeout seconds in total for the
+        running ones (jobs cut off are recovered later)
+        """
+        self._stop.set()
+        self._wake.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def notify(self):
+        """Wake idle workers, e.g. after a job was queued"""
+        self._wake.set()
+
+    def _work(self, index: int):
+        worker = f"{self.name}/{index}"
+        while not self._stop.is_set():
+            try:
+                job = claim_next_job(worker)
+            except Exception as e:
+                print(f"Error claiming a processing job: {str(e)}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job_id, doc_id = job["id"], job["doc_id"]
+        with self._lock:
+            self._running.add(job_id)
+        print(f"Job {job_id}: processing document {doc_id} (attempt {job['attempts']}/{job['max_attempts']})")
+        try:
+            error = None
+            if not process_document(doc_id, on_progress=lambda done, total: update_job_progress(job_id, done, total)):
+                document = get_document(doc_id)
+                error = (document or {}).get("processing_error") or f"Document {doc_id} could not be processed"
+        except Exception as e:
+            error = str(e)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+        if error is None:
+            finish_job(job_id)
+            print(f"Job {job_id}: done")
+        else:
+            delay = config.JOB_RETRY_BACKOFF * (2 ** (job["attempts"] - 1))
+            finish_job(job_id, error, retry_delay=delay)
+            if job["attempts"] < job["max_attempts"]:
+                print(f"Job {job_id}: failed ({error}), retrying in {delay:.0f}s")
+            else:
+                print(f"Job {job_id}: failed ({error}), giving up")
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                with self._lock:
+                    running = list(self._running)
+                touch_jobs(running)
+                # Pick up jobs of workers that died in other processes
+                if requeue_stale_jobs(time.time() - self.stale_seconds):
+                    self.notify()
+            except Exception as e:
+                print(f"Error updating processing job heartbeats: {str(e)}")
+
+def recover_jobs() -> int:
+    """
+    Queue interrupted work again: running jobs whose heartbeat is stale, and
+    unprocessed documents without a job (e.g. queued before the job table
+    existed). Returns the number of jobs queued.
+    """
+    count = requeue_stale_jobs(time.time() - config.JOB_STALE_SECONDS)
+    for doc_id in get_unqueued_documents():
+        enqueue_job(doc_id, PRIORITY_BACKFILL, config.JOB_MAX_ATTEMPTS)
+        count += 1
+    if count:
+        print(f"Queued {count} interrupted processing jobs")
+    return count
+
+def submit_document(doc_id: int, priority: int = PRIORITY_UPLOAD) -> int:
+    """Queue a document for processing and return the job ID"""
+    job_id = enqueue_job(doc_id, priority, config.JOB_MAX_ATTEMPTS)
+    if _pool is not None:
+        _pool.notify()
+    return job_id
+
+def start_workers(workers: int = config.JOB_WORKERS) -> Optional[JobWorkerPool]:
+    """Recover interrupted jobs and start this process's worker pool (none if workers is 0)"""
+    global _pool
+    recover_jobs()
+    if workers <= 0 or _pool is not None:
+        return _pool
+    # Each worker runs its own extraction pool, so they split the cores
+    set_concurrent_documents(workers)
+    _pool = JobWorkerPool(workers)
+    _pool.start()
+    return _pool
+
+def stop_workers(timeout: Optional[float] = None):
+    global _pool
+    if _pool is not None:
+        _pool.stop(timeout)
+        _pool = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued documents")
+    parser.add_argument("--workers", type=int, default=max(config.JOB_WORKERS, 1))
+    args = parser.parse_args()
+
+    start_workers(args.workers)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Stopping, waiting for running jobs")
+        stop_workers()
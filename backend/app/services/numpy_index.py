@@ -0,0 +1,520 @@
+# backend/app/services/numpy_index.py
+import os
+import json
+import time
+import shutil
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from app.core import config
+from app.core.cache import LRUCache
+from app.services.quantization import (
+    ScalarQuantizer,
+    ProductQuantizer,
+    load_quantizer,
+    get_pq_codebook_path
+)
+
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.json"
+CODES_FILE = "codes.u8"
+QUANTIZER_FILE = "quantizer.npz"
+# Chunk texts (one JSON string per line) while an IndexWriter is still writing
+TEXTS_FILE = "texts.jsonl"
+# Vectors are encoded this many rows at a time when codes are written
+ENCODE_BLOCK_ROWS = 4096
+# Each write goes to a new version directory (index.<version>) next to the page
+# data, and the pointer file naming the current one is swapped in last
+VERSION_PREFIX = "index."
+POINTER_FILE = "index.current"
+
+class DocumentIndex:
+    """
+    Exact-search index of one document: a memory-mapped (n, dim) float32
+    matrix of normalized chunk vectors plus column lists of chunk metadata.
+    With quantization enabled, compact in-memory codes are scanned instead
+    and the float32 matrix on disk is only read to re-score the best candidates.
+    """
+
+    def __init__(self, doc_id: int, vectors: np.ndarray, chunks: Dict, codes: np.ndarray = None, quantizer=None):
+        self.doc_id = doc_id
+        # Identity of the files it was read from, see _file_stamp
+        self.stamp = None
+        self.vectors = vectors
+        self.chunks = chunks
+        self.codes = codes
+        self.quantizer = quantizer
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Dot products with the query, approximate if the index is quantized"""
+        if self.codes is not None:
+            return self.quantizer.score(self.codes, query)
+        return self.vectors @ query
+
+    def to_document(self, row: int) -> Document:
+        return Document(
+            page_content=self.chunks["texts"][row],
+            metadata={
+                "doc_id": self.doc_id,
+                "page": self.chunks["pages"][row],
+                "paragraph": self.chunks["paragraphs"][row],
+                "content_hash": self.chunks["content_hashes"][row],
+                "chunk_id": self.chunks["ids"][row]
+            }
+        )
+
+def _index_size(index: DocumentIndex) -> int:
+    """Approximate resident size: chunk text plus the codes or the (OS paged) vector matrix"""
+    vectors = index.codes if index.codes is not None else index.vectors
+    return sum(len(text) for text in index.chunks["texts"]) + vectors.nbytes
+
+# Loaded indexes keyed by index directory, bounded by approximate bytes
+_index_cache = LRUCache(
+    "numpy_indexes",
+    max_entries=config.NUMPY_INDEX_CACHE_SIZE,
+    max_weight=config.NUMPY_INDEX_CACHE_MAX_BYTES,
+    weigher=_index_size
+)
+
+@lru_cache(maxsize=4)
+def _load_pq_codebook(path: str):
+    """The PQ codebook is shared by every document, so it is loaded once"""
+    return load_quantizer(path)
+
+def get_index_dir(doc_id: int, base_dir: Optional[str] = None) -> str:
+    """Directory holding a document's page data and vector files"""
+    return os.path.join(base_dir or config.EMBEDDING_DIR, f"doc_{doc_id}")
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of a float32 matrix in place"""
+    if vectors.size:
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    return vectors
+
+def _write_codes(version_dir: str, matrix: np.ndarray, base_dir: Optional[str]) -> Optional[str]:
+    """Write quantized codes for the configured quantization, returns its kind if codes were written"""
+    kind = config.VECTOR_QUANTIZATION
+    if kind == "none" or not matrix.size:
+        return None
+
+    if kind == "int8":
+        quantizer = ScalarQuantizer.fit(matrix)
+        quantizer.save(os.path.join(version_dir, QUANTIZER_FILE))
+    elif kind == "pq":
+        quantizer = _load_pq_codebook(get_pq_codebook_path(base_dir))
+        if quantizer is None:
+            print("No PQ codebook trained yet, searching full-precision vectors (run python -m app.services.numpy_index --quantize)")
+            return None
+    else:
+        raise ValueError(f"Unknown vector quantization: {kind}")
+
+    with open(os.path.join(version_dir, CODES_FILE), "wb") as f:
+        for start in range(0, matrix.shape[0], ENCODE_BLOCK_ROWS):
+            quantizer.encode(np.asarray(matrix[start:start + ENCODE_BLOCK_ROWS])).tofile(f)
+    return kind
+
+def _new_version_dir(index_dir: str) -> str:
+    """Create an empty, not yet visible version directory of a document's index"""
+    version_dir = os.path.join(index_dir, f"{VERSION_PREFIX}{time.time_ns()}.{os.getpid()}")
+    os.makedirs(version_dir)
+    return version_dir
+
+def _current_version_dir(index_dir: str) -> Optional[str]:
+    """Directory of the current index version (index_dir itself for indexes written before versions)"""
+    try:
+        with open(os.path.join(index_dir, POINTER_FILE)) as f:
+            return os.path.join(index_dir, f.read().strip())
+    except FileNotFoundError:
+        return index_dir if os.path.exists(os.path.join(index_dir, CHUNKS_FILE)) else None
+
+def _publish_version(index_dir: str, version_dir: str):
+    """
+    Make a fully written version directory the current index by swapping the
+    pointer file, so readers see either every old file or every new one.
+    The previous version is kept for readers that resolved the pointer just
+    before the swap; older ones and files of the unversioned layout are removed.
+    """
+    pointer_path = os.path.join(index_dir, POINTER_FILE)
+    previous = _current_version_dir(index_dir)
+    with open(pointer_path + ".tmp", "w") as f:
+        f.write(os.path.basename(version_dir))
+    os.replace(pointer_path + ".tmp", pointer_path)
+    # After the swap, so a concurrent query cannot cache the old files again
+    _index_cache.invalidate(os.path.abspath(index_dir))
+
+    keep = {os.path.basename(version_dir), os.path.basename(previous or "")}
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name.startswith(VERSION_PREFIX) and name != POINTER_FILE and name not in keep and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif name in (VECTORS_FILE, CHUNKS_FILE, CODES_FILE, QUANTIZER_FILE):
+            os.remove(path)
+
+def _write_index_files(index_dir: str, matrix: np.ndarray, chunks: Dict, base_dir: Optional[str]):
+    version_dir = _new_version_dir(index_dir)
+    matrix.tofile(os.path.join(version_dir, VECTORS_FILE))
+    chunks["quantization"] = _write_codes(version_dir, matrix, base_dir)
+    with open(os.path.join(version_dir, CHUNKS_FILE), "w") as f:
+        json.dump(chunks, f)
+    _publish_version(index_dir, version_dir)
+
+class IndexWriter:
+    """
+    Writes a document's index batch by batch into a new version directory.
+    Vectors are appended to vectors.f32 and chunk texts to a scratch file as
+    they arrive, so only the small metadata columns are kept in memory.
+    publish() adds the codes and chunks.json and swaps the version in;
+    discard() drops it.
+    """
+
+    def __init__(self, doc_id: int, model_name: str, base_dir: Optional[str] = None):
+        self.doc_id = doc_id
+        self.model_name = model_name
+        self.base_dir = base_dir
+        self.index_dir = get_index_dir(doc_id, base_dir)
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.version_dir = _new_version_dir(self.index_dir)
+        self.dim = 0
+        self.published = False
+        self.columns = {"ids": [], "content_hashes": [], "pages": [], "paragraphs": []}
+        self._vectors_file = open(os.path.join(self.version_dir, VECTORS_FILE), "wb")
+        self._texts_file = open(os.path.join(self.version_dir, TEXTS_FILE), "w")
+
+    def __len__(self) -> int:
+        return len(self.columns["ids"])
+
+    def add(self, docs: List[Document], vectors: List[List[float]]):
+        """Append a batch of chunks with their vectors"""
+        if not docs:
+            return
+        matrix = normalize_rows(np.array(vectors, dtype=np.float32).reshape(len(docs), -1))
+        if self.dim and matrix.shape[1] != self.dim:
+            raise ValueError(f"Vector size changed from {self.dim} to {matrix.shape[1]}")
+        self.dim = matrix.shape[1]
+        matrix.tofile(self._vectors_file)
+        for doc in docs:
+            self.columns["ids"].append(doc.metadata["chunk_id"])
+            self.columns["content_hashes"].append(doc.metadata["content_hash"])
+            self.columns["pages"].append(doc.metadata["page"])
+            self.columns["paragraphs"].append(doc.metadata["paragraph"])
+            self._texts_file.write(json.dumps(doc.page_content) + "\n")
+
+    def vectors(self) -> np.ndarray:
+        """The normalized vectors added so far, memory-mapped from disk"""
+        if not self._vectors_file.closed:
+            self._vectors_file.flush()
+        if not len(self):
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(
+            os.path.join(self.version_dir, VECTORS_FILE), dtype=np.float32, mode="r", shape=(len(self), self.dim)
+        )
+
+    def publish(self):
+        """Finish the files and make this version the document's index"""
+        self._vectors_file.close()
+        self._texts_file.close()
+        header = {
+            "model": self.model_name,
+            "dim": int(self.dim),
+            **self.columns,
+            "quantization": _write_codes(self.version_dir, self.vectors(), self.base_dir)
+        }
+
+        # chunks.json is the header with the texts column streamed in from the scratch file
+        texts_path = os.path.join(self.version_dir, TEXTS_FILE)
+        with open(os.path.join(self.version_dir, CHUNKS_FILE), "w") as f, open(texts_path) as texts:
+            f.write(json.dumps(header)[:-1] + ', "texts": [')
+            for row, line in enumerate(texts):
+                f.write((", " if row else "") + line.rstrip("\n"))
+            f.write("]}")
+        os.remove(texts_path)
+        _publish_version(self.index_dir, self.version_dir)
+        self.published = True
+
+    def discard(self):
+        """Drop the version, unless it was published"""
+        self._vectors_file.close()
+        self._texts_file.close()
+        if self.published:
+            return
+        shutil.rmtree(self.version_dir, ignore_errors=True)
+
+def write_document_index(
+    doc_id: int,
+    docs: List[Document],
+    vectors: List[List[float]],
+    model_name: str,
+    base_dir: Optional[str] = None
+):
+    """
+    Write a document's chunk vectors and metadata, replacing any previous index.
+    The files are written to a new version directory that is swapped in atomically.
+    A document without text still gets an (empty) index replacing its old one.
+    """
+    writer = IndexWriter(doc_id, model_name, base_dir)
+    try:
+        writer.add(docs, vectors)
+        writer.publish()
+    except Exception:
+        writer.discard()
+        raise
+
+def _file_stamp(version_dir: str) -> Optional[Tuple]:
+    """
+    Identity of an index version: inode and mtime of every index file, None if
+    they are missing. A new version (written by any process) has new files.
+    """
+    stats = []
+    for name in (VECTORS_FILE, CHUNKS_FILE, CODES_FILE, QUANTIZER_FILE):
+        try:
+            st = os.stat(os.path.join(version_dir, name))
+            stats.append((st.st_ino, st.st_mtime_ns))
+        except FileNotFoundError:
+            if name in (VECTORS_FILE, CHUNKS_FILE):
+                return None
+            stats.append(None)
+    return (version_dir, *stats)
+
+def _read_version(doc_id: int, index_dir: str, version_dir: str) -> Optional[DocumentIndex]:
+    vectors_path = os.path.join(version_dir, VECTORS_FILE)
+    chunks_path = os.path.join(version_dir, CHUNKS_FILE)
+    stamp = _file_stamp(version_dir)
+    if stamp is None:
+        return None
+
+    with open(chunks_path, "r") as f:
+        chunks = json.load(f)
+
+    count, dim = len(chunks["ids"]), chunks["dim"]
+    if count == 0 or dim == 0:
+        index = DocumentIndex(doc_id, np.zeros((0, dim), dtype=np.float32), chunks)
+        index.stamp = stamp
+        return index
+
+    vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(count, dim))
+
+    # Codes written for another quantization setting are ignored
+    codes, quantizer = None, None
+    kind = chunks.get("quantization")
+    if kind and kind == config.VECTOR_QUANTIZATION:
+        if kind == "pq":
+            quantizer = _load_pq_codebook(get_pq_codebook_path(os.path.dirname(index_dir)))
+        else:
+            quantizer = load_quantizer(os.path.join(version_dir, QUANTIZER_FILE))
+        if quantizer is not None:
+            codes = np.fromfile(os.path.join(version_dir, CODES_FILE), dtype=np.uint8)
+            codes = codes.reshape(count, quantizer.code_width())
+
+    index = DocumentIndex(doc_id, vectors, chunks, codes, quantizer)
+    index.stamp = stamp
+    return index
+
+def _read_document_index(doc_id: int, index_dir: str) -> Optional[DocumentIndex]:
+    # A version can be removed between reading the pointer and opening its
+    # files (two newer versions were published meanwhile): read the pointer again
+    for _ in range(3):
+        version_dir = _current_version_dir(index_dir)
+        if version_dir is None:
+            return None
+        try:
+            return _read_version(doc_id, index_dir, version_dir)
+        except FileNotFoundError:
+            continue
+    return None
+
+def _current_stamp(index_dir: str) -> Optional[Tuple]:
+    version_dir = _current_version_dir(index_dir)
+    return _file_stamp(version_dir) if version_dir is not None else None
+
+def load_document_index(doc_id: int, base_dir: Optional[str] = None) -> Optional[DocumentIndex]:
+    """Load (or get the cached) index of a document, None if it has none"""
+    index_dir = get_index_dir(doc_id, base_dir)
+    key = os.path.abspath(index_dir)
+    index = _index_cache.get_or_create(key, lambda: _read_document_index(doc_id, index_dir))
+    if index is not None and index.stamp != _current_stamp(index_dir):
+        # Rewritten since it was cached, possibly by another process
+        _index_cache.invalidate(key)
+        index = _index_cache.get_or_create(key, lambda: _read_document_index(doc_id, index_dir))
+    return index
+
+def get_stored_vectors(doc_id: int, base_dir: Optional[str] = None) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    """Return (chunk IDs, vectors keyed by content hash) currently stored for a document"""
+    index = load_document_index(doc_id, base_dir)
+    if index is None:
+        return [], {}
+
+    vectors_by_hash = {
+        content_hash: index.vectors[row]
+        for row, content_hash in enumerate(index.chunks["content_hashes"])
+    }
+    return list(index.chunks["ids"]), vectors_by_hash
+
+def get_chunk_vectors(doc_id: int, chunk_ids: List[str], base_dir: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Stored full-precision vectors of some of a document's chunks, keyed by chunk ID"""
+    index = load_document_index(doc_id, base_dir)
+    if index is None:
+        return {}
+    wanted = set(chunk_ids)
+    return {
+        chunk_id: np.asarray(index.vectors[row])
+        for row, chunk_id in enumerate(index.chunks["ids"])
+        if chunk_id in wanted
+    }
+
+def _top_rows(scores: np.ndarray, count: int) -> np.ndarray:
+    """Positions of the count highest scores, unordered"""
+    count = min(count, scores.shape[0])
+    if count <= 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.argpartition(-scores, count - 1)[:count]
+
+def search_chunks(
+    query_embedding: List[float],
+    doc_ids: List[int],
+    n_results: int,
+    base_dir: Optional[str] = None,
+    per_doc: Optional[int] = None
+) -> List[Tuple[Document, float]]:
+    """
+    Exact cosine search over every selected document at once. With per_doc,
+    the best per_doc chunks of every document are selected from the same scores.
+
+    Returns:
+        List of (chunk, similarity) tuples, best match first
+    """
+    query = normalize_rows(np.array([query_embedding], dtype=np.float32))[0]
+
+    indexes = []
+    for doc_id in doc_ids:
+        index = load_document_index(doc_id, base_dir)
+        if index is None or not len(index):
+            continue
+        if index.dim != query.shape[0]:
+            print(f"Skipping document {doc_id}: index dim {index.dim} does not match query dim {query.shape[0]}")
+            continue
+        indexes.append(index)
+
+    if not indexes or n_results <= 0:
+        return []
+
+    scores = np.concatenate([index.scores(query) for index in indexes])
+    offsets = np.cumsum([0] + [len(index) for index in indexes])
+    quantized = any(index.codes is not None for index in indexes)
+
+    # Over-fetch from approximate scores, then re-score against the float32 vectors
+    n = min(n_results, scores.shape[0])
+    factor = config.RERANK_FACTOR if quantized else 1
+    if per_doc is not None:
+        top = np.concatenate([
+            offsets[owner] + _top_rows(scores[offsets[owner]:offsets[owner + 1]], per_doc * factor)
+            for owner in range(len(indexes))
+        ])
+    else:
+        top = _top_rows(scores, n * factor)
+    owners = np.searchsorted(offsets, top, side="right") - 1
+
+    top_scores = scores[top]
+    if quantized:
+        for owner in np.unique(owners):
+            mask = owners == owner
+            rows = top[mask] - offsets[owner]
+            top_scores[mask] = indexes[owner].vectors[rows] @ query
+
+    results = []
+    taken = np.zeros(len(indexes), dtype=np.int64)
+    for i in np.argsort(-top_scores):
+        owner = owners[i]
+        if per_doc is not None and taken[owner] >= per_doc:
+            continue
+        taken[owner] += 1
+        results.append((indexes[owner].to_document(int(top[i] - offsets[owner])), float(top_scores[i])))
+        if len(results) >= n:
+            break
+    return results
+
+def export_from_chroma(collection, doc_ids: List[int], model_name: str, base_dir: Optional[str] = None) -> int:
+    """
+    Build NumPy indexes from the chunks stored in a Chroma collection.
+    Returns the number of exported documents.
+    """
+    exported = 0
+    for doc_id in doc_ids:
+        data = collection.get(where={"doc_id": doc_id}, include=["embeddings", "documents", "metadatas"])
+        if not len(data["ids"]):
+            continue
+
+        docs = []
+        for chunk_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"]):
+            docs.append(Document(
+                page_content=text,
+                metadata={
+                    **metadata,
+                    "chunk_id": metadata.get("chunk_id", chunk_id),
+                    "content_hash": metadata.get("content_hash", "")
+                }
+            ))
+        write_document_index(doc_id, docs, data["embeddings"], model_name, base_dir)
+        exported += 1
+
+    return exported
+
+def quantize_documents(doc_ids: List[int], base_dir: Optional[str] = None) -> int:
+    """
+    (Re)write the quantized codes of existing indexes for the configured
+    quantization. For "pq" the corpus-wide codebook is trained first on a
+    sample of the stored vectors. Returns the number of re-encoded documents.
+    """
+    if config.VECTOR_QUANTIZATION == "pq":
+        rng = np.random.default_rng(0)
+        samples = []
+        for doc_id in doc_ids:
+            index = load_document_index(doc_id, base_dir)
+            if index is not None and len(index):
+                samples.append(np.asarray(index.vectors))
+        if not samples:
+            return 0
+
+        sample = np.vstack(samples)
+        if sample.shape[0] > config.PQ_TRAINING_SAMPLE:
+            sample = sample[rng.choice(sample.shape[0], config.PQ_TRAINING_SAMPLE, replace=False)]
+        print(f"Training PQ codebook on {sample.shape[0]} vectors")
+        ProductQuantizer.train(sample).save(get_pq_codebook_path(base_dir))
+        _load_pq_codebook.cache_clear()
+
+    encoded = 0
+    for doc_id in doc_ids:
+        index = load_document_index(doc_id, base_dir)
+        if index is None or not len(index):
+            continue
+        _write_index_files(get_index_dir(doc_id, base_dir), np.array(index.vectors), dict(index.chunks), base_dir)
+        encoded += 1
+
+    return encoded
+
+if __name__ == "__main__":
+    import argparse
+    from app.core.database import get_all_documents
+
+    parser = argparse.ArgumentParser(description="Build NumPy indexes")
+    parser.add_argument("--quantize", action="store_true", help="Re-encode existing indexes for VECTOR_QUANTIZATION")
+    args = parser.parse_args()
+
+    doc_ids = [doc["id"] for doc in get_all_documents() if doc["is_processed"]]
+    if args.quantize:
+        count = quantize_documents(doc_ids)
+        print(f"Quantized {count} documents ({config.VECTOR_QUANTIZATION})")
+    else:
+        from app.services.embedding_service import get_shared_vector_store, get_embedding_model_name
+
+        count = export_from_chroma(get_shared_vector_store()._collection, doc_ids, get_embedding_model_name())
+        print(f"Exported {count} documents to NumPy indexes")
@@ -0,0 +1,94 @@
+# backend/app/services/onnx_embedding.py
+import os
+from typing import List
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from app.core import config
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Local MiniLM-class sentence embeddings with ONNX Runtime on CPU.
+
+    Expects a model directory holding `model.onnx` (a sentence-transformers
+    export) and the matching `tokenizer.json`. Vectors are mean-pooled over
+    the attention mask and L2-normalized float32.
+    """
+
+    def __init__(
+        self,
+        model_dir: str = config.ONNX_MODEL_DIR,
+        batch_size: int = config.ONNX_BATCH_SIZE,
+        num_threads: int = config.ONNX_NUM_THREADS,
+        max_length: int = config.ONNX_MAX_SEQ_LENGTH
+    ):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, "model.onnx")
+        tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+        if not os.path.exists(model_path) or not os.path.exists(tokenizer_path):
+            raise FileNotFoundError(
+                f"ONNX embedding model not found: expected model.onnx and tokenizer.json in {model_dir}"
+            )
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = max(1, num_threads)
+        # Concurrency comes from the batches in flight, not from parallel graph branches
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        output = self.session.run(None, feeds)[0]
+
+        if output.ndim == 3:
+            # Token embeddings: mean-pool over real (non-padding) tokens
+            mask = attention_mask[..., None].astype(np.float32)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        output = output.astype(np.float32, copy=False)
+        output /= np.clip(np.linalg.norm(output, axis=1, keepdims=True), 1e-12, None)
+        return output
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into an (n, dim) float32 matrix, in input order"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Batch texts of similar length together to keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = []
+        for start in range(0, len(order), self.batch_size):
+            batch_idx = order[start:start + self.batch_size]
+            batches.append(self._embed_batch([texts[i] for i in batch_idx]))
+
+        sorted_vectors = np.vstack(batches)
+        vectors = np.empty_like(sorted_vectors)
+        vectors[order] = sorted_vectors
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
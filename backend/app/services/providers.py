@@ -0,0 +1,355 @@
+# backend/app/services/providers.py
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List, Dict, Iterator, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema.messages import AIMessage, AIMessageChunk
+
+from app.core import config
+
+MODEL_PROVIDERS = ("live", "stub", "record", "replay")
+
+class ModelProvider(ABC):
+    """
+    Source of the chat LLM and embedding model used by the pipeline. A
+    provider missing one of the methods cannot be instantiated.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def get_llm(self):
+        """Chat model with invoke(prompt) and stream(prompt) returning messages with .content"""
+
+    @abstractmethod
+    def get_embedding_model(self) -> Embeddings:
+        """Embedding model (LangChain Embeddings)"""
+
+    @abstractmethod
+    def get_embedding_model_name(self) -> str:
+        """Name of the embedding model, used to key stored and cached vectors"""
+
+class LiveProvider(ModelProvider):
+    """Gemini chat model and the embedding model selected by EMBEDDING_BACKEND"""
+
+    name = "live"
+
+    def get_llm(self):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(
+            model=config.LLM_MODEL,
+            temperature=config.LLM_TEMPERATURE,
+            google_api_key=config.GOOGLE_API_KEY,
+            timeout=config.LLM_ANSWER_TIMEOUT
+        )
+
+    def get_embedding_model(self) -> Embeddings:
+        if config.EMBEDDING_BACKEND == "onnx":
+            from app.services.onnx_embedding import OnnxEmbeddings
+
+            return OnnxEmbeddings()
+        if config.EMBEDDING_BACKEND != "gemini":
+            raise ValueError(f"Unknown embedding backend: {config.EMBEDDING_BACKEND}")
+
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        return GoogleGenerativeAIEmbeddings(model=config.GOOGLE_EMBEDDING_MODEL, google_api_key=config.GOOGLE_API_KEY)
+
+    def get_embedding_model_name(self) -> str:
+        if config.EMBEDDING_BACKEND == "onnx":
+            return f"onnx:{config.EMBEDDING_MODEL}"
+        return config.GOOGLE_EMBEDDING_MODEL
+
+# Stub provider
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+class StubEmbeddings(Embeddings):
+    """Deterministic hash-seeded unit vectors: the same text always gets the same vector"""
+
+    def __init__(self, dim: int = config.STUB_EMBEDDING_DIM, latency: float = config.STUB_EMBEDDING_LATENCY):
+        self.dim = dim
+        self.latency = latency
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int(_digest(" ".join(text.casefold().split()))[:16], 16)
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._vector(text)
+
+class StubChatModel:
+    """
+    Deterministic chat model answering from templates. It recognises the
+    pipeline's prompts (per-document answer, packed JSON answers, theme
+    synthesis, theme cluster labels) so the output parses like a real model's.
+    """
+
+    model = "stub"
+
+    def __init__(self, latency: float = config.STUB_LLM_LATENCY, temperature: float = config.LLM_TEMPERATURE):
+        self.latency = latency
+        self.temperature = temperature
+
+    def respond(self, prompt: str) -> str:
+        digest = _digest(prompt)[:8]
+
+        packed = re.search(r"JSON object mapping each of these document names.*?(\[.*\])", prompt, re.S)
+        if packed:
+            names = json.loads(packed.group(1))
+            return json.dumps({name: f"Stub answer for {name} ({digest})" for name in names})
+
+        labels = re.search(r"JSON list of (\d+) objects", prompt)
+        if labels:
+            return json.dumps([
+                {"theme": f"Stub theme {i} ({digest})", "description": "Deterministic cluster label"}
+                for i in range(1, int(labels.group(1)) + 1)
+            ])
+
+        if "THEME:" in prompt:
+            documents = re.findall(r"^\s*Document: (.+)$", prompt, re.M)
+            return (
+                f"THEME: Stub theme {digest}\n"
+                f"DOCUMENTS: {', '.join(documents)}\n"
+                f"DESCRIPTION: Deterministic theme over {len(documents)} document responses"
+            )
+
+        question = re.search(r"Question: (.*)", prompt)
+        citations = re.findall(r"\[Page \d+, Paragraph \d+\]", prompt)[:2]
+        return f"Stub answer to \"{question.group(1).strip() if question else ''}\" {' '.join(citations)} ({digest})"
+
+    def invoke(self, prompt: str) -> AIMessage:
+        if self.latency:
+            time.sleep(self.latency)
+        return AIMessage(content=self.respond(prompt))
+
+    def stream(self, prompt: str) -> Iterator[AIMessageChunk]:
+        if self.latency:
+            time.sleep(self.latency)
+        for piece in re.findall(r"\S+\s*", self.respond(prompt)):
+            yield AIMessageChunk(content=piece)
+
+class StubProvider(ModelProvider):
+    """Local stand-in with configurable simulated latency, for load tests and profiling"""
+
+    name = "stub"
+
+    def get_llm(self):
+        return StubChatModel()
+
+    def get_embedding_model(self) -> Embeddings:
+        return StubEmbeddings()
+
+    def get_embedding_model_name(self) -> str:
+        return f"stub:hash-{config.STUB_EMBEDDING_DIM}"
+
+# Record / replay
+
+class RecordingStore:
+    """Recorded responses as JSON files under a directory, keyed by a hash of the request"""
+
+    def __init__(self, root: str = config.RECORDINGS_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.root, kind, key[:2], f"{key}.json")
+
+    def load(self, kind: str, key: str) -> Optional[Dict]:
+        path = self._path(kind, key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save(self, kind: str, key: str, record: Dict):
+        path = self._path(kind, key)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(record, f)
+            os.replace(path + ".tmp", path)
+
+def _llm_key(model: str, temperature, prompt: str) -> str:
+    return _digest("llm", str(model), str(temperature), prompt)
+
+def _embedding_key(model_name: str, kind: str, text: str) -> str:
+    return _digest("embedding", model_name, kind, text)
+
+class RecordingChatModel:
+    """Wraps a chat model and saves every prompt and response"""
+
+    def __init__(self, llm, store: RecordingStore):
+        self.llm = llm
+        self.store = store
+        # Keyed by the configured settings, which is what ReplayChatModel looks up
+        self.model = config.LLM_MODEL
+        self.temperature = config.LLM_TEMPERATURE
+
+    def _save(self, prompt: str, response: str, started: float):
+        self.store.save("llm", _llm_key(self.model, self.temperature, prompt), {
+            "prompt": prompt,
+            "response": response,
+            "latency": time.perf_counter() - started
+        })
+
+    def invoke(self, prompt: str) -> AIMessage:
+        started = time.perf_counter()
+        result = self.llm.invoke(prompt)
+        response = result.content if hasattr(result, "content") else result
+        self._save(prompt, response, started)
+        return AIMessage(content=response)
+
+    def stream(self, prompt: str) -> Iterator[AIMessageChunk]:
+        started = time.perf_counter()
+        pieces = []
+        for piece in self.llm.stream(prompt):
+            text = piece.content if hasattr(piece, "content") else piece
+            pieces.append(text)
+            yield AIMessageChunk(content=text)
+        self._save(prompt, "".join(pieces), started)
+
+class RecordingEmbeddings(Embeddings):
+    """Wraps an embedding model and saves every vector it returns"""
+
+    def __init__(self, embeddings: Embeddings, model_name: str, store: RecordingStore):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.store = store
+
+    def _save(self, kind: str, text: str, vector: List[float], latency: float):
+        self.store.save("embeddings", _embedding_key(self.model_name, kind, text), {
+            "text": text,
+            "vector": [float(value) for value in vector],
+            "latency": latency
+        })
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        started = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        latency = (time.perf_counter() - started) / max(len(texts), 1)
+        for text, vector in zip(texts, vectors):
+            self._save("document", text, vector, latency)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        started = time.perf_counter()
+        vector = self.embeddings.embed_query(text)
+        self._save("query", text, vector, time.perf_counter() - started)
+        return vector
+
+class ReplayChatModel:
+    """Answers from recordings; a prompt that was never recorded raises LookupError"""
+
+    def __init__(self, store: RecordingStore, with_latency: bool = config.REPLAY_WITH_LATENCY):
+        self.store = store
+        self.with_latency = with_latency
+        self.model = config.LLM_MODEL
+        self.temperature = config.LLM_TEMPERATURE
+
+    def _response(self, prompt: str) -> str:
+        record = self.store.load("llm", _llm_key(self.model, self.temperature, prompt))
+        if record is None:
+            raise LookupError("No recorded LLM response for this prompt (record it with MODEL_PROVIDER=record)")
+        if self.with_latency:
+            time.sleep(record["latency"])
+        return record["response"]
+
+    def invoke(self, prompt: str) -> AIMessage:
+        return AIMessage(content=self._response(prompt))
+
+    def stream(self, prompt: str) -> Iterator[AIMessageChunk]:
+        for piece in re.findall(r"\S+\s*", self._response(prompt)):
+            yield AIMessageChunk(content=piece)
+
+class ReplayEmbeddings(Embeddings):
+    """Vectors from recordings; a text that was never recorded raises LookupError"""
+
+    def __init__(self, model_name: str, store: RecordingStore, with_latency: bool = config.REPLAY_WITH_LATENCY):
+        self.model_name = model_name
+        self.store = store
+        self.with_latency = with_latency
+
+    def _vector(self, kind: str, text: str) -> List[float]:
+        record = self.store.load("embeddings", _embedding_key(self.model_name, kind, text))
+        if record is None:
+            raise LookupError(f"No recorded {kind} embedding for this text (record it with MODEL_PROVIDER=record)")
+        if self.with_latency:
+            time.sleep(record["latency"])
+        return record["vector"]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector("document", text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector("query", text)
+
+class RecordingProvider(ModelProvider):
+    """The live provider, saving every response to RECORDINGS_DIR"""
+
+    name = "record"
+
+    def __init__(self, inner: ModelProvider = None, store: RecordingStore = None):
+        self.inner = inner or LiveProvider()
+        self.store = store or RecordingStore()
+
+    def get_llm(self):
+        return RecordingChatModel(self.inner.get_llm(), self.store)
+
+    def get_embedding_model(self) -> Embeddings:
+        return RecordingEmbeddings(self.inner.get_embedding_model(), self.get_embedding_model_name(), self.store)
+
+    def get_embedding_model_name(self) -> str:
+        return self.inner.get_embedding_model_name()
+
+class ReplayProvider(ModelProvider):
+    """
+    Serves responses recorded with RecordingProvider, without network calls.
+    With REPLAY_WITH_LATENCY the recorded latency is slept as well.
+    """
+
+    name = "replay"
+
+    def __init__(self, store: RecordingStore = None):
+        self.store = store or RecordingStore()
+
+    def get_llm(self):
+        return ReplayChatModel(self.store)
+
+    def get_embedding_model(self) -> Embeddings:
+        return ReplayEmbeddings(self.get_embedding_model_name(), self.store)
+
+    def get_embedding_model_name(self) -> str:
+        # Same name as the recorded live model, so stored vectors stay compatible
+        return LiveProvider().get_embedding_model_name()
+
+@lru_cache(maxsize=1)
+def get_provider() -> ModelProvider:
+    """The provider selected by MODEL_PROVIDER (one instance per process)"""
+    providers = {
+        "live": LiveProvider,
+        "stub": StubProvider,
+        "record": RecordingProvider,
+        "replay": ReplayProvider
+    }
+    if config.MODEL_PROVIDER not in providers:
+        raise ValueError(f"Unknown model provider: {config.MODEL_PROVIDER}. Allowed: {', '.join(MODEL_PROVIDERS)}")
+    return providers[config.MODEL_PROVIDER]()
@@ -1,15 +1,26 @@
 # backend/app/services/query_engine.py
 import os
-from typing import List, Dict, Any, Optional, Tuple
+import time
+import hashlib
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable
 from collections import defaultdict
 import json
 
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.docstore.document import Document
 
 from app.core import config
-from app.core.database import get_document
-from app.services.embedding_service import retrieve_relevant_chunks
+from app.core.database import get_document, get_cached_answer, save_cached_answer
+from app.services.embedding_service import retrieve_relevant_chunks, normalize_question
+from app.services.providers import get_provider
+from app.services.context_builder import build_context, estimate_tokens
+from app.services.theme_clustering import cluster_themes
+
+# Bump when a prompt changes so cached answers from the old prompt are not reused
+ANSWER_PROMPT_VERSION = "2"
+THEME_PROMPT_VERSION = "1"
 
 def group_chunks_by_document(chunks_by_doc_id: Dict[int, List[Document]]) -> Dict[str, List[Dict]]:
     """
@@ -18,7 +29,8 @@ def group_chunks_by_document(chunks_by_doc_id: Dict[int, List[Document]]) -> Dic
     Returns a dictionary mapping doc_ids to lists of chunk information:
     {
         "doc_id.pdf": [
-            {"text": "[Page 1, Para 2] chunk content...", "page": 1, "paragraph": 2},
+            {"text": "[Page 1, Para 2] chunk content...", "content": "chunk content...",
+             "page": 1, "paragraph": 2, "chunk_id": "...", "document_id": 1},
             ...
         ]
     }
@@ -37,27 +49,91 @@ def group_chunks_by_document(chunks_by_doc_id: Dict[int, List[Document]]) -> Dic
             citation = f"[Page {chunk.metadata['page']}, Paragraph {chunk.metadata['paragraph']}]"
             chunk_info = {
                 "text": f"{citation} {chunk.page_content}",
+                "content": chunk.page_content,
                 "page": chunk.metadata["page"],
-                "paragraph": chunk.metadata["paragraph"]
+                "paragraph": chunk.metadata["paragraph"],
+                # Chunks from legacy per-document stores have no chunk_id
+                "chunk_id": chunk.metadata.get("chunk_id") or hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest(),
+                "document_id": doc_id
             }
             grouped[doc_filename].append(chunk_info)
     
     return grouped
 
+# Shared pool for per-document LLM calls, bounding concurrency across all queries
+_answer_executor = ThreadPoolExecutor(
+    max_workers=config.LLM_MAX_CONCURRENCY,
+    thread_name_prefix="llm-answer"
+)
+
 def get_llm():
-    """Get the LLM for generating answers"""
-    return ChatGoogleGenerativeAI(
-        model=config.LLM_MODEL, 
-        temperature=config.LLM_TEMPERATURE,
-        google_api_key=config.GOOGLE_API_KEY
+    """Get the LLM for generating answers from the configured provider"""
+    return get_provider().get_llm()
+
+
+def _cache_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _llm_settings(llm) -> Tuple[str, float]:
+    """Model name and temperature of an LLM, for cache keys"""
+    model = getattr(llm, "model", None) or config.LLM_MODEL
+    temperature = getattr(llm, "temperature", None)
+    return str(model), float(config.LLM_TEMPERATURE if temperature is None else temperature)
+
+def answer_cache_key(question: str, chunk_list: List[Dict], llm, prompt: str = "document") -> str:
+    """
+    Cache key of a document answer: question, document, retrieved chunks in
+    rank order, context builder settings, model and prompt ("document" for
+    get_document_answer, "packed" for get_packed_answers).
+
+    The retrieval mode, scope and relevance threshold only reach the prompt
+    through which chunks were retrieved and how they rank, and build_context
+    keeps the best ranked passages, so the chunk order is part of the key.
+    """
+    return _cache_key(
+        "answer",
+        prompt,
+        ANSWER_PROMPT_VERSION,
+        *_llm_settings(llm),
+        config.ANSWER_CONTEXT_TOKEN_BUDGET,
+        config.CONTEXT_DUPLICATE_THRESHOLD,
+        normalize_question(question),
+        sorted({c["document_id"] for c in chunk_list}),
+        [c["chunk_id"] for c in chunk_list]
+    )
+
+def themes_cache_key(doc_responses: Dict[str, Dict], llm) -> str:
+    """Cache key of a theme synthesis: the set of document answers, model and prompt"""
+    return _cache_key(
+        "themes",
+        THEME_PROMPT_VERSION,
+        *_llm_settings(llm),
+        sorted((doc_id, data["response"]) for doc_id, data in doc_responses.items())
     )
 
+def _cache_lookup(cache_key: str):
+    if not config.ANSWER_CACHE_ENABLED:
+        return None
+    cached = get_cached_answer(cache_key, time.time() - config.ANSWER_CACHE_TTL)
+    return json.loads(cached) if cached is not None else None
+
+def _cache_store(cache_key: str, kind: str, value, doc_ids: List[int]):
+    if not config.ANSWER_CACHE_ENABLED:
+        return
+    try:
+        save_cached_answer(
+            cache_key, kind, json.dumps(value), doc_ids,
+            time.time() - config.ANSWER_CACHE_TTL, config.ANSWER_CACHE_MAX_ROWS
+        )
+    except Exception as e:
+        print(f"Error caching {kind}: {str(e)}")
 
 def get_document_answer(
     doc_id: str,
     chunk_list: List[Dict],
     question: str,
-    llm=None
+    llm=None,
+    on_token: Optional[Callable[[str, str], None]] = None
 ) -> Dict:
     """
     Generate an answer for a specific document based on retrieved chunks
@@ -67,6 +143,8 @@ def get_document_answer(
         chunk_list: List of chunks with text and citation info
         question: User question
         llm: Optional LLM instance
+        on_token: Optional callback(doc_id, text); if given the answer is
+                  streamed from the LLM and every piece is passed to it
         
     Returns:
         Dictionary with response and citations
@@ -74,7 +152,9 @@ def get_document_answer(
     if llm is None:
         llm = get_llm()
     
-    context = "\n\n".join(chunk["text"] for chunk in chunk_list)
+    # Merged, de-duplicated and trimmed to the context token budget
+    passages = build_context(chunk_list)
+    context = "\n\n".join(passage["text"] for passage in passages)
 
     prompt = f"""
     You are an expert assistant. Given the context from documents and a user question, provide a precise answer with clear citations.
@@ -88,14 +168,227 @@ def get_document_answer(
     Answer with proper citations (page, paragraph).
     """
 
+    if on_token is None:
+        result = llm.invoke(prompt)
+        response = result.content if hasattr(result, "content") else result
+    else:
+        pieces = []
+        for piece in llm.stream(prompt):
+            text = piece.content if hasattr(piece, "content") else piece
+            if text:
+                pieces.append(text)
+                on_token(doc_id, text)
+        response = "".join(pieces)
+    
+    return {
+        "response": response,
+        "citations": _citations(passages)
+    }
+
+def _citations(chunk_list: List[Dict]) -> List[Dict]:
+    """Page/paragraph citations of chunks or passages, without repeats"""
+    citations = []
+    for c in chunk_list:
+        citation = {"page": c["page"], "paragraph": c["paragraph"]}
+        if citation not in citations:
+            citations.append(citation)
+    return citations
+
+def _failed_answer(chunk_list: List[Dict], error: str) -> Dict:
+    """Answer placeholder for a document whose LLM call failed or timed out"""
+    return {
+        "response": f"Could not generate an answer for this document: {error}",
+        "citations": _citations(chunk_list),
+        "error": error
+    }
+
+def _run_started(started: Dict, key, func, *args):
+    """Record when a queued task actually starts, so timeouts exclude queueing"""
+    started[key] = time.monotonic()
+    return func(*args)
+
+def pack_documents(grouped_chunks: Dict[str, List[Dict]], token_budget: int) -> List[List[str]]:
+    """
+    Group documents, in order, into packs whose context (as built by
+    build_context) fits in token_budget. A document larger than the budget
+    gets a pack of its own.
+    """
+    packs = []
+    current, current_tokens = [], 0
+    for doc_id, chunk_list in grouped_chunks.items():
+        tokens = sum(estimate_tokens(passage["text"]) for passage in build_context(chunk_list))
+        if current and current_tokens + tokens > token_budget:
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(doc_id)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+def _parse_json_object(text: str) -> Dict:
+    """Parse the JSON object in an LLM response, ignoring code fences and surrounding text"""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("No JSON object in response")
+    return json.loads(text[start:end + 1])
+
+def get_packed_answers(grouped_chunks: Dict[str, List[Dict]], question: str, llm=None) -> Dict[str, Dict]:
+    """
+    Answer a question for several documents with a single LLM call
+    
+    Args:
+        grouped_chunks: Chunks of the documents to answer for, keyed by document ID (filename)
+        question: User question
+        llm: Optional LLM instance
+        
+    Returns:
+        Dictionary mapping document IDs to responses and citations, like
+        get_document_answer; documents missing from the LLM output are left out
+    """
+    if llm is None:
+        llm = get_llm()
+    
+    passages = {doc_id: build_context(chunk_list) for doc_id, chunk_list in grouped_chunks.items()}
+    context = "\n\n".join(
+        f"=== Document: {doc_id} ===\n" + "\n\n".join(passage["text"] for passage in doc_passages)
+        for doc_id, doc_passages in passages.items()
+    )
+    document_names = json.dumps(list(grouped_chunks))
+
+    prompt = f"""
+    You are an expert assistant. Given the context from several documents and a user question, answer the question separately for each document, using only that document's context, with clear citations.
+    If the answer is not provided in a document's context, its answer is "answer not available in pdf". Don't make up your own answers.
+    
+    Context:
+    {context}
+
+    Question: {question}
+
+    Respond with only a JSON object mapping each of these document names to its answer with proper citations (page, paragraph):
+    {document_names}
+    """
+
     result = llm.invoke(prompt)
     response = result.content if hasattr(result, "content") else result
+    parsed = _parse_json_object(response)
     
     return {
-        "response": response,
-        "citations": [{"page": c["page"], "paragraph": c["paragraph"]} for c in chunk_list]
+        doc_id: {
+            "response": str(parsed[doc_id]),
+            "citations": _citations(passages[doc_id])
+        }
+        for doc_id in grouped_chunks
+        if isinstance(parsed.get(doc_id), str) and parsed[doc_id].strip()
     }
 
+def _answer_one(doc_id: str, chunk_list: List[Dict], question: str, llm, on_token) -> Dict[str, Dict]:
+    return {doc_id: get_document_answer(doc_id, chunk_list, question, llm, on_token)}
+
+def iter_document_answers(
+    grouped_chunks: Dict[str, List[Dict]],
+    question: str,
+    llm=None,
+    timeout: float = config.LLM_ANSWER_TIMEOUT,
+    on_token: Optional[Callable[[str, str], None]] = None,
+    mode: Optional[str] = None
+) -> Iterator[Tuple[str, Dict]]:
+    """
+    Generate answers for all documents concurrently and yield them as they complete
+    
+    Failures and timeouts are isolated per document: the document gets an
+    answer with an "error" field and the others are unaffected. on_token is
+    passed on to get_document_answer (called from worker threads).
+    
+    In "packed" mode (default config.ANSWER_MODE) documents are grouped into
+    prompts of up to ANSWER_PACKING_TOKEN_BUDGET tokens; documents a packed
+    answer leaves out are answered one by one. Token streaming always uses
+    one prompt per document.
+    
+    Cached answers are yielded first; successful new answers are cached.
+    
+    Yields:
+        (doc_id, answer) tuples in completion order
+    """
+    if llm is None:
+        llm = get_llm()
+    mode = mode or config.ANSWER_MODE
+    packed = mode == "packed" and on_token is None
+    
+    to_generate = {}
+    for doc_id, chunk_list in grouped_chunks.items():
+        prompts = ("document", "packed") if packed else ("document",)
+        cached = None
+        for prompt in prompts:
+            cached = _cache_lookup(answer_cache_key(question, chunk_list, llm, prompt))
+            if cached is not None:
+                break
+        if cached is not None:
+            yield doc_id, cached
+        else:
+            to_generate[doc_id] = chunk_list
+    
+    if packed:
+        groups = pack_documents(to_generate, config.ANSWER_PACKING_TOKEN_BUDGET)
+    else:
+        groups = [[doc_id] for doc_id in to_generate]
+    
+    started: Dict[Tuple[str, ...], float] = {}
+    futures = {}
+    
+    def submit(group: List[str]):
+        key = tuple(group)
+        if len(group) == 1:
+            future = _answer_executor.submit(
+                _run_started, started, key, _answer_one, group[0], to_generate[group[0]], question, llm, on_token
+            )
+        else:
+            future = _answer_executor.submit(
+                _run_started, started, key, get_packed_answers, {doc_id: to_generate[doc_id] for doc_id in group}, question, llm
+            )
+        futures[future] = key
+        return future
+    
+    pending = {submit(group) for group in groups}
+    
+    while pending:
+        deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+        wait_for = min(deadlines) - time.monotonic() if deadlines else timeout
+        done, pending = wait(pending, timeout=min(max(wait_for, 0.0), 1.0), return_when=FIRST_COMPLETED)
+        
+        for future in done:
+            group = futures[future]
+            try:
+                answers = future.result()
+            except Exception as e:
+                if len(group) == 1:
+                    print(f"Error answering for document {group[0]}: {str(e)}")
+                    yield group[0], _failed_answer(grouped_chunks[group[0]], str(e))
+                    continue
+                print(f"Error answering for documents {', '.join(group)} together: {str(e)}")
+                answers = {}
+            
+            prompt = "packed" if len(group) > 1 else "document"
+            for doc_id in group:
+                if doc_id in answers:
+                    _cache_store(
+                        answer_cache_key(question, grouped_chunks[doc_id], llm, prompt), "answer",
+                        answers[doc_id], [c["document_id"] for c in grouped_chunks[doc_id]]
+                    )
+                    yield doc_id, answers[doc_id]
+                else:
+                    # Left out of a packed answer: ask again for this document alone
+                    pending.add(submit([doc_id]))
+        
+        now = time.monotonic()
+        for future in list(pending):
+            group = futures[future]
+            if group in started and now - started[group] > timeout:
+                # The worker thread is freed by the LLM client's own timeout
+                pending.discard(future)
+                for doc_id in group:
+                    yield doc_id, _failed_answer(grouped_chunks[doc_id], f"timed out after {timeout:g}s")
+
 def synthesize_themes(doc_responses: Dict[str, Dict], llm=None) -> List[Dict]:
     """
     Takes the grouped answers from documents and generates a summary of common themes.
@@ -159,47 +452,162 @@ def synthesize_themes(doc_responses: Dict[str, Dict], llm=None) -> List[Dict]:
     
     return themes
 
-def process_user_query(
+def get_themes(doc_responses: Dict[str, Dict], doc_ids: List[int], llm=None) -> List[Dict]:
+    """
+    synthesize_themes with the answer cache in front of it. doc_ids are the
+    document IDs behind doc_responses; themes involving a failed answer are not cached.
+    """
+    if llm is None:
+        llm = get_llm()
+    
+    cache_key = themes_cache_key(doc_responses, llm)
+    cached = _cache_lookup(cache_key)
+    if cached is not None:
+        return cached
+    
+    themes = synthesize_themes(doc_responses, llm)
+    if not any("error" in data for data in doc_responses.values()):
+        _cache_store(cache_key, "themes", themes, doc_ids)
+    return themes
+
+def _iter_answer_events(
+    grouped_chunks: Dict[str, List[Dict]],
+    question: str,
+    llm,
+    stream_tokens: bool
+) -> Iterator[Tuple[str, Dict]]:
+    """Yield "answer" events, interleaved with "token" events if stream_tokens is set"""
+    if not stream_tokens:
+        for doc_id, answer in iter_document_answers(grouped_chunks, question, llm):
+            yield "answer", {"document": doc_id, **answer}
+        return
+    
+    # Tokens arrive on worker threads, so funnel everything through one queue
+    events = queue.Queue()
+    
+    def on_token(doc_id: str, text: str):
+        events.put(("token", {"document": doc_id, "text": text}))
+    
+    def produce():
+        try:
+            for doc_id, answer in iter_document_answers(grouped_chunks, question, llm, on_token=on_token):
+                events.put(("answer", {"document": doc_id, **answer}))
+        except Exception as e:
+            events.put(("error", {"detail": str(e)}))
+        finally:
+            events.put(None)
+    
+    threading.Thread(target=produce, daemon=True).start()
+    
+    while True:
+        event = events.get()
+        if event is None:
+            break
+        yield event
+
+def iter_query_events(
     question: str,
     doc_ids: List[int] = None,
-    k: int = config.TOP_K_RESULTS
-) -> Dict:
+    k: int = config.TOP_K_RESULTS,
+    mode: Optional[str] = None,
+    scope: Optional[str] = None,
+    stream_tokens: bool = False
+) -> Iterator[Tuple[str, Dict]]:
     """
-    Process a user query against selected documents
+    Process a user query, yielding (event, data) tuples as results become available:
     
-    Args:
-        question: User question
-        doc_ids: List of document IDs to search (if None, search all processed documents)
-        k: Number of chunks to retrieve per document
-        
-    Returns:
-        Dictionary with document responses and themes
+      ("retrieval", {"documents": {"doc.pdf": chunk_count, ...},
+                     "stats": {"retrieval_ms": ..., "mmr": {"candidates", "chunks", "ms"} or None}})
+      ("token", {"document": "doc.pdf", "text": "..."})      only with stream_tokens
+      ("answer", {"document": "doc.pdf", "response": "...", "citations": [...]})
+      ("themes", {"themes": [...]})
+    
+    Arguments are the same as for process_user_query.
     """
     # Get relevant chunks from documents
-    chunks_by_doc_id = retrieve_relevant_chunks(question, doc_ids, k)
+    start = time.perf_counter()
+    retrieval_stats = {}
+    chunks_by_doc_id = retrieve_relevant_chunks(question, doc_ids, k, mode, scope, stats=retrieval_stats)
+    retrieval_stats["retrieval_ms"] = round((time.perf_counter() - start) * 1000, 2)
     
     # Group chunks by document
     grouped_chunks = group_chunks_by_document(chunks_by_doc_id)
     
+    yield "retrieval", {
+        "documents": {doc_id: len(chunks) for doc_id, chunks in grouped_chunks.items()},
+        "stats": retrieval_stats
+    }
+    
     # No results found
     if not grouped_chunks:
-        return {
-            "document_responses": {},
-            "themes": []
-        }
+        yield "themes", {"themes": []}
+        return
     
     # Get LLM
     llm = get_llm()
     
-    # Generate answers for each document
+    # Clustered themes only need the retrieved chunks, so they are built while the answers run
+    theme_future = None
+    if config.THEME_MODE == "cluster":
+        document_names = {c["document_id"]: name for name, chunks in grouped_chunks.items() for c in chunks}
+        theme_future = _answer_executor.submit(
+            cluster_themes,
+            chunks_by_doc_id,
+            document_names,
+            llm if config.THEME_CLUSTER_LABELS == "llm" else None
+        )
+    
+    # Generate answers for each document concurrently
     document_responses = {}
-    for doc_id, chunk_list in grouped_chunks.items():
-        document_responses[doc_id] = get_document_answer(doc_id, chunk_list, question, llm)
+    for event, data in _iter_answer_events(grouped_chunks, question, llm, stream_tokens):
+        if event == "answer":
+            document_responses[data["document"]] = {key: value for key, value in data.items() if key != "document"}
+        yield event, data
     
-    # Synthesize themes across documents
-    themes = synthesize_themes(document_responses, llm)
+    if theme_future is not None:
+        yield "themes", {"themes": theme_future.result()}
+        return
+    
+    # Synthesize themes across documents, in retrieval order
+    ordered_responses = {doc_id: document_responses[doc_id] for doc_id in grouped_chunks if doc_id in document_responses}
+    doc_ids = [c["document_id"] for chunks in grouped_chunks.values() for c in chunks]
+    yield "themes", {"themes": get_themes(ordered_responses, doc_ids, llm)}
+
+def process_user_query(
+    question: str,
+    doc_ids: List[int] = None,
+    k: int = config.TOP_K_RESULTS,
+    mode: Optional[str] = None,
+    scope: Optional[str] = None
+) -> Dict:
+    """
+    Process a user query against selected documents
+    
+    Args:
+        question: User question
+        doc_ids: List of document IDs to search (if None, search all processed documents)
+        k: Number of chunks to retrieve per document
+        mode: Retrieval mode ("vector", "lexical" or "hybrid", default config.RETRIEVAL_MODE)
+        scope: Retrieval scope ("per_document" or "global", default config.RETRIEVAL_SCOPE).
+               In global scope only documents with relevant chunks get an LLM call
+        
+    Returns:
+        Dictionary with document responses and themes
+    """
+    retrieved = []
+    document_responses = {}
+    themes = []
+    
+    for event, data in iter_query_events(question, doc_ids, k, mode, scope):
+        if event == "retrieval":
+            retrieved = list(data["documents"])
+        elif event == "answer":
+            document_responses[data["document"]] = {key: value for key, value in data.items() if key != "document"}
+        elif event == "themes":
+            themes = data["themes"]
     
     return {
-        "document_responses": document_responses,
+        # Keep the order documents were retrieved in
+        "document_responses": {doc_id: document_responses[doc_id] for doc_id in retrieved if doc_id in document_responses},
         "themes": themes
-    }
\ No newline at end of file
+    }
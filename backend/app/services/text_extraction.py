@@ -1,6 +1,10 @@
 # backend/app/services/text_extraction.py
 import os
-from typing import List, Dict, Optional
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Iterator, Optional, Tuple
 
 import pdf2image
 import pytesseract
@@ -11,50 +15,210 @@ from pdf2image import convert_from_path
 
 from app.core import config
 
-def extract_text_from_pdf(pdf_path: str) -> List[Dict]:
+def _needs_ocr(text: str) -> bool:
+    # If little to no text was extracted, the page might be a scanned image
+    return len(text.strip()) < 20
+
+def _page_runs(page_numbers: List[int], max_pages: int) -> List[Tuple[int, int]]:
+    """Group sorted page numbers into runs of consecutive pages, at most max_pages long"""
+    runs = []
+    for number in page_numbers:
+        if runs and number == runs[-1][1] + 1 and number - runs[-1][0] < max_pages:
+            runs[-1] = (runs[-1][0], number)
+        else:
+            runs.append((number, number))
+    return runs
+
+def _render_pages(pdf_path: str, page_numbers: List[int], thread_count: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Render pages to grayscale arrays. Consecutive pages are rendered by a single
+    poppler call (split across thread_count poppler processes), so the PDF is
+    parsed once per run instead of once per page.
+    """
+    for first, last in _page_runs(page_numbers, config.OCR_RENDER_BATCH_PAGES):
+        images = convert_from_path(
+            pdf_path,
+            dpi=config.OCR_DPI,
+            first_page=first,
+            last_page=last,
+            grayscale=True,
+            thread_count=min(thread_count, last - first + 1)
+        )
+        for number in range(first, last + 1):
+            # "L" mode images convert to a 2-D uint8 array that OpenCV uses as is
+            yield number, np.asarray(images[number - first])
+            images[number - first] = None
+
+def _ocr_image(gray: np.ndarray) -> str:
+    """OCR a grayscale page with pytesseract after preprocessing"""
+    # Preprocess image: binarization and denoising
+    _, thresh = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    thresh = cv2.medianBlur(thresh, 3)
+
+    # OCR with pytesseract
+    return pytesseract.image_to_string(thresh, lang="eng")
+
+def _extract_pages(pdf, pdf_path: str, first_page: int, last_page: int, render_threads: int) -> List[str]:
+    """
+    Texts of pages first_page..last_page (1-based, inclusive) of an open
+    pdfplumber document. Pages without searchable text are OCRed after the
+    text pass, rendered together.
+    """
+    texts = []
+    for page in pdf.pages[first_page - 1:last_page]:
+        texts.append(page.extract_text() or "")
+        # pdfplumber keeps parsed objects of visited pages
+        page.flush_cache()
+
+    scanned = [first_page + i for i, text in enumerate(texts) if _needs_ocr(text)]
+    for number, gray in _render_pages(pdf_path, scanned, render_threads):
+        texts[number - first_page] = _ocr_image(gray)
+
+    return texts
+
+def _extract_page_range(pdf_path: str, first_page: int, last_page: int) -> List[str]:
+    """Worker task: texts of pages first_page..last_page (1-based, inclusive)"""
+    with pdfplumber.open(pdf_path) as pdf:
+        # The pool already keeps every core busy, so poppler renders on one thread
+        return _extract_pages(pdf, pdf_path, first_page, last_page, render_threads=1)
+
+def _virtual_memory_size() -> int:
+    """Current virtual memory size of this process in bytes (0 if unknown)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def _init_extraction_worker(memory_limit_mb: int):
+    """Keep each worker on one core and cap its memory growth"""
+    # Tesseract and OpenCV would otherwise start a thread per core in every worker
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    cv2.setNumThreads(1)
+    
+    if memory_limit_mb > 0:
+        try:
+            import resource
+            limit = _virtual_memory_size() + memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            print(f"Could not cap extraction worker memory: {str(e)}")
+
+def _create_extraction_pool(workers: int) -> ProcessPoolExecutor:
+    kwargs = dict(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_extraction_worker,
+        initargs=(config.EXTRACTION_WORKER_MEMORY_MB,)
+    )
+    try:
+        # Recycle workers so memory held by pdfplumber, poppler and tesseract is returned
+        return ProcessPoolExecutor(max_tasks_per_child=config.EXTRACTION_MAX_TASKS_PER_CHILD, **kwargs)
+    except TypeError:  # Python < 3.11
+        return ProcessPoolExecutor(**kwargs)
+
+def _page_ranges(first_page: int, last_page: int, step: int) -> List[Tuple[int, int]]:
+    return [(first, min(first + step - 1, last_page)) for first in range(first_page, last_page + 1, step)]
+
+def _iter_serial(pdf_path: str, first_page: int, page_count: int) -> Iterator[List[str]]:
+    with pdfplumber.open(pdf_path) as pdf:
+        for first, last in _page_ranges(first_page, page_count, config.EXTRACTION_PAGES_PER_TASK):
+            yield _extract_pages(pdf, pdf_path, first, last, config.OCR_RENDER_THREADS)
+
+def _iter_parallel(pdf_path: str, page_count: int, workers: int) -> Iterator[List[str]]:
+    ranges = _page_ranges(1, page_count, config.EXTRACTION_PAGES_PER_TASK)
+    next_first = 1
+    try:
+        with _create_extraction_pool(min(workers, len(ranges))) as pool:
+            # Keep a bounded window of ranges in flight and hand results out in page order,
+            # so a slow consumer holds back extraction instead of piling up pages
+            pending = deque()
+            remaining = iter(ranges)
+            for first, last in remaining:
+                pending.append(pool.submit(_extract_page_range, pdf_path, first, last))
+                if len(pending) >= 2 * workers:
+                    break
+            while pending:
+                future = pending.popleft()
+                try:
+                    texts = future.result()
+                except MemoryError:
+                    # The range outgrew the worker memory cap: extract it here, without the cap
+                    # (a MemoryError here too fails the document)
+                    last = min(next_first + config.EXTRACTION_PAGES_PER_TASK - 1, page_count)
+                    print(f"Pages {next_first}-{last} of {pdf_path} exceeded the worker memory cap, extracting them serially")
+                    texts = next(_iter_serial(pdf_path, next_first, last))
+                next_first += len(texts)
+                yield texts
+                for first, last in remaining:
+                    pending.append(pool.submit(_extract_page_range, pdf_path, first, last))
+                    break
+    except BrokenProcessPool as e:
+        # A worker was killed (e.g. by the OOM killer): finish in this process
+        print(f"Parallel extraction of {pdf_path} failed ({str(e)}), extracting pages {next_first}-{page_count} serially")
+        yield from _iter_serial(pdf_path, next_first, page_count)
+
+# Documents extracted at the same time (the job worker pool size), sharing the cores
+_concurrent_documents = 1
+
+def set_concurrent_documents(count: int):
+    """Tell extraction how many documents are processed at once, to size its pools"""
+    global _concurrent_documents
+    _concurrent_documents = max(1, count)
+
+def get_extraction_workers() -> int:
+    """config.EXTRACTION_WORKERS, or if 0 the CPU cores divided among concurrent documents"""
+    if config.EXTRACTION_WORKERS > 0:
+        return config.EXTRACTION_WORKERS
+    return max(1, (os.cpu_count() or 1) // _concurrent_documents)
+
+def get_page_count(pdf_path: str) -> int:
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+def iter_text_from_pdf(pdf_path: str, workers: Optional[int] = None) -> Iterator[Dict]:
     """
-    Extracts text from a PDF. For each page:
+    Extracts text from a PDF, yielding pages in order as they are extracted.
+    For each page:
       - If it has searchable text, use pdfplumber.
       - Otherwise, render to image and OCR with pytesseract after preprocessing.
+        Scanned pages are rendered in batches of consecutive pages.
 
-    Returns a list of dicts:
-      [{ "page": 1, "text": "..." }, ...]
+    Pages are extracted in ranges of EXTRACTION_PAGES_PER_TASK pages. Documents
+    with at least EXTRACTION_PARALLEL_MIN_PAGES pages are extracted on a pool
+    of worker processes (default get_extraction_workers()).
+
+    Yields dicts:
+      { "doc_id": "file.pdf", "page": 1, "text": "..." }
     """
-    pages = []
     doc_id = os.path.basename(pdf_path)
+    workers = get_extraction_workers() if workers is None else workers
     
-    with pdfplumber.open(pdf_path) as pdf:
-        for i, page in enumerate(pdf.pages, start=1):
-            text = page.extract_text() or ""
-            
-            # If little to no text was extracted, the page might be a scanned image
-            if len(text.strip()) < 20:
-                # Convert page to high-quality image
-                image = convert_from_path(
-                    pdf_path, 
-                    dpi=config.OCR_DPI, 
-                    first_page=i, 
-                    last_page=i
-                )[0]
-
-                # Convert to OpenCV format
-                img_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-                gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-
-                # Preprocess image: binarization and denoising
-                _, thresh = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-                thresh = cv2.medianBlur(thresh, 3)
-
-                # OCR with pytesseract
-                text = pytesseract.image_to_string(thresh, lang="eng")
-
-            pages.append({
+    page_count = get_page_count(pdf_path)
+    
+    if workers <= 1 or page_count < config.EXTRACTION_PARALLEL_MIN_PAGES:
+        ranges = _iter_serial(pdf_path, 1, page_count)
+    else:
+        ranges = _iter_parallel(pdf_path, page_count, workers)
+    
+    page_number = 1
+    for texts in ranges:
+        for text in texts:
+            yield {
                 "doc_id": doc_id,
-                "page": i,
+                "page": page_number,
                 "text": text
-            })
-    
-    return pages
+            }
+            page_number += 1
+
+def extract_text_from_pdf(pdf_path: str, workers: Optional[int] = None) -> List[Dict]:
+    """
+    Extracts text from a PDF (see iter_text_from_pdf).
+
+    Returns a list of dicts, in page order:
+      [{ "doc_id": "file.pdf", "page": 1, "text": "..." }, ...]
+    """
+    return list(iter_text_from_pdf(pdf_path, workers))
 
 def extract_text_from_pdfs(pdf_paths: List[str]) -> List[Dict]:
     """
@@ -0,0 +1,159 @@
+# backend/app/services/theme_clustering.py
+import re
+import json
+from collections import Counter
+from typing import List, Dict, Optional
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from app.core import config
+from app.services.vector_ops import kmeans, silhouette_score
+from app.services.embedding_service import get_chunk_vectors, get_embedding_model
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z-]{2,}")
+
+STOPWORDS = frozenset("""
+about above after again against also among because been before being below between both could does doing down
+during each either from further have having here into itself just more most other over same should some such than
+that their them then there these they this those through under until upon very were what when where which while
+will with within would your page paragraph
+""".split())
+
+def _chunk_vectors(chunks: List[Document]) -> np.ndarray:
+    """Stored vectors of the chunks; chunks without one (legacy stores) are embedded"""
+    stored = get_chunk_vectors(chunks)
+    missing = [chunk.page_content for chunk in chunks if chunk.metadata.get("chunk_id") not in stored]
+    embedded = iter(get_embedding_model().embed_documents(missing)) if missing else iter(())
+
+    vectors = np.array([
+        stored[chunk.metadata["chunk_id"]] if chunk.metadata.get("chunk_id") in stored else next(embedded)
+        for chunk in chunks
+    ], dtype=np.float32)
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    return vectors
+
+def cluster_vectors(vectors: np.ndarray, max_clusters: int = config.THEME_MAX_CLUSTERS) -> np.ndarray:
+    """
+    k-means labels with k picked automatically: the k in 2..max_clusters with the
+    best silhouette score, or a single cluster if none separates the points
+    """
+    n = vectors.shape[0]
+    best_labels = np.zeros(n, dtype=np.int64)
+    best_score = config.THEME_MIN_SILHOUETTE
+    for k in range(2, min(max_clusters, n - 1) + 1):
+        _, labels = kmeans(vectors, k)
+        score = silhouette_score(vectors, labels)
+        if score > best_score:
+            best_labels, best_score = labels, score
+    return best_labels
+
+def _words(text: str) -> List[str]:
+    return [word for word in (w.lower() for w in _WORD_RE.findall(text)) if word not in STOPWORDS]
+
+def _keywords(cluster_texts: List[str], all_counts: Counter, total_words: int, count: int = 3) -> List[str]:
+    """Words most over-represented in the cluster compared to all retrieved chunks"""
+    counts = Counter(word for text in cluster_texts for word in _words(text))
+    cluster_total = max(sum(counts.values()), 1)
+    scored = {
+        word: (n / cluster_total) / (all_counts[word] / total_words) * np.log1p(n)
+        for word, n in counts.items()
+    }
+    return sorted(scored, key=lambda word: (-scored[word], word))[:count]
+
+def _snippet(text: str, limit: int = 200) -> str:
+    """First sentence of a passage, cut at limit characters"""
+    text = " ".join(text.split())
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit].rsplit(" ", 1)[0] + "..."
+
+def _llm_labels(themes: List[Dict], llm) -> Optional[List[Dict]]:
+    """One short LLM call naming all clusters; None if the reply cannot be parsed"""
+    clusters = "\n".join(
+        f"{i}. Keywords: {theme['keywords']}. Example: {theme['description']}"
+        for i, theme in enumerate(themes, 1)
+    )
+    prompt = f"""Give each of these groups of document passages a short theme name (a few words) and a one-sentence description.
+
+    {clusters}
+
+    Respond with only a JSON list of {len(themes)} objects with "theme" and "description" keys, in the same order.
+    """
+    try:
+        result = llm.invoke(prompt)
+        text = result.content if hasattr(result, "content") else result
+        labels = json.loads(text[text.find("["):text.rfind("]") + 1])
+        if len(labels) != len(themes):
+            return None
+        return [{"theme": str(label["theme"]), "description": str(label["description"])} for label in labels]
+    except Exception as e:
+        print(f"Error labelling theme clusters: {str(e)}")
+        return None
+
+def cluster_themes(
+    chunks_by_doc_id: Dict[int, List[Document]],
+    document_names: Dict[int, str],
+    llm=None,
+    max_clusters: int = config.THEME_MAX_CLUSTERS
+) -> List[Dict]:
+    """
+    Identify themes by clustering the retrieved chunks on their stored vectors
+    instead of asking the LLM to read every answer.
+
+    Each cluster is named after its most distinctive keywords and described by
+    the passage closest to its centroid. With an llm, a single short call turns
+    those into theme names and descriptions.
+
+    Args:
+        chunks_by_doc_id: Retrieved chunks keyed by document ID
+        document_names: Document ID -> name used in the response (filename)
+        llm: Optional LLM for cluster labels
+        max_clusters: Upper bound for the automatically chosen number of themes
+
+    Returns:
+        Themes in the synthesize_themes format, largest first:
+        [{"theme": "...", "description": "...", "documents": ["doc1.pdf", ...]}, ...]
+    """
+    chunks = [
+        chunk for doc_id, doc_chunks in chunks_by_doc_id.items() if doc_id in document_names
+        for chunk in doc_chunks
+    ]
+    if not chunks:
+        return []
+
+    vectors = _chunk_vectors(chunks)
+    labels = cluster_vectors(vectors, max_clusters)
+
+    all_counts = Counter(word for chunk in chunks for word in _words(chunk.page_content))
+    total_words = max(sum(all_counts.values()), 1)
+
+    themes = []
+    for label in range(int(labels.max()) + 1):
+        rows = np.flatnonzero(labels == label)
+        if not len(rows):
+            continue
+        centroid = vectors[rows].mean(axis=0)
+        central = rows[int(np.argmax(vectors[rows] @ centroid))]
+
+        doc_counts = Counter(chunks[row].metadata["doc_id"] for row in rows)
+        keywords = _keywords([chunks[row].page_content for row in rows], all_counts, total_words)
+        themes.append({
+            "theme": ", ".join(word.capitalize() for word in keywords) or f"Theme {label + 1}",
+            "description": _snippet(chunks[central].page_content),
+            "documents": [document_names[doc_id] for doc_id, _ in doc_counts.most_common()],
+            "keywords": ", ".join(keywords),
+            "size": len(rows)
+        })
+
+    themes.sort(key=lambda theme: (-len(theme["documents"]), -theme["size"]))
+
+    if llm is not None:
+        labels_from_llm = _llm_labels(themes, llm)
+        if labels_from_llm:
+            for theme, llm_label in zip(themes, labels_from_llm):
+                theme.update(llm_label)
+
+    return [
+        {"theme": theme["theme"], "description": theme["description"], "documents": theme["documents"]}
+        for theme in themes
+    ]
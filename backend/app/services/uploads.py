@@ -0,0 +1,197 @@
+# backend/app/services/uploads.py
+"""
+Saving uploaded files. Each file is streamed to UPLOAD_DIR while its SHA-256
+is computed; a file whose content was uploaded before is not stored or
+processed again, the existing document is returned instead.
+"""
+import os
+import uuid
+import sqlite3
+import hashlib
+import zipfile
+import threading
+from typing import IO, Dict, Iterator, List, Tuple
+
+from app.core import config
+from app.core.database import (
+    save_document,
+    get_document_by_hash,
+    get_documents_without_hash,
+    update_document_hash
+)
+from app.services.job_queue import submit_document
+
+ALLOWED_TYPES = [".pdf"]
+
+# Bytes read from an upload at a time
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Makes looking up a hash and saving a new document one step within this process
+_save_lock = threading.Lock()
+
+def save_stream(source: IO[bytes], file_path: str, max_bytes: int = 0) -> Tuple[int, str]:
+    """
+    Copy a file object to file_path, hashing it on the way.
+    Raises ValueError once more than max_bytes were read (0 = no limit).
+
+    Returns (size in bytes, SHA-256 hex digest)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, "wb") as buffer:
+        while True:
+            block = source.read(COPY_BUFFER_SIZE)
+            if not block:
+                break
+            size += len(block)
+            if max_bytes and size > max_bytes:
+                raise ValueError(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+            digest.update(block)
+            buffer.write(block)
+    return size, digest.hexdigest()
+
+def hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def ingest_file(source: IO[bytes], original_filename: str, priority: int) -> Dict:
+    """
+    Save one uploaded file and queue it for processing, unless a document with
+    the same content exists already. A duplicate of a document whose
+    processing failed queues that document again.
+
+    Returns the file's outcome:
+      {"filename", "status": "queued" | "duplicate" | "error", "id", "job_id", "is_processed", "detail"}
+    """
+    file_extension = os.path.splitext(original_filename)[1].lower()
+    if file_extension not in ALLOWED_TYPES:
+        return {
+            "filename": original_filename,
+            "status": "error",
+            "detail": f"File type not supported. Allowed types: {', '.join(ALLOWED_TYPES)}"
+        }
+
+    # Stream to a hidden temporary name; it only gets a document's name if it is new
+    temp_path = os.path.join(config.UPLOAD_DIR, f".{uuid.uuid4()}.part")
+    try:
+        file_size, content_hash = save_stream(source, temp_path, config.UPLOAD_MAX_FILE_MB * 1024 * 1024)
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return {"filename": original_filename, "status": "error", "detail": str(e)}
+
+    with _save_lock:
+        existing = get_document_by_hash(content_hash)
+        if existing is None:
+            unique_filename = f"{uuid.uuid4()}{file_extension}"
+            file_path = os.path.join(config.UPLOAD_DIR, unique_filename)
+            os.replace(temp_path, file_path)
+            try:
+                doc_id = save_document(
+                    filename=unique_filename,
+                    original_filename=original_filename,
+                    file_path=file_path,
+                    file_type=file_extension,
+                    file_size=file_size,
+                    content_hash=content_hash
+                )
+            except sqlite3.IntegrityError:
+                # Another process saved the same content in the meantime
+                existing = get_document_by_hash(content_hash)
+                os.replace(file_path, temp_path)
+
+    if existing is not None:
+        os.remove(temp_path)
+        result = {
+            "filename": original_filename,
+            "status": "duplicate",
+            "id": existing["id"],
+            "is_processed": bool(existing["is_processed"])
+        }
+        if not existing["is_processed"] and existing["processing_error"]:
+            result["job_id"] = submit_document(existing["id"], priority)
+        return result
+
+    return {
+        "filename": original_filename,
+        "status": "queued",
+        "id": doc_id,
+        "job_id": submit_document(doc_id, priority),
+        "is_processed": False
+    }
+
+def _zip_members(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """Files of a ZIP archive, skipping folders and hidden files"""
+    return [
+        member for member in archive.infolist()
+        if not member.is_dir()
+        and not os.path.basename(member.filename).startswith(".")
+        and not member.filename.startswith("__MACOSX/")
+    ]
+
+def _iter_zip_files(source: IO[bytes]) -> Iterator[Tuple[str, IO[bytes]]]:
+    """(name, file object) of every file in a ZIP archive"""
+    with zipfile.ZipFile(source) as archive:
+        for member in _zip_members(archive):
+            with archive.open(member) as f:
+                yield os.path.basename(member.filename), f
+
+def count_upload_files(uploads: List[Tuple[str, IO[bytes]]]) -> int:
+    """
+    Number of files an upload contains: each PDF, and each file inside a ZIP
+    archive (read from the archive's directory; an unreadable archive counts as one)
+    """
+    count = 0
+    for filename, source in uploads:
+        if os.path.splitext(filename)[1].lower() != ".zip":
+            count += 1
+            continue
+        try:
+            with zipfile.ZipFile(source) as archive:
+                count += len(_zip_members(archive))
+        except (zipfile.BadZipFile, OSError):
+            count += 1
+        source.seek(0)
+    return count
+
+def ingest_uploads(uploads: List[Tuple[str, IO[bytes]]], priority: int) -> List[Dict]:
+    """
+    Save uploaded files (PDFs, or ZIP archives of PDFs) one by one, see ingest_file.
+    Raises ValueError, before saving anything, if they contain more than
+    BULK_UPLOAD_MAX_FILES files.
+
+    Returns one outcome per file, in upload order; files inside an archive
+    are named "archive.zip/file.pdf".
+    """
+    count = count_upload_files(uploads)
+    if count > config.BULK_UPLOAD_MAX_FILES:
+        raise ValueError(f"Upload contains {count} files, more than {config.BULK_UPLOAD_MAX_FILES}")
+
+    results = []
+    for filename, source in uploads:
+        if os.path.splitext(filename)[1].lower() != ".zip":
+            results.append(ingest_file(source, filename, priority))
+            continue
+        try:
+            for member_name, member in _iter_zip_files(source):
+                result = ingest_file(member, member_name, priority)
+                results.append({**result, "filename": f"{filename}/{member_name}"})
+        except (zipfile.BadZipFile, OSError) as e:
+            results.append({"filename": filename, "status": "error", "detail": str(e)})
+    return results
+
+def backfill_content_hashes() -> int:
+    """Hash the files of documents uploaded before hashes were recorded, so they are found as duplicates"""
+    count = 0
+    for document in get_documents_without_hash():
+        try:
+            update_document_hash(document["id"], hash_file(document["file_path"]))
+            count += 1
+        except OSError as e:
+            print(f"Could not hash document {document['id']}: {str(e)}")
+    if count:
+        print(f"Recorded file hashes of {count} documents")
+    return count
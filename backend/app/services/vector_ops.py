@@ -0,0 +1,117 @@
+# backend/app/services/vector_ops.py
+from typing import List, Tuple
+
+import numpy as np
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+    """Index of the nearest centroid (squared L2) for every row, computed in batches"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], batch_size):
+        batch = vectors[start:start + batch_size]
+        # ||x - c||^2 without the ||x||^2 term, which does not change the argmin
+        distances = centroid_norms[None, :] - 2.0 * (batch @ centroids.T)
+        labels[start:start + batch_size] = distances.argmin(axis=1)
+    return labels
+
+def kmeans(
+    vectors: np.ndarray,
+    k: int,
+    iterations: int = 20,
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Lloyd's k-means with k-means++ initialisation.
+
+    Returns:
+        (centroids of shape (k, dim), label of every row)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, vectors.shape[0]))
+
+    # k-means++: sample each new centroid proportionally to its squared distance
+    centroids = np.empty((k, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = vectors[rng.integers(vectors.shape[0])]
+    closest = ((vectors - centroids[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        if total <= 0:
+            centroids[i:] = vectors[rng.integers(vectors.shape[0], size=k - i)]
+            break
+        centroids[i] = vectors[rng.choice(vectors.shape[0], p=closest / total)]
+        closest = np.minimum(closest, ((vectors - centroids[i]) ** 2).sum(axis=1))
+
+    labels = assign_to_centroids(vectors, centroids)
+    for _ in range(iterations):
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters with random rows
+        if empty.any():
+            centroids[empty] = vectors[rng.integers(vectors.shape[0], size=int(empty.sum()))]
+
+        new_labels = assign_to_centroids(vectors, centroids)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    return centroids, labels
+
+def mmr_select(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Maximal Marginal Relevance: greedily pick k rows that are similar to the
+    query but not to the rows already picked.
+    score = lambda_mult * sim(query, row) - (1 - lambda_mult) * max sim(row, picked)
+
+    Returns:
+        Indices of the picked rows, in pick order
+    """
+    candidates = np.asarray(candidates, dtype=np.float32)
+    if not candidates.size or k <= 0:
+        return []
+    candidates = candidates / np.clip(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12, None)
+    query = np.asarray(query, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    while len(selected) < min(k, candidates.shape[0]):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+def silhouette_score(vectors: np.ndarray, labels: np.ndarray) -> float:
+    """
+    Mean silhouette coefficient with cosine distance (rows must be normalized).
+    Points in single-member clusters count as 0.
+    """
+    n = vectors.shape[0]
+    k = int(labels.max()) + 1 if n else 0
+    if n < 2 or k < 2:
+        return 0.0
+
+    distances = 1.0 - vectors @ vectors.T
+    members = np.zeros((n, k), dtype=np.float32)
+    members[np.arange(n), labels] = 1.0
+    counts = members.sum(axis=0)
+
+    # Summed distance from every point to every cluster
+    sums = distances @ members
+    own = sums[np.arange(n), labels] / np.maximum(counts[labels] - 1, 1)
+    other = np.where(members > 0, np.inf, sums / np.maximum(counts, 1))
+    other[:, counts == 0] = np.inf
+    nearest = other.min(axis=1)
+
+    scores = (nearest - own) / np.maximum(np.maximum(own, nearest), 1e-12)
+    scores[counts[labels] <= 1] = 0.0
+    return float(scores.mean())
@@ -0,0 +1,132 @@
+# backend/scripts/benchmark_quantization.py
+"""
+Measure recall@k against memory for the vector quantization options of the
+NumPy backend, using the vectors stored under EMBEDDING_DIR (legacy
+per-document Chroma stores, the shared collection and NumPy indexes).
+
+Run from the backend directory:
+    python -m scripts.benchmark_quantization
+    python -m scripts.benchmark_quantization --synthetic 50000 --dim 768
+"""
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.core import config
+from app.services import numpy_index
+from app.services.quantization import ScalarQuantizer, ProductQuantizer
+
+def load_stored_vectors(embedding_dir: str) -> np.ndarray:
+    """Collect every stored chunk vector of the most common size"""
+    import chromadb
+
+    found = []
+    for sqlite_path in glob.glob(os.path.join(embedding_dir, "*", "chroma.sqlite3")):
+        try:
+            client = chromadb.PersistentClient(path=os.path.dirname(sqlite_path))
+            for collection in client.list_collections():
+                embeddings = client.get_collection(collection.name).get(include=["embeddings"])["embeddings"]
+                if embeddings is not None and len(embeddings):
+                    found.append(np.array(embeddings, dtype=np.float32))
+        except Exception as e:
+            print(f"Skipping {sqlite_path}: {e!r}")
+
+    for index_dir in glob.glob(os.path.join(embedding_dir, "doc_*")):
+        index = numpy_index.load_document_index(int(os.path.basename(index_dir)[4:]), embedding_dir)
+        if index is not None and len(index):
+            found.append(np.array(index.vectors))
+
+    if not found:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    dims = [vectors.shape[1] for vectors in found]
+    dim = max(set(dims), key=dims.count)
+    return np.vstack([vectors for vectors in found if vectors.shape[1] == dim])
+
+def recall_at_k(approx: np.ndarray, exact: np.ndarray) -> float:
+    return float(np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approx, exact)]))
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+def evaluate(name: str, vectors: np.ndarray, queries: np.ndarray, exact: np.ndarray, k: int, quantizer=None):
+    if quantizer is None:
+        codes_bytes = vectors.nbytes
+        approx = exact
+        reranked = exact
+        seconds = 0.0
+        peak = scoring_peak(lambda: vectors @ queries[0])
+    else:
+        codes = quantizer.encode(vectors)
+        codes_bytes = codes.nbytes
+        approx, reranked = [], []
+        start = time.perf_counter()
+        for query in queries:
+            scores = quantizer.score(codes, query)
+            approx.append(top_k(scores, k))
+            # Re-score the best RERANK_FACTOR * k candidates with full precision
+            candidates = top_k(scores, min(k * config.RERANK_FACTOR, len(scores)))
+            exact_scores = vectors[candidates] @ query
+            reranked.append(candidates[np.argsort(-exact_scores)[:k]])
+        seconds = (time.perf_counter() - start) / len(queries)
+        peak = scoring_peak(lambda: quantizer.score(codes, queries[0]))
+
+    print(
+        f"{name:>6}: {codes_bytes / 1024 ** 2:9.2f} MiB ({codes_bytes / len(vectors):7.1f} B/vector)   "
+        f"recall@{k} {recall_at_k(approx, exact):.3f}   "
+        f"with re-scoring {recall_at_k(reranked, exact):.3f}   "
+        f"{seconds * 1000:7.2f} ms/query   "
+        f"scoring peak {peak / 1024 ** 2:7.2f} MiB"
+    )
+
+def scoring_peak(score) -> int:
+    """Peak bytes NumPy allocates while scoring one query (temporaries plus the scores)"""
+    tracemalloc.start()
+    score()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="Number of random vectors (0 = use stored vectors)")
+    parser.add_argument("--dim", type=int, default=768, help="Synthetic vector size")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.synthetic:
+        vectors = rng.standard_normal((args.synthetic, args.dim)).astype(np.float32)
+    else:
+        vectors = load_stored_vectors(config.EMBEDDING_DIR)
+    if len(vectors) <= args.k:
+        print("Not enough vectors to benchmark")
+        return
+
+    vectors = numpy_index.normalize_rows(vectors)
+    picks = vectors[rng.integers(0, len(vectors), size=args.queries)]
+    queries = numpy_index.normalize_rows(picks + rng.standard_normal(picks.shape).astype(np.float32) * 0.05)
+    exact = np.array([top_k(vectors @ query, args.k) for query in queries])
+
+    print(f"{len(vectors)} vectors of dim {vectors.shape[1]}, {args.queries} queries, rerank factor {config.RERANK_FACTOR}")
+    evaluate("float32", vectors, queries, exact, args.k)
+    scalar_quantizer = ScalarQuantizer.fit(vectors)
+    evaluate("int8", vectors, queries, exact, args.k, scalar_quantizer)
+    codes = scalar_quantizer.encode(vectors)
+    unblocked = scoring_peak(lambda: codes @ (queries[0] * scalar_quantizer.scale))
+    print(f"        (int8 scoring the whole code matrix at once would peak at {unblocked / 1024 ** 2:.2f} MiB)")
+
+    start = time.perf_counter()
+    product_quantizer = ProductQuantizer.train(vectors[rng.permutation(len(vectors))[:config.PQ_TRAINING_SAMPLE]])
+    print(f"(PQ with {product_quantizer.m} sub-vectors trained in {time.perf_counter() - start:.1f}s)")
+    evaluate("pq", vectors, queries, exact, args.k, product_quantizer)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# backend/scripts/benchmark_vector_backends.py
+"""
+Compare top-k query latency and recall of the Chroma and NumPy vector backends.
+
+Run from the backend directory:
+    python -m scripts.benchmark_vector_backends
+    python -m scripts.benchmark_vector_backends --synthetic 200000 --docs 500
+"""
+import argparse
+import tempfile
+import time
+from typing import List, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from app.services import numpy_index
+
+def _random_unit_vectors(rng, count: int, dim: int) -> np.ndarray:
+    return numpy_index.normalize_rows(rng.standard_normal((count, dim)).astype(np.float32))
+
+def build_synthetic(rng, chunk_count: int, doc_count: int, dim: int, base_dir: str):
+    """Create an in-memory Chroma collection and NumPy indexes holding the same random chunks"""
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection("benchmark", metadata={"hnsw:space": "cosine"})
+    vectors = _random_unit_vectors(rng, chunk_count, dim)
+    owners = rng.integers(1, doc_count + 1, size=chunk_count)
+
+    batch = 5000
+    for start in range(0, chunk_count, batch):
+        end = min(start + batch, chunk_count)
+        collection.add(
+            ids=[f"chunk-{i}" for i in range(start, end)],
+            embeddings=vectors[start:end].tolist(),
+            metadatas=[
+                {"doc_id": int(owners[i]), "page": 1, "paragraph": 1, "chunk_id": f"chunk-{i}", "content_hash": str(i)}
+                for i in range(start, end)
+            ],
+            documents=[f"chunk {i}" for i in range(start, end)]
+        )
+
+    doc_ids = list(range(1, doc_count + 1))
+    for doc_id in doc_ids:
+        rows = np.flatnonzero(owners == doc_id)
+        docs = [
+            Document(page_content=f"chunk {i}", metadata={"page": 1, "paragraph": 1, "chunk_id": f"chunk-{i}", "content_hash": str(i)})
+            for i in rows
+        ]
+        numpy_index.write_document_index(doc_id, docs, vectors[rows], "synthetic", base_dir)
+
+    return collection, doc_ids, vectors
+
+def load_shared_index(base_dir: str):
+    """Export the documents in the shared Chroma collection to NumPy indexes in base_dir"""
+    from app.core.database import get_all_documents
+    from app.services.embedding_service import get_shared_vector_store, get_embedding_model_name
+
+    collection = get_shared_vector_store()._collection
+    doc_ids = [doc["id"] for doc in get_all_documents() if doc["is_processed"]]
+    numpy_index.export_from_chroma(collection, doc_ids, get_embedding_model_name(), base_dir)
+
+    stored = collection.get(include=["embeddings"])["embeddings"]
+    return collection, doc_ids, np.array(stored, dtype=np.float32)
+
+def _time_queries(search, queries: np.ndarray) -> Tuple[List[List[str]], List[float]]:
+    ids, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ids.append(search(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return ids, latencies
+
+def _report(name: str, latencies: List[float]):
+    print(
+        f"{name:>8}: mean {np.mean(latencies):8.2f} ms   "
+        f"p50 {np.percentile(latencies, 50):8.2f} ms   p95 {np.percentile(latencies, 95):8.2f} ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="Number of random chunks (0 = use the shared index)")
+    parser.add_argument("--docs", type=int, default=100, help="Number of synthetic documents")
+    parser.add_argument("--dim", type=int, default=768, help="Synthetic vector size")
+    parser.add_argument("--queries", type=int, default=100, help="Number of queries")
+    parser.add_argument("--k", type=int, default=20, help="Results per query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as base_dir:
+        if args.synthetic:
+            collection, doc_ids, vectors = build_synthetic(rng, args.synthetic, args.docs, args.dim, base_dir)
+        else:
+            collection, doc_ids, vectors = load_shared_index(base_dir)
+        if not len(vectors):
+            print("No vectors to benchmark")
+            return
+
+        # Queries near stored chunks, like real questions about the corpus
+        picks = vectors[rng.integers(0, len(vectors), size=args.queries)]
+        noise = rng.standard_normal(picks.shape).astype(np.float32) * 0.05
+        queries = numpy_index.normalize_rows(picks + noise)
+
+        where = {"doc_id": {"$in": doc_ids}} if len(doc_ids) > 1 else {"doc_id": doc_ids[0]}
+
+        def search_chroma(query):
+            result = collection.query(query_embeddings=[query.tolist()], n_results=args.k, where=where)
+            return result["ids"][0]
+
+        def search_numpy(query):
+            results = numpy_index.search_chunks(query.tolist(), doc_ids, args.k, base_dir)
+            return [chunk.metadata["chunk_id"] for chunk, _ in results]
+
+        # Warm up caches and page in the memory maps before timing
+        search_chroma(queries[0])
+        search_numpy(queries[0])
+
+        chroma_ids, chroma_latencies = _time_queries(search_chroma, queries)
+        numpy_ids, numpy_latencies = _time_queries(search_numpy, queries)
+
+        print(f"{len(vectors)} chunks in {len(doc_ids)} documents, {args.queries} queries, k={args.k}")
+        _report("chroma", chroma_latencies)
+        _report("numpy", numpy_latencies)
+
+        # NumPy search is exact, so this is the recall of the HNSW index
+        recall = np.mean([
+            len(set(approx) & set(exact)) / max(len(exact), 1)
+            for approx, exact in zip(chroma_ids, numpy_ids)
+        ])
+        print(f"chroma recall@{args.k} vs exact: {recall:.3f}")
+
+if __name__ == "__main__":
+    main()
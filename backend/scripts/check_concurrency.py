@@ -0,0 +1,91 @@
+# backend/scripts/check_concurrency.py
+"""
+Check that concurrent /query requests overlap and that /status stays
+responsive while they run.
+
+Run from the backend directory, against a running server:
+    python -m scripts.check_concurrency --url http://localhost:8000/api/v1 --question "What are the key findings?"
+
+or in-process, with each query replaced by a blocking sleep of the given length
+(no API key or documents needed):
+    python -m scripts.check_concurrency --simulate 1.0
+
+Exits with status 1 if the queries ran one after another.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+
+async def _timed(client: httpx.AsyncClient, method: str, path: str, **kwargs) -> float:
+    start = time.perf_counter()
+    response = await client.request(method, path, **kwargs)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+async def _poll_status(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        latencies.append(await _timed(client, "GET", "/status"))
+        await asyncio.sleep(0.05)
+
+async def run(client: httpx.AsyncClient, question: str, queries: int) -> bool:
+    # One query alone first, as the baseline
+    single = await _timed(client, "POST", "/query", json={"question": question})
+
+    stop = asyncio.Event()
+    status_latencies = []
+    poller = asyncio.create_task(_poll_status(client, stop, status_latencies))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _timed(client, "POST", "/query", json={"question": question})
+        for _ in range(queries)
+    ])
+    total = time.perf_counter() - start
+
+    stop.set()
+    await poller
+
+    print(f"single query:        {single:7.2f}s")
+    print(f"{queries} concurrent queries: {total:7.2f}s ({queries * single:.2f}s if run one after another)")
+    if status_latencies:
+        print(f"/status during queries: max {max(status_latencies) * 1000:.0f} ms over {len(status_latencies)} calls")
+
+    # Overlapping requests finish well before the serial total
+    return total < 0.6 * queries * single
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000/api/v1", help="API base URL")
+    parser.add_argument("--question", default="What are the key themes across these documents?")
+    parser.add_argument("--queries", type=int, default=4, help="Number of concurrent queries")
+    parser.add_argument("--simulate", type=float, default=0.0, help="Run in-process with queries taking this many seconds")
+    args = parser.parse_args()
+
+    if args.simulate:
+        from fastapi import FastAPI
+        from app.api import routes
+
+        def slow_query(question, doc_ids=None, **kwargs):
+            time.sleep(args.simulate)
+            return {"document_responses": {}, "themes": []}
+
+        routes.process_user_query = slow_query
+        app = FastAPI()
+        app.include_router(routes.router)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=None)
+    else:
+        client = httpx.AsyncClient(base_url=args.url, timeout=None)
+
+    async def check():
+        async with client:
+            return await run(client, args.question, args.queries)
+
+    overlapped = asyncio.run(check())
+    print("requests overlapped" if overlapped else "requests did NOT overlap")
+    sys.exit(0 if overlapped else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# backend/scripts/check_job_recovery.py
+"""
+Check that a document whose worker keeps dying is not claimed forever: each
+attempt is claimed by a worker process that exits without finishing the job,
+and once the job has used up JOB_MAX_ATTEMPTS it must fail, with the error on
+the document, instead of being queued again.
+
+Runs on a temporary database (no server, API key or documents needed):
+    python -m scripts.check_job_recovery
+
+Exits with status 1 if the job was queued again after its last attempt.
+"""
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+
+def _claim_and_die():
+    """Worker process: claim the next job, then exit as if it was OOM-killed"""
+    from app.core.database import claim_next_job
+
+    claim_next_job("check-worker")
+    os._exit(9)
+
+def main():
+    # The database module creates its tables on import, so point it (and the
+    # worker processes, which inherit the environment) at a scratch file first
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'check_jobs.db')}"
+
+    from app.core import config
+    from app.core.database import (
+        save_document,
+        get_document,
+        get_job,
+        enqueue_job,
+        claim_next_job,
+        requeue_stale_jobs
+    )
+
+    doc_id = save_document("crash.pdf", "crash.pdf", "/nonexistent/crash.pdf", ".pdf", 1)
+    job_id = enqueue_job(doc_id, 0, config.JOB_MAX_ATTEMPTS)
+
+    context = multiprocessing.get_context("spawn")
+    for attempt in range(1, config.JOB_MAX_ATTEMPTS + 2):
+        worker = context.Process(target=_claim_and_die)
+        worker.start()
+        worker.join()
+        # The dead worker sends no more heartbeats, so its job is stale right away
+        requeue_stale_jobs(time.time() + 1)
+        job = get_job(job_id)
+        print(f"worker {attempt} died (exit code {worker.exitcode}): job {job['status']}, attempts {job['attempts']}/{job['max_attempts']}")
+
+    document = get_document(doc_id)
+    failed = job["status"] == "failed" and job["attempts"] == job["max_attempts"]
+    recorded = bool(document["processing_error"])
+    unclaimable = claim_next_job("check-main") is None
+    print(f"document error: {document['processing_error']!r}")
+
+    ok = failed and recorded and unclaimable
+    print("job failed after its last attempt" if ok else "job was NOT failed after its last attempt")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
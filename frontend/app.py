@@ -34,11 +34,15 @@ def main():
         st.session_state.active_tab = "Research"
         col1, col2 = st.columns([1, 2])
         
+        # Results are streamed into this placeholder while a query runs
+        with col2:
+            results_placeholder = st.empty()
+        
         with col1:
-            query_interface = QueryInterface()
+            query_interface = QueryInterface(results_placeholder)
             query_interface.render()
         
-        with col2:
+        with results_placeholder.container():
             if st.session_state.query_results:
                 results_display = ResultsDisplay(st.session_state.query_results)
                 results_display.render()
@@ -36,13 +36,34 @@ class DocumentManager:
         """Upload a document through the API"""
         try:
             response = self.api_client.upload_document(uploaded_file)
-            st.success(f"Document '{uploaded_file.name}' uploaded successfully! Processing...")
+            if response.get("duplicate"):
+                st.info(f"Document '{uploaded_file.name}' was uploaded before (document {response['id']})")
+            else:
+                st.success(f"Document '{uploaded_file.name}' uploaded successfully! Processing...")
             st.session_state.doc_upload_success = True
             return response
         except Exception as e:
             st.error(f"Error uploading document: {str(e)}")
             return None
     
+    def _upload_documents(self, uploaded_files):
+        """Upload several documents (or ZIP archives) in one request"""
+        try:
+            response = self.api_client.upload_documents(uploaded_files)
+            summary = response.get("summary", {})
+            st.success(
+                f"{summary.get('queued', 0)} documents queued for processing, "
+                f"{summary.get('duplicate', 0)} already uploaded"
+            )
+            for result in response.get("results", []):
+                if result["status"] == "error":
+                    st.error(f"{result['filename']}: {result['detail']}")
+            st.session_state.doc_upload_success = True
+            return response
+        except Exception as e:
+            st.error(f"Error uploading documents: {str(e)}")
+            return None
+    
     def _reprocess_document(self, doc_id):
         """Reprocess a document through API"""
         try:
@@ -59,15 +80,19 @@ class DocumentManager:
         
         # Upload section
         st.subheader("Upload Documents")
-        uploaded_file = st.file_uploader(
+        uploaded_files = st.file_uploader(
             "Upload PDF documents", 
-            type=["pdf"],
-            help="Upload PDF documents to analyze"
+            type=["pdf", "zip"],
+            accept_multiple_files=True,
+            help="Upload PDF documents (or ZIP archives of PDFs) to analyze"
         )
         
-        if uploaded_file is not None:
+        if uploaded_files:
             if st.button("Upload & Process", type="primary"):
-                self._upload_document(uploaded_file)
+                if len(uploaded_files) == 1 and uploaded_files[0].name.lower().endswith(".pdf"):
+                    self._upload_document(uploaded_files[0])
+                else:
+                    self._upload_documents(uploaded_files)
         
         # Document list section
         st.subheader("Your Documents")
@@ -1,9 +1,12 @@
 import streamlit as st
 from utils.api_client import APIClient
+from components.results_display import ResultsDisplay
 
 class QueryInterface:
-    def __init__(self):
+    def __init__(self, results_placeholder=None):
         self.api_client = APIClient()
+        # Where results are streamed while the query runs
+        self.results_placeholder = results_placeholder
     
     def _load_documents(self):
         """Load documents for selection"""
@@ -27,8 +30,12 @@ class QueryInterface:
             return None
         
         try:
-            results = self.api_client.query_documents(question, selected_doc_ids)
-            return results
+            if self.results_placeholder is None:
+                return self.api_client.query_documents(question, selected_doc_ids)
+            
+            events = self.api_client.stream_query(question, selected_doc_ids)
+            with self.results_placeholder.container():
+                return ResultsDisplay().render_stream(events)
         except Exception as e:
             st.error(f"Error processing query: {str(e)}")
             return None
@@ -67,11 +74,10 @@ class QueryInterface:
         
         # Submit button
         if st.button("Research", type="primary"):
-            with st.spinner("Analyzing documents..."):
-                results = self._handle_query(question, selected_docs)
-                if results:
-                    st.session_state.query_results = results
-                    st.success("Analysis complete!")
+            results = self._handle_query(question, selected_docs)
+            if results:
+                st.session_state.query_results = results
+                st.success("Analysis complete!")
                     
         # Example questions
         with st.expander("Example Questions"):
@@ -85,8 +91,7 @@ class QueryInterface:
             
             for ex in examples:
                 if st.button(ex, key=f"ex_{ex}"):
-                    with st.spinner("Analyzing documents..."):
-                        results = self._handle_query(ex, selected_docs)
-                        if results:
-                            st.session_state.query_results = results
-                            st.success("Analysis complete!")
\ No newline at end of file
+                    results = self._handle_query(ex, selected_docs)
+                    if results:
+                        st.session_state.query_results = results
+                        st.success("Analysis complete!")
\ No newline at end of file
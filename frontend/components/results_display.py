@@ -1,8 +1,8 @@
 import streamlit as st
 
 class ResultsDisplay:
-    def __init__(self, results):
-        self.results = results
+    def __init__(self, results=None):
+        self.results = results if results is not None else {"document_responses": {}, "themes": []}
         
     def _display_themes(self, themes):
         """Display identified themes"""
@@ -33,19 +33,79 @@ class ResultsDisplay:
         st.subheader("📄 Document Analysis")
         
         for doc_id, response_data in doc_responses.items():
-            with st.expander(f"Document: {doc_id}"):
-                st.markdown(response_data.get('response', 'No response available'))
+            self._display_document_response(doc_id, response_data)
+    
+    def _display_document_response(self, doc_id, response_data):
+        """Display the response for one document"""
+        with st.expander(f"Document: {doc_id}", expanded=True):
+            st.markdown(response_data.get('response', 'No response available'))
+            
+            citations = response_data.get('citations', [])
+            if citations:
+                st.write("**Citations:**")
+                citation_text = []
+                for citation in citations:
+                    page = citation.get('page', 'N/A')
+                    para = citation.get('paragraph', 'N/A')
+                    citation_text.append(f"Page {page}, Paragraph {para}")
                 
-                citations = response_data.get('citations', [])
-                if citations:
-                    st.write("**Citations:**")
-                    citation_text = []
-                    for citation in citations:
-                        page = citation.get('page', 'N/A')
-                        para = citation.get('paragraph', 'N/A')
-                        citation_text.append(f"Page {page}, Paragraph {para}")
-                    
-                    st.write(", ".join(citation_text))
+                st.write(", ".join(citation_text))
+    
+    def render_stream(self, events):
+        """
+        Render results incrementally from (event, data) tuples as returned by
+        APIClient.stream_query, and return the final results
+        """
+        st.header("Research Results")
+        
+        themes_placeholder = st.empty()
+        themes_placeholder.info("Identifying themes once all documents are answered...")
+        
+        st.subheader("📄 Document Analysis")
+        status_placeholder = st.empty()
+        status_placeholder.info("Retrieving relevant passages...")
+        
+        doc_placeholders = {}
+        partial_responses = {}
+        
+        for event, data in events:
+            if event == "retrieval":
+                documents = data.get("documents", {})
+                if not documents:
+                    status_placeholder.info("No document responses available")
+                else:
+                    status_placeholder.empty()
+                for doc_id in documents:
+                    doc_placeholders[doc_id] = st.empty()
+                    doc_placeholders[doc_id].caption(f"⏳ {doc_id}: waiting for answer...")
+            
+            elif event == "token":
+                doc_id = data["document"]
+                # Ignore late tokens for documents that already have a full answer
+                if doc_id in self.results["document_responses"] or doc_id not in doc_placeholders:
+                    continue
+                partial_responses[doc_id] = partial_responses.get(doc_id, "") + data["text"]
+                doc_placeholders[doc_id].markdown(f"**{doc_id}**\n\n{partial_responses[doc_id]}▌")
+            
+            elif event == "answer":
+                doc_id = data.pop("document")
+                self.results["document_responses"][doc_id] = data
+                if doc_id not in doc_placeholders:
+                    doc_placeholders[doc_id] = st.empty()
+                with doc_placeholders[doc_id].container():
+                    self._display_document_response(doc_id, data)
+            
+            elif event == "themes":
+                self.results["themes"] = data.get("themes", [])
+                with themes_placeholder.container():
+                    self._display_themes(self.results["themes"])
+        
+        # Keep the order documents were retrieved in
+        self.results["document_responses"] = {
+            doc_id: self.results["document_responses"][doc_id]
+            for doc_id in doc_placeholders if doc_id in self.results["document_responses"]
+        }
+        return self.results
     
     def render(self):
         """Render the results display component"""
@@ -1,7 +1,7 @@
 import requests
 import os
 import json
-from typing import List, Dict, Optional, Any, Union
+from typing import List, Dict, Optional, Any, Union, Iterator, Tuple
 
 # Default API URL - can be overridden with environment variable
 API_URL = os.getenv("API_URL", "http://localhost:8000/api/v1")
@@ -50,6 +50,13 @@ class APIClient:
         response = requests.post(url, files=files)
         return self._handle_response(response)
     
+    def upload_documents(self, files) -> Dict:
+        """Upload several PDFs and/or ZIP archives of PDFs, returning per-file results"""
+        url = f"{self.base_url}/documents/upload/bulk"
+        payload = [("files", (file.name, file, "application/octet-stream")) for file in files]
+        response = requests.post(url, files=payload)
+        return self._handle_response(response)
+    
     def query_documents(self, question: str, document_ids: Optional[List[int]] = None) -> Dict:
         """Query documents with a question"""
         url = f"{self.base_url}/query"
@@ -60,6 +67,45 @@ class APIClient:
         response = requests.post(url, json=payload)
         return self._handle_response(response)
     
+    def stream_query(
+        self,
+        question: str,
+        document_ids: Optional[List[int]] = None,
+        stream_tokens: bool = True
+    ) -> Iterator[Tuple[str, Dict]]:
+        """Query documents with a question, yielding (event, data) server-sent events as they arrive"""
+        url = f"{self.base_url}/query/stream"
+        payload = {"question": question, "stream_tokens": stream_tokens}
+        if document_ids:
+            payload["document_ids"] = document_ids
+        
+        response = requests.post(url, json=payload, stream=True)
+        if response.status_code != 200:
+            self._handle_response(response)
+        
+        with response:
+            event = "message"
+            data_lines = []
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    field, _, value = line.partition(":")
+                    if field == "event":
+                        event = value.strip()
+                    elif field == "data":
+                        data_lines.append(value[1:] if value.startswith(" ") else value)
+                    continue
+                
+                # A blank line ends the event
+                if data_lines:
+                    data = json.loads("\n".join(data_lines))
+                    if event == "error":
+                        raise Exception(f"API Error: {data.get('detail', 'Unknown error')}")
+                    if event == "done":
+                        return
+                    yield event, data
+                event = "message"
+                data_lines = []
+    
     def reprocess_document(self, doc_id: int) -> Dict:
         """Reprocess a document"""
         url = f"{self.base_url}/documents/{doc_id}/process"